@@ -0,0 +1,91 @@
+# core/background.py
+"""
+Despacho de tareas en segundo plano, después del commit de la transacción.
+
+Backends (settings.BACKGROUND_TASK_BACKEND):
+  - 'thread': pool de hilos local al proceso (no requiere broker; por defecto)
+  - 'celery': task.delay(*args) (la función debe ser un @shared_task)
+  - 'sync':   se ejecuta en línea al hacer commit (útil en tests)
+
+Las tareas con la misma key se coalescen en este proceso: si ya está en cola
+no se vuelve a encolar, y si está corriendo se ejecuta una sola vez más al
+terminar. La deduplicación entre procesos queda a cargo de la tarea.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_queued = set()
+_running = set()
+_rerun = set()
+_executor = None
+_executor_pid = None
+
+
+def _get_executor():
+    """Pool perezoso; se recrea si el proceso fue forkeado (p. ej. gunicorn --preload)."""
+    global _executor, _executor_pid
+    with _lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'BACKGROUND_TASK_WORKERS', 2),
+                thread_name_prefix='background-task',
+            )
+            _executor_pid = os.getpid()
+            _queued.clear()
+            _running.clear()
+            _rerun.clear()
+        return _executor
+
+
+def _run(key, func, args):
+    with _lock:
+        _queued.discard(key)
+        _running.add(key)
+    close_old_connections()
+    try:
+        func(*args)
+    except Exception:
+        logger.exception("Tarea en segundo plano %s falló", key)
+    finally:
+        with _lock:
+            _running.discard(key)
+            rerun = key in _rerun and key not in _queued
+            _rerun.discard(key)
+            if rerun:
+                _queued.add(key)
+        close_old_connections()
+    if rerun:
+        _get_executor().submit(_run, key, func, args)
+
+
+def _submit(key, func, args):
+    backend = getattr(settings, 'BACKGROUND_TASK_BACKEND', 'thread')
+    if backend == 'celery':
+        func.delay(*args)
+        return
+    if backend == 'sync':
+        func(*args)
+        return
+
+    executor = _get_executor()
+    with _lock:
+        if key in _queued:
+            return
+        if key in _running:
+            _rerun.add(key)
+            return
+        _queued.add(key)
+    executor.submit(_run, key, func, args)
+
+
+def dispatch(key, func, *args):
+    """Programa func(*args) para después del commit actual (o de inmediato si no hay transacción)."""
+    transaction.on_commit(lambda: _submit(key, func, args))
@@ -0,0 +1,99 @@
+# core/pagination.py
+"""
+Paginación keyset (por cursor) opcional para los listados.
+
+Solo se activa si el cliente envía ?page_size= o ?cursor=; sin ellos la
+respuesta sigue siendo la lista plana de siempre (la app móvil la espera así).
+Paginada, la respuesta es {"next": <url|null>, "results": [...]}.
+
+El orden lo define la vista con `keyset_ordering`, p. ej.
+('-scanned_at', '-result_id'): un campo de orden y un desempate único. El
+cursor guarda los valores de la última fila, así que cada página es un
+WHERE (campo, pk) < (valor, id) sobre el índice, sin OFFSET.
+"""
+import base64
+import json
+
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = DEFAULT_PAGE_SIZE
+    max_page_size = MAX_PAGE_SIZE
+
+    def _ordering(self, view):
+        ordering = tuple(getattr(view, 'keyset_ordering', None) or ('-pk',))
+        field = ordering[0]
+        tiebreak = ordering[1] if len(ordering) > 1 else 'pk'
+        return field.lstrip('-'), tiebreak.lstrip('-'), field.startswith('-')
+
+    def _page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            size = self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def _decode(self, queryset, field, tiebreak, raw):
+        try:
+            value, key = json.loads(base64.urlsafe_b64decode(raw.encode('ascii')).decode('utf-8'))
+            opts = queryset.model._meta
+            value = None if value is None else opts.get_field(field).to_python(value)
+            key = (opts.pk if tiebreak == 'pk' else opts.get_field(tiebreak)).to_python(key)
+        except Exception:
+            raise NotFound("Cursor inválido")
+        return value, key
+
+    def _encode(self, row, field, tiebreak):
+        def get(name):
+            return row[name] if isinstance(row, dict) else getattr(row, name)
+        value = get(field)
+        raw = json.dumps([value.isoformat() if hasattr(value, 'isoformat') else value, str(get(tiebreak))])
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+
+        field, tiebreak, descending = self._ordering(view)
+        order = F(field).desc(nulls_last=True) if descending else F(field).asc(nulls_last=True)
+        queryset = queryset.order_by(order, f"-{tiebreak}" if descending else tiebreak)
+
+        raw = params.get(self.cursor_query_param)
+        if raw:
+            value, key = self._decode(queryset, field, tiebreak, raw)
+            after = f"{tiebreak}__lt" if descending else f"{tiebreak}__gt"
+            if value is None:
+                # Filas con el campo nulo van al final: se sigue solo por el desempate
+                queryset = queryset.filter(**{f"{field}__isnull": True, after: key})
+            else:
+                beyond = f"{field}__lt" if descending else f"{field}__gt"
+                queryset = queryset.filter(
+                    Q(**{beyond: value}) | Q(**{field: value, after: key}) | Q(**{f"{field}__isnull": True})
+                )
+
+        size = self._page_size(request)
+        page = list(queryset[:size + 1])
+        self.next_cursor = self._encode(page[size - 1], field, tiebreak) if len(page) > size else None
+        self.request = request
+        return page[:size]
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
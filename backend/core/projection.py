@@ -0,0 +1,54 @@
+# core/projection.py
+"""
+Proyección de campos en serializers: ?fields=a,b y ?expand=x,y.
+
+  - fields=  solo esos campos de primer nivel
+  - expand=  campos anidados (expandable_fields) a incluir
+
+Si llega fields= o expand=, los anidados que no se pidan explícitamente se
+omiten (p. ej. ?expand= devuelve la sesión sin scan_results). Sin ninguno de
+los dos la respuesta no cambia.
+"""
+
+
+def _split(value):
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def requested_fields(query_params, names, expandable=()):
+    """Conjunto de campos a serializar, o None si no hay proyección."""
+    if query_params is None or ('fields' not in query_params and 'expand' not in query_params):
+        return None
+    names = set(names)
+    nested = set(expandable)
+    expand = _split(query_params.get('expand', '')) & nested
+    if 'fields' in query_params:
+        return (_split(query_params['fields']) & names) | expand
+    return (names - nested) | expand
+
+
+class FieldProjectionMixin:
+    """
+    Aplica ?fields=/?expand= al serializer raíz (o al hijo de un many=True).
+    Los query params se toman de context['request'] o de context['query_params'].
+    """
+    expandable_fields = ()
+
+    @classmethod
+    def wants(cls, query_params, name):
+        """True si `name` se va a serializar (para decidir prefetches)."""
+        keep = requested_fields(query_params, cls.Meta.fields, cls.expandable_fields)
+        return keep is None or name in keep
+
+    def _query_params(self):
+        request = self.context.get('request')
+        return request.query_params if request is not None else self.context.get('query_params')
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.root is not self and self.root is not self.parent:
+            return fields  # serializer anidado: la proyección es solo de primer nivel
+        keep = requested_fields(self._query_params(), fields, self.expandable_fields)
+        if keep is None:
+            return fields
+        return {name: field for name, field in fields.items() if name in keep}
@@ -0,0 +1,170 @@
+# cropcareBackend/object_storage.py
+"""
+Acceso único al bucket de objetos (fotos de escaneo, variantes, blobs).
+
+get_client() devuelve un cliente S3 compartido que se crea recién en el
+primer uso (importar vistas o comandos no abre conexiones) y se recrea si el
+proceso fue forkeado (gunicorn --preload, Celery prefork). El pool de
+conexiones se dimensiona según los hilos que lo usan (subidas por lote +
+tareas en segundo plano) y tiene reintentos y timeouts acotados.
+
+Backends (settings.OBJECT_STORAGE_BACKEND):
+  - 's3':    boto3 (AWS, o MinIO/moto con AWS_S3_ENDPOINT_URL); por defecto
+  - 'local': carpeta OBJECT_STORAGE_LOCAL_ROOT con la misma interfaz, para
+             tests y desarrollo sin credenciales
+
+El storage de media (ScannerImage y demás FileField) sigue el mismo backend
+(settings.STORAGES): MediaStorage de django-storages con la misma
+configuración de cliente vía client_config(), o una carpeta media/ dentro del
+bucket local. Con 'local' y DEBUG, urls.py sirve OBJECT_STORAGE_LOCAL_ROOT en
+OBJECT_STORAGE_LOCAL_URL, que es adonde apunta public_url().
+"""
+import io
+import os
+import shutil
+import threading
+
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from django.conf import settings
+
+
+_lock = threading.Lock()
+_client = None
+_client_pid = None
+
+
+def client_config():
+    """Pool, reintentos y timeouts comunes a todo acceso a S3."""
+    workers = (
+        getattr(settings, 'SCANNER_UPLOAD_WORKERS', 8)
+        + getattr(settings, 'BACKGROUND_TASK_WORKERS', 2)
+    )
+    return Config(
+        signature_version=getattr(settings, 'AWS_S3_SIGNATURE_VERSION', 's3v4'),
+        max_pool_connections=max(10, workers),
+        connect_timeout=getattr(settings, 'AWS_S3_CONNECT_TIMEOUT', 5),
+        read_timeout=getattr(settings, 'AWS_S3_READ_TIMEOUT', 30),
+        retries={'mode': 'standard', 'max_attempts': getattr(settings, 'AWS_S3_MAX_ATTEMPTS', 5)},
+    )
+
+
+def _build_client():
+    if getattr(settings, 'OBJECT_STORAGE_BACKEND', 's3') == 'local':
+        return LocalObjectClient(getattr(settings, 'OBJECT_STORAGE_LOCAL_ROOT', settings.BASE_DIR / '.objects'))
+
+    import boto3
+
+    # Sesión propia: la sesión por defecto de boto3 no es segura entre hilos
+    session = boto3.session.Session()
+    return session.client(
+        's3',
+        region_name=getattr(settings, 'AWS_S3_REGION_NAME', None),
+        aws_access_key_id=getattr(settings, 'AWS_ACCESS_KEY_ID', None),
+        aws_secret_access_key=getattr(settings, 'AWS_SECRET_ACCESS_KEY', None),
+        endpoint_url=getattr(settings, 'AWS_S3_ENDPOINT_URL', None),  # MinIO / moto en local
+        config=client_config(),
+    )
+
+
+def get_client():
+    """Cliente compartido del proceso (los clientes de boto3 son seguros entre hilos)."""
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _lock:
+            if _client is None or _client_pid != os.getpid():
+                _client = _build_client()
+                _client_pid = os.getpid()
+    return _client
+
+
+def reset_client():
+    """Descarta el cliente (p. ej. tras cambiar settings en tests)."""
+    global _client, _client_pid
+    with _lock:
+        _client = None
+        _client_pid = None
+
+
+def public_url(key):
+    """URL pública de un objeto public-read del bucket."""
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    if getattr(settings, 'OBJECT_STORAGE_BACKEND', 's3') == 'local':
+        return f"{getattr(settings, 'OBJECT_STORAGE_LOCAL_URL', '/objects/')}{bucket}/{key}"
+    endpoint = getattr(settings, 'AWS_S3_ENDPOINT_URL', None)
+    if endpoint:
+        return f"{endpoint.rstrip('/')}/{bucket}/{key}"
+    domain = getattr(settings, 'AWS_S3_CUSTOM_DOMAIN', f"{bucket}.s3.amazonaws.com")
+    return f"https://{domain}/{key}"
+
+
+# ------------------- BACKEND LOCAL -------------------
+def _not_found(operation):
+    return ClientError({'Error': {'Code': '404', 'Message': 'Not Found'}}, operation)
+
+
+class LocalObjectClient:
+    """
+    Subconjunto del cliente S3 que usa la app, sobre el sistema de archivos.
+    Los objetos quedan en {root}/{bucket}/{key}; ACL y ContentType se ignoran.
+    """
+
+    def __init__(self, root):
+        self.root = str(root)
+
+    def _path(self, bucket, key):
+        path = os.path.normpath(os.path.join(self.root, bucket, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f"Key fuera del almacenamiento: {key}")
+        return path
+
+    def upload_fileobj(self, fileobj, bucket, key, ExtraArgs=None, Config=None):
+        path = self._path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as out:
+            shutil.copyfileobj(fileobj, out)
+        os.replace(tmp, path)
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.upload_fileobj(io.BytesIO(Body) if isinstance(Body, bytes) else Body, Bucket, Key)
+        return {}
+
+    def get_object(self, Bucket, Key, Range=None, **kwargs):
+        try:
+            body = open(self._path(Bucket, Key), 'rb')
+        except FileNotFoundError:
+            raise _not_found('GetObject')
+        if not Range:
+            return {'Body': body}
+        # Solo 'bytes=inicio-fin' (inclusivo), que es lo que pide la app
+        start, end = (int(n) for n in Range.removeprefix('bytes=').split('-'))
+        body.seek(start)
+        data = body.read(end - start + 1)
+        body.close()
+        return {'Body': io.BytesIO(data), 'ContentLength': len(data)}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        try:
+            return {'ContentLength': os.path.getsize(self._path(Bucket, Key))}
+        except FileNotFoundError:
+            raise _not_found('HeadObject')
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        try:
+            os.remove(self._path(Bucket, Key))
+        except FileNotFoundError:
+            pass
+        return {}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        for obj in Delete['Objects']:
+            self.delete_object(Bucket, obj['Key'])
+        return {}
+
+    def generate_presigned_post(self, Bucket, Key, Fields=None, Conditions=None, ExpiresIn=3600):
+        # Sin servidor que reciba la subida: útil solo para probar el flujo (el test escribe la key)
+        return {'url': f"file://{os.path.join(self.root, Bucket)}", 'fields': {**(Fields or {}), 'key': Key}}
+
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600, **kwargs):
+        return f"file://{self._path(Params['Bucket'], Params['Key'])}"
@@ -124,6 +124,15 @@ AWS_ACCESS_KEY_ID = env("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = env("AWS_SECRET_ACCESS_KEY")
 AWS_STORAGE_BUCKET_NAME = env("AWS_STORAGE_BUCKET_NAME")
 AWS_S3_REGION_NAME = env("AWS_REGION", default="us-east-1")
+# S3 compatible local (MinIO, moto_server); vacío = AWS
+AWS_S3_ENDPOINT_URL = env("AWS_S3_ENDPOINT_URL", default=None)
+# Cliente compartido (cropcareBackend/object_storage.py): reintentos y timeouts en segundos
+AWS_S3_MAX_ATTEMPTS = env.int("AWS_S3_MAX_ATTEMPTS", default=5)
+AWS_S3_CONNECT_TIMEOUT = env.int("AWS_S3_CONNECT_TIMEOUT", default=5)
+AWS_S3_READ_TIMEOUT = env.int("AWS_S3_READ_TIMEOUT", default=30)
+# 's3' o 'local' (carpeta OBJECT_STORAGE_LOCAL_ROOT, para tests y desarrollo)
+OBJECT_STORAGE_BACKEND = env("OBJECT_STORAGE_BACKEND", default="s3")
+OBJECT_STORAGE_LOCAL_ROOT = env("OBJECT_STORAGE_LOCAL_ROOT", default=str(BASE_DIR / ".objects"))
 
 AWS_S3_CUSTOM_DOMAIN = f"{AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com"
 
@@ -135,11 +144,83 @@ AWS_QUERYSTRING_AUTH = False
 STATIC_URL = f"https://{AWS_S3_CUSTOM_DOMAIN}/static/"
 MEDIA_URL = f"https://{AWS_S3_CUSTOM_DOMAIN}/media/"
 
-STATICFILES_STORAGE = "cropcareBackend.storage_backends.StaticStorage"
-DEFAULT_FILE_STORAGE = "cropcareBackend.storage_backends.MediaStorage"
+# Con el backend local los objetos (y media/) se sirven desde OBJECT_STORAGE_LOCAL_URL (solo con DEBUG)
+OBJECT_STORAGE_LOCAL_URL = env("OBJECT_STORAGE_LOCAL_URL", default="/objects/")
+
+if OBJECT_STORAGE_BACKEND == "local":
+    STATIC_URL = "/static/"
+    STORAGES = {
+        "default": {
+            "BACKEND": "django.core.files.storage.FileSystemStorage",
+            "OPTIONS": {
+                "location": os.path.join(OBJECT_STORAGE_LOCAL_ROOT, AWS_STORAGE_BUCKET_NAME, "media"),
+                "base_url": f"{OBJECT_STORAGE_LOCAL_URL}{AWS_STORAGE_BUCKET_NAME}/media/",
+            },
+        },
+        "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    }
+else:
+    STORAGES = {
+        "default": {"BACKEND": "cropcareBackend.storage_backends.MediaStorage"},
+        "staticfiles": {"BACKEND": "cropcareBackend.storage_backends.StaticStorage"},
+    }
 
 # Carpeta para scanner en S3
 SCANNER_PHOTOS_DIR = "scanner_photos/"
+# Subida directa con URL prefirmada (scanners/uploads.py)
+SCANNER_UPLOAD_URL_EXPIRES = env.int("SCANNER_UPLOAD_URL_EXPIRES", default=300)
+SCANNER_UPLOAD_MAX_BYTES = env.int("SCANNER_UPLOAD_MAX_BYTES", default=5 * 1024 * 1024)
+# Lote de fotos (results/upload-images/): subidas en paralelo y máximo por petición
+SCANNER_UPLOAD_WORKERS = env.int("SCANNER_UPLOAD_WORKERS", default=8)
+SCANNER_UPLOAD_MAX_FILES = env.int("SCANNER_UPLOAD_MAX_FILES", default=500)
+# Variantes de las fotos (scanners/imaging.py): lado máximo, miniatura y entrada del modelo
+SCANNER_PHOTO_MAX_SIDE = env.int("SCANNER_PHOTO_MAX_SIDE", default=2048)
+SCANNER_THUMB_SIDE = env.int("SCANNER_THUMB_SIDE", default=256)
+SCANNER_MODEL_INPUT_SIDE = env.int("SCANNER_MODEL_INPUT_SIDE", default=224)
+# Inferencia en el servidor (scanners/inference.py; requiere numpy y tflite-runtime)
+SCANNER_SERVER_INFERENCE = env.bool("SCANNER_SERVER_INFERENCE", default=False)
+SCANNER_MODELS_DIR = env("SCANNER_MODELS_DIR", default=str(BASE_DIR / "ml_models"))
+SCANNER_INFERENCE_BATCH_SIZE = env.int("SCANNER_INFERENCE_BATCH_SIZE", default=16)
+SCANNER_INFERENCE_MAX_WAIT_MS = env.int("SCANNER_INFERENCE_MAX_WAIT_MS", default=20)
+SCANNER_INFERENCE_THREADS = env.int("SCANNER_INFERENCE_THREADS", default=1)
+SCANNER_RESCORE_CHUNK_SIZE = env.int("SCANNER_RESCORE_CHUNK_SIZE", default=500)
+# Límite de píxeles por imagen (protege de "decompression bombs")
+SCANNER_MAX_IMAGE_PIXELS = env.int("SCANNER_MAX_IMAGE_PIXELS", default=40_000_000)
+# Fotos por contenido (scanners/blobs.py): segundos sin uso antes de que gc_photo_blobs las borre
+SCANNER_BLOB_GC_GRACE_SECONDS = env.int("SCANNER_BLOB_GC_GRACE_SECONDS", default=24 * 60 * 60)
+# Umbral de confianza de las etiquetas nuevas en la taxonomía (scanners/taxonomy.py)
+SCANNER_DEFAULT_CONFIDENCE_THRESHOLD = env.float("SCANNER_DEFAULT_CONFIDENCE_THRESHOLD", default=0.6)
+
+# ==============================
+# TAREAS EN SEGUNDO PLANO
+# ==============================
+# 'thread' (pool local, sin broker), 'celery' o 'sync' (en línea, para tests)
+BACKGROUND_TASK_BACKEND = env("BACKGROUND_TASK_BACKEND", default="thread")
+BACKGROUND_TASK_WORKERS = env.int("BACKGROUND_TASK_WORKERS", default=2)
+
+# ==============================
+# CACHÉ
+# ==============================
+# 'locmem' (por proceso), 'file', 'db' (requiere createcachetable) o 'redis'
+CACHE_BACKEND = env("CACHE_BACKEND", default="locmem")
+CACHES = {
+    "default": {
+        "BACKEND": {
+            "locmem": "django.core.cache.backends.locmem.LocMemCache",
+            "file": "django.core.cache.backends.filebased.FileBasedCache",
+            "db": "django.core.cache.backends.db.DatabaseCache",
+            "redis": "django.core.cache.backends.redis.RedisCache",
+        }[CACHE_BACKEND],
+        "LOCATION": env("CACHE_LOCATION", default={
+            "locmem": "cropcare",
+            "file": str(BASE_DIR / ".cache"),
+            "db": "cropcare_cache",
+            "redis": "redis://127.0.0.1:6379/1",
+        }[CACHE_BACKEND]),
+    }
+}
+# Segundos que vive una respuesta de metrics/ (se invalida antes si cambian los reportes)
+REPORTS_METRICS_CACHE_TTL = env.int("REPORTS_METRICS_CACHE_TTL", default=300)
 
 # ==============================
 # DEFAULTS
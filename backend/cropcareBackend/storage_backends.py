@@ -2,6 +2,9 @@
 from django.conf import settings
 from storages.backends.s3boto3 import S3Boto3Storage
 
+from .object_storage import client_config
+
+
 class StaticStorage(S3Boto3Storage):
     """
     Storage para archivos estáticos (static/)
@@ -10,6 +13,7 @@ class StaticStorage(S3Boto3Storage):
     location = "static"
     default_acl = "public-read"
     bucket_name = settings.AWS_STORAGE_BUCKET_NAME
+    client_config = client_config()
 
 
 class MediaStorage(S3Boto3Storage):
@@ -22,3 +26,4 @@ class MediaStorage(S3Boto3Storage):
     file_overwrite = False
     default_acl = "public-read"
     bucket_name = settings.AWS_STORAGE_BUCKET_NAME
+    client_config = client_config()
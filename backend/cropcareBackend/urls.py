@@ -15,4 +15,7 @@ urlpatterns = [
 
 # AGREGAR: Servir archivos media en desarrollo
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    if getattr(settings, 'OBJECT_STORAGE_BACKEND', 's3') == 'local':
+        # Bucket local (OBJECT_STORAGE_BACKEND=local): fotos, variantes y media
+        urlpatterns += static(settings.OBJECT_STORAGE_LOCAL_URL, document_root=settings.OBJECT_STORAGE_LOCAL_ROOT)
\ No newline at end of file
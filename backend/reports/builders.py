@@ -0,0 +1,154 @@
+# reports/builders.py
+"""
+Construcción de SessionReport con agregaciones en la base de datos.
+
+Lo usan reports.incremental (primera vez que se ve una sesión) y el comando
+backfill_session_reports, con una sola consulta agrupada por etiqueta y bucket
+del sketch de confianza (floor(confidence * 100)) de los resultados con
+etiqueta, que trae además la taxonomía de cada etiqueta (JOIN por label_id), la
+mediana (percentile_cont en Postgres) y el conteo y los promedios de
+latitud/longitud de las imágenes. De ahí salen histograma, suma de confianza,
+sketch, total, plagas, promedio, top y únicas.
+
+El histograma, la suma de confianza y el sketch quedan guardados en el reporte
+para que reports/incremental.py pueda aplicarle deltas sin recalcular.
+
+Plaga y confianza baja salen de la taxonomía de etiquetas (scanners/taxonomy.py):
+una detección es sospechosa si su clase no es sana, y el reporte tiene confianza
+baja si su confianza promedio queda bajo el promedio de los umbrales de sus
+clases (con todos los umbrales en 0.6 equivale al `avg < 0.6` anterior).
+reports/flagging.py aplica la misma regla en SQL sobre todos los reportes.
+"""
+from django.db import connection
+from django.db.models import Aggregate, Avg, Count, F, FloatField, Subquery, Sum
+from django.db.models.functions import Floor
+
+from scanners.models import ScannerImage, ScannerResult
+from scanners.taxonomy import LabelInfo, load_taxonomy
+from .models import SessionReport
+from .sketch import BUCKETS, ConfidenceSketch
+
+
+TOP_LABELS = 5
+
+
+class PercentileCont(Aggregate):
+    """percentile_cont(p) WITHIN GROUP (ORDER BY expr) — solo PostgreSQL."""
+    function = 'PERCENTILE_CONT'
+    template = '%(function)s(%(percentile)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+    output_field = FloatField()
+
+    def __init__(self, expression, percentile=0.5, **extra):
+        super().__init__(expression, percentile=float(percentile), **extra)
+
+
+def _median_fallback(results, count):
+    """Mediana exacta con consultas ordenadas (bases sin percentile_cont)."""
+    if not count:
+        return None
+    ordered = results.order_by('confidence').values_list('confidence', flat=True)
+    mid = count // 2
+    if count % 2:
+        return ordered[mid]
+    low, high = ordered[mid - 1:mid + 1]
+    return (low + high) / 2
+
+
+def flags(detections_count, suspicious, confidence_sum, threshold_sum):
+    """suspicious_flag y low_confidence_flag (sin detecciones el promedio es 0: queda marcado, como antes)."""
+    return {
+        'low_confidence_flag': not detections_count or confidence_sum < threshold_sum,
+        'suspicious_flag': suspicious > 0,
+    }
+
+
+def label_fields(histogram, confidence_sum, sketch, median=None, taxonomy=None):
+    """
+    Campos derivados del estado incremental (histograma {label: count}, suma de
+    confianza y sketch). Sin mediana exacta se usa la del sketch; sin taxonomy
+    ({label: LabelInfo}) se consulta la de las etiquetas del histograma.
+    """
+    if taxonomy is None:
+        taxonomy = load_taxonomy(histogram)
+    labels = sorted(histogram.items(), key=lambda item: (-item[1], item[0]))
+    detections_count = sum(histogram.values())
+    suspicious = sum(count for label, count in labels if not taxonomy[label].is_healthy)
+    threshold_sum = sum(count * taxonomy[label].threshold for label, count in labels)
+    avg_conf = confidence_sum / detections_count if detections_count else 0.0
+    if median is None:
+        median = sketch.quantile(0.5)
+
+    return {
+        'detections_count': detections_count,
+        'suspicious_detections_count': suspicious,
+        'unique_labels': [label for label, _ in labels],
+        'top_labels': [{'classification': label, 'count': count} for label, count in labels[:TOP_LABELS]],
+        'average_confidence': avg_conf,
+        'median_confidence': median if median is not None else 0.0,
+        'confidence_sum': confidence_sum if detections_count else 0.0,
+        'label_histogram': dict(labels),
+        'confidence_sketch': sketch.to_json(),
+        **flags(detections_count, suspicious, confidence_sum, threshold_sum),
+    }
+
+
+def image_fields(session):
+    """images_count y promedios de latitud/longitud de la sesión (una consulta)."""
+    return ScannerImage.objects.filter(session=session).aggregate(
+        images_count=Count('pk'), lat_avg=Avg('latitude'), lon_avg=Avg('longitude'),
+    )
+
+
+def build_session_report(session):
+    """Devuelve los valores de SessionReport para la sesión (sin guardar)."""
+    # Solo resultados con etiqueta: histograma, suma de confianza, sketch y mediana usan el mismo conjunto
+    results = ScannerResult.objects.filter(session=session, label__isnull=False).order_by()
+
+    images = ScannerImage.objects.filter(session=session).order_by().values('session')
+    session_columns = {
+        'images_count': Subquery(images.annotate(n=Count('pk')).values('n')),
+        'lat_avg': Subquery(images.annotate(a=Avg('latitude')).values('a')),
+        'lon_avg': Subquery(images.annotate(a=Avg('longitude')).values('a')),
+    }
+    if connection.vendor == 'postgresql':
+        session_columns['median_confidence'] = Subquery(
+            results.values('session').annotate(m=PercentileCont('confidence')).values('m')
+        )
+    # Una consulta: (etiqueta, bucket del sketch) con su taxonomía; las columnas de
+    # sesión son subconsultas sin correlación, se evalúan una vez y se repiten por fila
+    rows = list(
+        results.annotate(bucket=Floor(F('confidence') * BUCKETS))
+        .values('label__classification', 'label__is_healthy', 'label__confidence_threshold', 'bucket')
+        .annotate(n=Count('pk'), confidence_sum=Sum('confidence'), **session_columns)
+    )
+
+    histogram, taxonomy, sketch = {}, {}, ConfidenceSketch()
+    confidence_sum = 0.0
+    for row in rows:
+        label = row['label__classification']
+        histogram[label] = histogram.get(label, 0) + row['n']
+        taxonomy[label] = LabelInfo(row['label__is_healthy'], row['label__confidence_threshold'])
+        sketch.counts[min(max(int(row['bucket']), 0), BUCKETS - 1)] += row['n']
+        confidence_sum += row['confidence_sum'] or 0
+    # Sesión sin resultados: no hay filas, las columnas de imágenes se leen aparte
+    session_row = rows[0] if rows else image_fields(session)
+    median = session_row.get('median_confidence')
+    if 'median_confidence' not in session_columns:
+        median = _median_fallback(results, sketch.total)
+
+    return {
+        'empresa_id': session.empresa_id,
+        'zona_id': session.zona_id,
+        'cultivo_id': session.cultivo_id,
+        'owner_id': session.owner_id,
+        'images_count': session_row['images_count'] or 0,
+        'lat_avg': session_row['lat_avg'],
+        'lon_avg': session_row['lon_avg'],
+        **label_fields(histogram, confidence_sum, sketch, median=median, taxonomy=taxonomy),
+    }
+
+
+def rebuild_session_report(session):
+    """Recalcula (o crea) el reporte de la sesión."""
+    report, _ = SessionReport.objects.update_or_create(session=session, defaults=build_session_report(session))
+    return report
@@ -0,0 +1,69 @@
+# reports/cache.py
+"""
+Caché de respuestas de metrics/ por empresa.
+
+La clave es (empresa, versión, filtros normalizados). La versión de la
+empresa cambia cuando se crea, actualiza o borra un SessionReport finalizado
+(ver reports/signals.py y reports/incremental.py): invalidar es O(1) y las
+entradas anteriores simplemente expiran. El ETag se deriva de la misma clave,
+así que un If-None-Match vigente se responde con 304 sin calcular nada.
+
+La versión vive lo mismo que una respuesta (REPORTS_METRICS_CACHE_TTL): con
+el backend 'locmem' la caché es local a cada proceso y un worker no ve las
+invalidaciones de otro, pero al expirar su versión deja de servir (y de
+responder 304 para) datos de más de ese tiempo. Con varios workers conviene
+'file', 'db' o 'redis' (CACHE_BACKEND en .env), donde invalidar es inmediato.
+"""
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+METRICS_CACHE_TTL = getattr(settings, 'REPORTS_METRICS_CACHE_TTL', 300)
+METRICS_PARAMS = ('period', 'date_from', 'date_to', 'cultivo', 'zona')
+
+
+def _version_key(empresa_id):
+    return f"reports:metrics:version:{empresa_id}"
+
+
+def metrics_version(empresa_id):
+    key = _version_key(empresa_id)
+    version = cache.get(key)
+    if version is None:
+        candidate = uuid.uuid4().hex
+        version = candidate if cache.add(key, candidate, METRICS_CACHE_TTL) else cache.get(key, candidate)
+    return version
+
+
+def invalidate_metrics(empresa_id):
+    """Cambia la versión de la empresa cuando confirma la transacción actual."""
+    transaction.on_commit(lambda: cache.set(_version_key(empresa_id), uuid.uuid4().hex, METRICS_CACHE_TTL))
+
+
+def normalize_params(query_params):
+    """Filtros que afectan a metrics/, sin vacíos y con el period por defecto explícito."""
+    params = {name: query_params.get(name) for name in METRICS_PARAMS if query_params.get(name)}
+    params.setdefault('period', 'month')
+    return params
+
+
+def metrics_key(empresa_id, params):
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+    return f"reports:metrics:{empresa_id}:{metrics_version(empresa_id)}:{digest}"
+
+
+def etag_for(key):
+    return '"%s"' % hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def cached_metrics(key, compute):
+    data = cache.get(key)
+    if data is None:
+        data = compute()
+        cache.set(key, data, METRICS_CACHE_TTL)
+    return data
@@ -0,0 +1,87 @@
+# reports/flagging.py
+"""
+Re-marcado masivo de SessionReport tras cambiar la taxonomía o los umbrales.
+
+reflag_reports() recalcula suspicious_detections_count, suspicious_flag y
+low_confidence_flag de todos los reportes (o los de una empresa) en una sola
+sentencia UPDATE ... FROM: los resultados con etiqueta se agregan por sesión con
+un JOIN entero (label_id) a LabelTaxonomy y solo se escriben los reportes cuyo
+valor cambia. Una segunda sentencia deja sin detecciones a los reportes cuya
+sesión no tiene resultados con etiqueta. Es la misma regla que
+reports/builders.build_session_report aplica a cada reporte.
+
+Los reportes modificados quedan con updated_at nuevo, así los rollups los
+toman en el próximo refresco incremental.
+"""
+from django.db import connection, transaction
+from django.utils import timezone
+
+from scanners.models import LabelTaxonomy, ScannerResult
+from scanners.taxonomy import DEFAULT_THRESHOLD
+from .cache import invalidate_metrics
+from .incremental import schedule_rollup_refresh
+from .models import SessionReport
+
+
+def _sql(empresa_id):
+    reports = SessionReport._meta.db_table
+    results = ScannerResult._meta.db_table
+    taxonomy = LabelTaxonomy._meta.db_table
+    scope = f"AND s.session_id IN (SELECT session_id FROM {reports} WHERE empresa_id = %s)" if empresa_id else ""
+    return f"""
+        UPDATE {reports} AS r SET
+            suspicious_detections_count = f.suspicious,
+            suspicious_flag = f.suspicious > 0,
+            low_confidence_flag = f.confidence_sum < f.threshold_sum,
+            updated_at = %s
+        FROM (
+            SELECT s.session_id,
+                   SUM(CASE WHEN t.is_healthy THEN 0 ELSE 1 END) AS suspicious,
+                   SUM(s.confidence) AS confidence_sum,
+                   SUM(COALESCE(t.confidence_threshold, %s)) AS threshold_sum
+            FROM {results} s
+            LEFT JOIN {taxonomy} t ON t.id = s.label_id
+            WHERE s.label_id IS NOT NULL {scope}
+            GROUP BY s.session_id
+        ) AS f
+        WHERE r.session_id = f.session_id
+          AND (r.suspicious_detections_count <> f.suspicious
+               OR r.suspicious_flag <> (f.suspicious > 0)
+               OR r.low_confidence_flag <> (f.confidence_sum < f.threshold_sum))
+    """
+
+
+def _empty_sql(empresa_id):
+    """Reportes sin resultados con etiqueta: sin detecciones (builders.flags: confianza baja, sin plaga)."""
+    reports = SessionReport._meta.db_table
+    results = ScannerResult._meta.db_table
+    scope = "AND r.empresa_id = %s" if empresa_id else ""
+    return f"""
+        UPDATE {reports} AS r SET
+            suspicious_detections_count = 0,
+            suspicious_flag = FALSE,
+            low_confidence_flag = TRUE,
+            updated_at = %s
+        WHERE NOT EXISTS (SELECT 1 FROM {results} s WHERE s.session_id = r.session_id AND s.label_id IS NOT NULL)
+          {scope}
+          AND (r.suspicious_detections_count <> 0 OR r.suspicious_flag OR NOT r.low_confidence_flag)
+    """
+
+
+def reflag_reports(empresa_id=None):
+    """Re-marca los reportes según la taxonomía actual. Devuelve la cantidad modificada."""
+    now = timezone.now()
+    scope = [empresa_id] if empresa_id else []
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(_sql(empresa_id), [now, DEFAULT_THRESHOLD, *scope])
+            updated = cursor.rowcount
+            cursor.execute(_empty_sql(empresa_id), [now, *scope])
+            updated += cursor.rowcount
+        if updated:
+            changed = SessionReport.objects.filter(updated_at=now).order_by()
+            for changed_empresa in changed.values_list('empresa_id', flat=True).distinct():
+                invalidate_metrics(changed_empresa)
+                if changed.filter(empresa_id=changed_empresa, finalized_at__isnull=False).exists():
+                    schedule_rollup_refresh(changed_empresa)
+    return updated
@@ -0,0 +1,154 @@
+# reports/incremental.py
+"""
+Mantenimiento incremental de SessionReport.
+
+Cada escritura de resultados (señal scanners.signals.results_changed) se
+traduce en deltas por sesión: se restan los valores previos y se suman los
+nuevos sobre el histograma de etiquetas, la suma de confianza y el sketch
+guardados en el reporte. El costo es proporcional al lote, no a la sesión.
+
+Los reportes que aún no existen (o anteriores al estado incremental) se
+construyen completos una sola vez con builders.build_session_report.
+"""
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from scanners.models import ScannerSession
+from scanners.taxonomy import load_taxonomy
+from .builders import build_session_report, image_fields, label_fields
+from .cache import invalidate_metrics
+from .models import SessionReport
+from .sketch import ConfidenceSketch
+
+
+INCREMENTAL_FIELDS = [
+    'detections_count', 'suspicious_detections_count', 'unique_labels', 'top_labels',
+    'average_confidence', 'median_confidence', 'confidence_sum', 'label_histogram',
+    'confidence_sketch', 'low_confidence_flag', 'suspicious_flag', 'updated_at',
+]
+
+
+def schedule_rollup_refresh(empresa_id):
+    """Refresca los AggregatedReport de la empresa después del commit (coalescido por empresa)."""
+    from core.background import dispatch
+    from .tasks import refresh_rollups_async
+
+    dispatch(f"rollup:{empresa_id}", refresh_rollups_async, empresa_id)
+
+
+def _is_legacy(report):
+    """Reporte generado antes del estado incremental: no tiene histograma."""
+    return not report.label_histogram and report.detections_count > 0
+
+
+def _apply(report, changes, taxonomy=None):
+    """Aplica [(signo, label, confianza), ...] al estado del reporte (sin guardar)."""
+    histogram = Counter(report.label_histogram)
+    sketch = ConfidenceSketch(report.confidence_sketch)
+    confidence_sum = report.confidence_sum
+    for sign, label, confidence in changes:
+        histogram[label] += sign
+        confidence_sum += sign * confidence
+        if sign > 0:
+            sketch.add(confidence)
+        else:
+            sketch.remove(confidence)
+    histogram = {label: count for label, count in histogram.items() if count > 0}
+    for field, value in label_fields(histogram, confidence_sum, sketch, taxonomy=taxonomy).items():
+        setattr(report, field, value)
+    # bulk_update no aplica auto_now
+    report.updated_at = timezone.now()
+
+
+def _build_missing(session_ids, reports, changes):
+    """Construye completos los reportes faltantes o legacy (una vez por sesión)."""
+    for session in ScannerSession.objects.filter(pk__in=session_ids):
+        values = build_session_report(session)
+        report = reports.get(session.pk)
+        if report is not None:
+            SessionReport.objects.filter(pk=report.pk).update(**values, updated_at=timezone.now())
+            continue
+        try:
+            with transaction.atomic():
+                SessionReport.objects.create(session=session, **values)
+        except IntegrityError:
+            # Otra transacción lo creó en paralelo (sin ver este lote): se aplica el delta
+            report = SessionReport.objects.select_for_update().get(session=session)
+            _apply(report, changes[session.pk])
+            report.save(update_fields=INCREMENTAL_FIELDS)
+
+
+def apply_result_changes(previous, current):
+    """
+    Actualiza los SessionReport afectados por un lote de resultados.
+
+    previous: {result_id: (session_id, classification, confidence)} antes de escribir
+    current:  ScannerResult escritos (vacío si se borraron)
+    """
+    changes = defaultdict(list)
+    for session_id, classification, confidence in previous.values():
+        changes[session_id].append((-1, classification, confidence))
+    for result in current:
+        changes[result.session_id].append((1, result.classification, result.confidence))
+    if not changes:
+        return
+
+    with transaction.atomic():
+        reports = {
+            report.session_id: report
+            for report in SessionReport.objects.select_for_update().filter(session_id__in=changes)
+        }
+        rebuild = [sid for sid in changes if sid not in reports or _is_legacy(reports[sid])]
+
+        # Una consulta a la taxonomía para todo el lote (registra las etiquetas nuevas)
+        taxonomy = load_taxonomy(
+            {label for session_changes in changes.values() for _, label, _ in session_changes}
+            | {label for report in reports.values() for label in report.label_histogram}
+        )
+        updated = []
+        for session_id, report in reports.items():
+            if session_id not in rebuild:
+                _apply(report, changes[session_id], taxonomy)
+                updated.append(report)
+        if updated:
+            SessionReport.objects.bulk_update(updated, INCREMENTAL_FIELDS)
+        if rebuild:
+            _build_missing(rebuild, reports, changes)
+
+        # Resultados tardíos sobre reportes ya finalizados: rollups y caché de metrics/
+        # quedan desactualizados (bulk_update/update no emiten post_save)
+        finalized = [r for r in reports.values() if r.finalized_at is not None]
+        for empresa_id in {r.empresa_id for r in finalized}:
+            invalidate_metrics(empresa_id)
+            schedule_rollup_refresh(empresa_id)
+
+
+def finalize_session_report(session_id):
+    """
+    Cierra el reporte de una sesión completada.
+
+    Las métricas de resultados ya están al día; solo se agregan las imágenes y
+    se marca finalized_at. Si el reporte no existe se construye completo.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        report = SessionReport.objects.select_for_update().filter(session_id=session_id).first()
+        if report is None:
+            session = ScannerSession.objects.get(session_id=session_id)
+            report, _ = SessionReport.objects.update_or_create(
+                session=session,
+                defaults={**build_session_report(session), 'finalized_at': now, 'generated_at': now},
+            )
+        else:
+            for field, value in image_fields(session_id).items():
+                setattr(report, field, value)
+            update_fields = ['images_count', 'lat_avg', 'lon_avg', 'updated_at']
+            if report.finalized_at is None:
+                report.finalized_at = now
+                report.generated_at = now
+                update_fields += ['finalized_at', 'generated_at']
+            report.save(update_fields=update_fields)
+        schedule_rollup_refresh(report.empresa_id)
+    return report
@@ -0,0 +1,40 @@
+# reports/management/commands/backfill_session_reports.py
+from django.core.management.base import BaseCommand, CommandError
+
+from emprises.models import Empresa
+from scanners.models import ScannerSession
+from django.db.models import Q
+
+from reports.builders import rebuild_session_report
+from reports.incremental import finalize_session_report
+
+
+class Command(BaseCommand):
+    help = "Genera/finaliza los SessionReport pendientes de sesiones completadas (o los recalcula con --rebuild)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company-tax', dest='company_tax',
+                            help='tax_id de la empresa (por defecto todas)')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recalcula también los reportes existentes')
+
+    def handle(self, *args, **options):
+        sessions = ScannerSession.objects.filter(status='COMPLETED', finished_at__isnull=False)
+        if options['company_tax']:
+            empresa = Empresa.objects.filter(tax_id=options['company_tax']).first()
+            if not empresa:
+                raise CommandError(f"Empresa con tax_id='{options['company_tax']}' no encontrada.")
+            sessions = sessions.filter(empresa=empresa)
+        if not options['rebuild']:
+            sessions = sessions.filter(
+                Q(session_report__isnull=True) | Q(session_report__finalized_at__isnull=True)
+            )
+
+        total = 0
+        for session in sessions.order_by('finished_at').iterator(chunk_size=500):
+            if options['rebuild']:
+                rebuild_session_report(session)
+            finalize_session_report(session.pk)
+            total += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Reportes generados/recalculados: {total}"))
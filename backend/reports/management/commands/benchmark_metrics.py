@@ -0,0 +1,283 @@
+# reports/management/commands/benchmark_metrics.py
+import random
+import time
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate, TruncWeek, TruncMonth, TruncYear
+from django.utils import timezone
+
+from emprises.models import Empresa
+from zonecrop.models import Cultivo
+from scanners.models import ScannerSession
+from scanners.management.commands.benchmark_sync import QueryCounter
+from reports.metrics import compute_metrics
+from reports.models import SessionReport
+
+
+LABELS = [
+    'Potato___Early_blight', 'Potato___Late_blight', 'Potato___healthy',
+    'Tomato___Leaf_Mold', 'Tomato___Septoria_leaf_spot', 'Tomato___healthy',
+    'Corn___Common_rust', 'Corn___healthy',
+]
+
+
+def legacy_metrics(reports, period):
+    """Implementación original de metrics/ (fila a fila, una consulta por grupo), usada como línea base."""
+    # Contar usando suspicious_detections_count
+    total_reports = 0
+    reports_with_plagues = 0
+    reports_healthy = 0
+    all_labels = []
+    total_confidence = 0
+
+    for session in reports:
+        # Total de detecciones
+        session_detections = session.detections_count or 0
+        total_reports += session_detections
+
+        # Detecciones con plaga (del nuevo campo)
+        session_plagues = session.suspicious_detections_count or 0
+        reports_with_plagues += session_plagues
+
+        # Sanas = Total - Plagas
+        reports_healthy += (session_detections - session_plagues)
+
+        # Acumular etiquetas
+        if session.unique_labels:
+            all_labels.extend(session.unique_labels)
+
+        # Acumular confianza
+        if session.average_confidence:
+            total_confidence += session.average_confidence * session_detections
+
+    avg_confidence = (total_confidence / total_reports) if total_reports > 0 else 0
+
+    # Distribución de plagas vs sanas
+    plague_distribution = {
+        'healthy': reports_healthy,
+        'with_plague': reports_with_plagues,
+        'total': total_reports
+    }
+
+    # Top clasificaciones (enfermedades más comunes)
+    label_counts = defaultdict(int)
+    for label in all_labels:
+        if 'Healthy' not in label and 'healthy' not in label.lower():
+            label_counts[label] += 1
+
+    top_diseases = [
+        {'label': label, 'count': count}
+        for label, count in sorted(label_counts.items(), key=lambda x: x[1], reverse=True)[:10]
+    ]
+
+    # Distribución por cultivo
+    cultivo_stats = []
+    for cultivo_group in reports.values('cultivo__nombre').annotate(session_count=Count('id')):
+        cultivo_name = cultivo_group['cultivo__nombre']
+        cultivo_sessions = reports.filter(cultivo__nombre=cultivo_name)
+
+        cultivo_total = 0
+        cultivo_plagues = 0
+
+        for s in cultivo_sessions:
+            s_detections = s.detections_count or 0
+            s_plagues = s.suspicious_detections_count or 0
+
+            cultivo_total += s_detections
+            cultivo_plagues += s_plagues
+
+        cultivo_healthy = cultivo_total - cultivo_plagues
+
+        if cultivo_total > 0:
+            cultivo_stats.append({
+                'cultivo__nombre': cultivo_name,
+                'total': cultivo_total,
+                'with_plague': cultivo_plagues,
+                'healthy': cultivo_healthy
+            })
+
+    cultivo_stats.sort(key=lambda x: x['total'], reverse=True)
+
+    # Distribución por zona
+    zona_stats = []
+    for zona_group in reports.values('zona__nombre').annotate(session_count=Count('id')):
+        zona_name = zona_group['zona__nombre']
+        zona_sessions = reports.filter(zona__nombre=zona_name)
+
+        zona_total = 0
+        zona_plagues = 0
+
+        for s in zona_sessions:
+            s_detections = s.detections_count or 0
+            s_plagues = s.suspicious_detections_count or 0
+
+            zona_total += s_detections
+            zona_plagues += s_plagues
+
+        zona_healthy = zona_total - zona_plagues
+
+        if zona_total > 0:
+            zona_stats.append({
+                'zona__nombre': zona_name,
+                'total': zona_total,
+                'with_plague': zona_plagues,
+                'healthy': zona_healthy
+            })
+
+    zona_stats.sort(key=lambda x: x['total'], reverse=True)
+
+    # Tendencia temporal
+    trunc_func = {
+        'day': TruncDate,
+        'week': TruncWeek,
+        'month': TruncMonth,
+        'year': TruncYear
+    }.get(period, TruncMonth)
+
+    timeline_data = reports.annotate(
+        period=trunc_func('generated_at')
+    ).values('period').annotate(
+        session_count=Count('id')
+    ).order_by('period')
+
+    timeline = []
+    for item in timeline_data:
+        period_sessions = reports.annotate(
+            period_trunc=trunc_func('generated_at')
+        ).filter(period_trunc=item['period'])
+
+        period_total = 0
+        period_plagues = 0
+        period_confidence = 0
+
+        for s in period_sessions:
+            s_detections = s.detections_count or 0
+            s_plagues = s.suspicious_detections_count or 0
+
+            period_total += s_detections
+            period_plagues += s_plagues
+
+            if s.average_confidence:
+                period_confidence += s.average_confidence * s_detections
+
+        period_healthy = period_total - period_plagues
+        period_avg_confidence = (period_confidence / period_total) if period_total > 0 else 0
+
+        timeline.append({
+            'date': item['period'].isoformat() if item['period'] else None,
+            'total': period_total,
+            'with_plague': period_plagues,
+            'healthy': period_healthy,
+            'avg_confidence': round(period_avg_confidence, 2)
+        })
+
+    return {
+        'summary': {
+            'total_reports': total_reports,
+            'reports_with_plagues': reports_with_plagues,
+            'reports_healthy': reports_healthy,
+            'avg_confidence': round(avg_confidence, 2),
+            'plague_percentage': round((reports_with_plagues / total_reports * 100) if total_reports > 0 else 0, 1)
+        },
+        'plague_distribution': plague_distribution,
+        'top_diseases': top_diseases,
+        'by_cultivo': cultivo_stats,
+        'by_zona': zona_stats,
+        'timeline': timeline
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide consultas SQL y tiempo de session-reports/metrics/ (original vs. GROUP BY) sobre un "
+        "fixture de N reportes. Todo se ejecuta dentro de una transacción que se revierte al final."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company-tax', dest='company_tax', required=True,
+                            help='tax_id de la empresa con al menos un cultivo (ej: DEMO123)')
+        parser.add_argument('--reports', type=int, default=100000, help='Reportes del fixture (por defecto 100000)')
+        parser.add_argument('--days', type=int, default=730, help='Días cubiertos por el fixture (por defecto 730)')
+        parser.add_argument('--period', choices=['day', 'week', 'month', 'year'], default='month')
+        parser.add_argument('--skip-legacy', action='store_true',
+                            help='No ejecuta la implementación original (lenta con fixtures grandes)')
+
+    def handle(self, *args, **options):
+        empresa = Empresa.objects.filter(tax_id=options['company_tax']).select_related('owner').first()
+        if not empresa:
+            raise CommandError(f"Empresa con tax_id='{options['company_tax']}' no encontrada.")
+        cultivos = list(Cultivo.objects.filter(zona__empresa=empresa))
+        if not cultivos:
+            raise CommandError("La empresa no tiene cultivos. Ejecuta seed_demo seed_zones primero.")
+        owner = empresa.owner or empresa.members.first()
+        if not owner:
+            raise CommandError("La empresa no tiene usuarios.")
+
+        with transaction.atomic():
+            start = time.perf_counter()
+            self._fixture(empresa, cultivos, owner, options['reports'], options['days'])
+            self.stdout.write(self.style.NOTICE(
+                f"Fixture: {options['reports']} reportes en {options['days']} días "
+                f"({time.perf_counter() - start:.1f}s)"
+            ))
+
+            reports = SessionReport.objects.filter(empresa=empresa, finalized_at__isnull=False)
+            runs = [('después (GROUP BY)', compute_metrics)]
+            if not options['skip_legacy']:
+                runs.insert(0, ('antes (fila a fila)', legacy_metrics))
+
+            outputs = {}
+            for label, func in runs:
+                counter = QueryCounter()
+                with connection.execute_wrapper(counter):
+                    start = time.perf_counter()
+                    outputs[label] = func(reports, options['period'])
+                    elapsed = time.perf_counter() - start
+                self.stdout.write(f"{label:<22} queries={counter.count:<7} tiempo={elapsed * 1000:.1f}ms")
+
+            if len(outputs) == 2:
+                before, after = outputs.values()
+                diff = self._diff(before, after)
+                self.stdout.write(f"Misma respuesta: {'sí' if not diff else 'no, difiere ' + ', '.join(diff)}")
+            transaction.set_rollback(True)
+
+    def _diff(self, before, after):
+        """Secciones distintas entre ambas respuestas (el orden entre empates no estaba definido)."""
+        def normalize(data):
+            data = dict(data)
+            data['top_diseases'] = sorted(d['count'] for d in data['top_diseases'])
+            for key in ('by_cultivo', 'by_zona'):
+                data[key] = sorted(data[key], key=lambda row: sorted(row.items()))
+            return data
+        before, after = normalize(before), normalize(after)
+        return [key for key in before if before[key] != after[key]]
+
+    def _fixture(self, empresa, cultivos, owner, count, days):
+        now = timezone.now()
+        sessions = []
+        reports = []
+        for i in range(count):
+            cultivo = cultivos[i % len(cultivos)]
+            generated_at = now - timedelta(days=random.randrange(days), seconds=random.randrange(86400))
+            session = ScannerSession(
+                session_id=str(uuid.uuid4()), empresa=empresa, zona_id=cultivo.zona_id, cultivo=cultivo,
+                owner=owner, worker_name='benchmark', model_version_string='1.0',
+                started_at=generated_at, finished_at=generated_at, status='COMPLETED',
+            )
+            labels = random.sample(LABELS, random.randint(1, 4))
+            detections = random.randint(1, 40)
+            suspicious = random.randint(0, detections)
+            sessions.append(session)
+            reports.append(SessionReport(
+                session=session, empresa=empresa, zona_id=cultivo.zona_id, cultivo=cultivo, owner=owner,
+                detections_count=detections, suspicious_detections_count=suspicious,
+                unique_labels=labels, average_confidence=random.uniform(0.4, 1.0),
+                generated_at=generated_at, finalized_at=generated_at,
+            ))
+        ScannerSession.objects.bulk_create(sessions, batch_size=2000)
+        SessionReport.objects.bulk_create(reports, batch_size=2000)
@@ -0,0 +1,47 @@
+# reports/management/commands/reflag_reports.py
+from django.core.management.base import BaseCommand, CommandError
+
+from emprises.models import Empresa
+from reports.flagging import reflag_reports
+from scanners.taxonomy import calibrate_thresholds
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-marca suspicious/low_confidence de los SessionReport según la taxonomía de etiquetas "
+        "(una sola sentencia). Con --calibrate recalcula antes los umbrales por clase."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company-tax', dest='company_tax',
+                            help='tax_id de la empresa (por defecto todas)')
+        parser.add_argument('--calibrate', action='store_true',
+                            help='Calibra los umbrales por clase con los resultados clasificados por el servidor')
+        parser.add_argument('--target-precision', type=float, default=0.9,
+                            help='Precisión mínima frente al servidor para calibrar (por defecto 0.9)')
+        parser.add_argument('--min-samples', type=int, default=50,
+                            help='Resultados mínimos por clase para calibrar (por defecto 50)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Muestra los umbrales calibrados sin guardarlos ni re-marcar')
+
+    def handle(self, *args, **options):
+        empresa_id = None
+        if options['company_tax']:
+            empresa_id = Empresa.objects.filter(tax_id=options['company_tax']).values_list('pk', flat=True).first()
+            if empresa_id is None:
+                raise CommandError(f"Empresa con tax_id='{options['company_tax']}' no encontrada.")
+
+        if options['calibrate']:
+            changes = calibrate_thresholds(
+                target_precision=options['target_precision'],
+                min_samples=options['min_samples'],
+                dry_run=options['dry_run'],
+            )
+            for label, old, new, samples in changes:
+                self.stdout.write(f"{label}: {old:.2f} -> {new:.2f} ({samples} resultados)")
+            self.stdout.write(f"Clases calibradas: {len(changes)}")
+        if options['dry_run']:
+            return
+
+        updated = reflag_reports(empresa_id)
+        self.stdout.write(self.style.SUCCESS(f"Reportes re-marcados: {updated}"))
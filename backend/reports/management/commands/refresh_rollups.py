@@ -0,0 +1,28 @@
+# reports/management/commands/refresh_rollups.py
+from django.core.management.base import BaseCommand, CommandError
+
+from emprises.models import Empresa
+from reports.rollups import refresh_rollups
+
+
+class Command(BaseCommand):
+    help = "Refresca los AggregatedReport (rollups diarios y mensuales) de una o todas las empresas."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company-tax', dest='company_tax',
+                            help='tax_id de la empresa (por defecto todas)')
+        parser.add_argument('--full', action='store_true',
+                            help='Reconstruye todos los buckets (si no, solo los modificados desde el último refresco)')
+
+    def handle(self, *args, **options):
+        empresas = Empresa.objects.all()
+        if options['company_tax']:
+            empresas = empresas.filter(tax_id=options['company_tax'])
+            if not empresas.exists():
+                raise CommandError(f"Empresa con tax_id='{options['company_tax']}' no encontrada.")
+
+        total = 0
+        for empresa_id in empresas.order_by('pk').values_list('pk', flat=True):
+            total += refresh_rollups(empresa_id, full=options['full'])
+
+        self.stdout.write(self.style.SUCCESS(f"Buckets escritos: {total}"))
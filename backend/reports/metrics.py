@@ -0,0 +1,164 @@
+# reports/metrics.py
+"""
+Métricas agregadas de SessionReport (endpoint session-reports/metrics/).
+
+Todo se calcula con agregaciones GROUP BY en la base de datos: resumen,
+distribución por cultivo, por zona y línea de tiempo son una consulta cada
+una; el top de enfermedades desanida unique_labels en SQL (Postgres) y descarta
+las clases sanas con un JOIN a la taxonomía de etiquetas, o se cuenta en un solo
+recorrido sobre esa columna en otras bases.
+
+La misma lógica sirve para AggregatedReport (ver reports/rollups.py): basta
+con indicar qué columnas hacen de detecciones, plagas, confianza y fecha.
+"""
+from collections import Counter
+from datetime import datetime, time
+
+from django.db import connection
+from django.db.models import DateField, DateTimeField, F, FloatField, IntegerField, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth, TruncWeek, TruncYear
+from django.utils import timezone
+
+from scanners.models import LabelTaxonomy
+from scanners.taxonomy import load_taxonomy
+
+
+TOP_DISEASES = 10
+
+TRUNC_FUNCTIONS = {
+    'day': TruncDate,
+    'week': TruncWeek,
+    'month': TruncMonth,
+    'year': TruncYear,
+}
+
+# Columnas de origen: SessionReport o AggregatedReport (reports/rollups.py)
+REPORT_FIELDS = {
+    'detections': 'detections_count',
+    'suspicious': 'suspicious_detections_count',
+    'confidence': 'average_confidence',
+    'date': 'generated_at',
+}
+
+
+def _totals(fields=REPORT_FIELDS):
+    """Agregados comunes: detecciones, plagas y confianza ponderada por detecciones."""
+    return {
+        'total': Coalesce(Sum(fields['detections']), Value(0), output_field=IntegerField()),
+        'with_plague': Coalesce(Sum(fields['suspicious']), Value(0), output_field=IntegerField()),
+        'confidence': Coalesce(
+            Sum(F(fields['confidence']) * F(fields['detections']), output_field=FloatField()),
+            Value(0.0), output_field=FloatField(),
+        ),
+    }
+
+
+def _grouped(rows, field, fields=REPORT_FIELDS):
+    """total/with_plague/healthy por nombre de cultivo o zona (solo grupos con detecciones)."""
+    totals = _totals(fields)
+    rows = (
+        rows.order_by().values(field)
+        .annotate(total=totals['total'], with_plague=totals['with_plague'])
+        .filter(total__gt=0)
+        .order_by('-total', field)
+    )
+    return [
+        {field: row[field], 'total': row['total'], 'with_plague': row['with_plague'],
+         'healthy': row['total'] - row['with_plague']}
+        for row in rows
+    ]
+
+
+def _period_iso(value, period):
+    # Las fechas truncadas de un DateTimeField son datetimes locales (salvo 'day');
+    # las de un DateField (rollups) se llevan a la misma forma.
+    if value is None:
+        return None
+    if period != 'day' and not isinstance(value, datetime):
+        value = timezone.make_aware(datetime.combine(value, time.min))
+    return value.isoformat()
+
+
+def _timeline(rows, period, fields=REPORT_FIELDS):
+    trunc_func = TRUNC_FUNCTIONS.get(period, TruncMonth)
+    if isinstance(rows.model._meta.get_field(fields['date']), DateTimeField):
+        bucket = trunc_func(fields['date'])
+    elif period == 'day':
+        bucket = F(fields['date'])
+    else:
+        bucket = trunc_func(fields['date'], output_field=DateField())
+
+    timeline = []
+    for item in rows.order_by().annotate(period=bucket).values('period').annotate(**_totals(fields)).order_by('period'):
+        timeline.append({
+            'date': _period_iso(item['period'], period),
+            'total': item['total'],
+            'with_plague': item['with_plague'],
+            'healthy': item['total'] - item['with_plague'],
+            'avg_confidence': round((item['confidence'] / item['total']) if item['total'] > 0 else 0, 2),
+        })
+    return timeline
+
+
+def rank_diseases(counts, limit=TOP_DISEASES):
+    """[{'label', 'count'}] de las etiquetas no sanas con más reportes."""
+    taxonomy = load_taxonomy(counts, create=False)
+    ranked = sorted(
+        ((label, count) for label, count in counts.items() if not taxonomy[label].is_healthy),
+        key=lambda item: (-item[1], item[0]),
+    )[:limit]
+    return [{'label': label, 'count': count} for label, count in ranked]
+
+
+def top_diseases(reports, limit=TOP_DISEASES):
+    """Etiquetas no sanas ordenadas por cantidad de reportes que las contienen."""
+    if connection.vendor == 'postgresql':
+        inner, params = reports.order_by().values('unique_labels').query.sql_with_params()
+        sql = (
+            "SELECT label, COUNT(*) AS n "
+            f"FROM ({inner}) AS r CROSS JOIN LATERAL jsonb_array_elements_text(r.unique_labels) AS label "
+            f"LEFT JOIN {LabelTaxonomy._meta.db_table} t ON t.classification = label "
+            "WHERE t.is_healthy IS NOT TRUE "
+            "GROUP BY label ORDER BY n DESC, label LIMIT %s"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, (*params, limit))
+            return [{'label': label, 'count': count} for label, count in cursor.fetchall()]
+
+    counts = Counter()
+    for labels in reports.order_by().values_list('unique_labels', flat=True).iterator(chunk_size=2000):
+        counts.update(labels or [])
+    return rank_diseases(counts, limit)
+
+
+def summarize(rows, period, diseases, fields=REPORT_FIELDS):
+    """Respuesta de metrics/ a partir de filas ya filtradas (reportes o rollups)."""
+    totals = rows.order_by().aggregate(**_totals(fields))
+    total_reports = totals['total']
+    reports_with_plagues = totals['with_plague']
+    reports_healthy = total_reports - reports_with_plagues
+    avg_confidence = (totals['confidence'] / total_reports) if total_reports > 0 else 0
+
+    return {
+        'summary': {
+            'total_reports': total_reports,
+            'reports_with_plagues': reports_with_plagues,
+            'reports_healthy': reports_healthy,
+            'avg_confidence': round(avg_confidence, 2),
+            'plague_percentage': round((reports_with_plagues / total_reports * 100) if total_reports > 0 else 0, 1)
+        },
+        'plague_distribution': {
+            'healthy': reports_healthy,
+            'with_plague': reports_with_plagues,
+            'total': total_reports
+        },
+        'top_diseases': diseases,
+        'by_cultivo': _grouped(rows, 'cultivo__nombre', fields),
+        'by_zona': _grouped(rows, 'zona__nombre', fields),
+        'timeline': _timeline(rows, period, fields),
+    }
+
+
+def compute_metrics(reports, period='month'):
+    """Arma la respuesta de metrics/ para un queryset de SessionReport ya filtrado."""
+    return summarize(reports, period, top_diseases(reports))
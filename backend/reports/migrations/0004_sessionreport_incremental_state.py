@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:22
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def finalize_existing(apps, schema_editor):
+    # Los reportes previos se generaban al finalizar la sesión
+    SessionReport = apps.get_model('reports', 'SessionReport')
+    SessionReport.objects.filter(finalized_at__isnull=True).update(finalized_at=F('generated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emprises', '0002_alter_empresa_owner'),
+        ('reports', '0003_sessionreport_suspicious_detections_count'),
+        ('scanners', '0004_scannerresult_session_created_at_idx'),
+        ('zonecrop', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sessionreport',
+            name='confidence_sketch',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='sessionreport',
+            name='confidence_sum',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='sessionreport',
+            name='finalized_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='sessionreport',
+            name='label_histogram',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.AddIndex(
+            model_name='sessionreport',
+            index=models.Index(fields=['empresa', 'finalized_at'], name='reports_ses_empresa_02c68d_idx'),
+        ),
+        migrations.RunPython(finalize_existing, migrations.RunPython.noop),
+    ]
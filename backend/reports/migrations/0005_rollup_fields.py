@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emprises', '0002_alter_empresa_owner'),
+        ('reports', '0004_sessionreport_incremental_state'),
+        ('scanners', '0004_scannerresult_session_created_at_idx'),
+        ('zonecrop', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aggregatedreport',
+            name='total_suspicious',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='sessionreport',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='sessionreport',
+            index=models.Index(fields=['empresa', 'updated_at'], name='reports_ses_empresa_e151af_idx'),
+        ),
+    ]
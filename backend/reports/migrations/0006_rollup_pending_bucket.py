@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0005_rollup_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupPendingBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('empresa_id', models.BigIntegerField()),
+                ('zona_id', models.BigIntegerField()),
+                ('cultivo_id', models.BigIntegerField()),
+                ('day', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['empresa_id'], name='reports_rol_empresa_9d928e_idx')],
+            },
+        ),
+    ]
@@ -7,8 +7,9 @@ User = settings.AUTH_USER_MODEL
 
 class SessionReport(models.Model):
     """
-    Resumen generado cuando una ScannerSession finaliza.
-    Un registro por ScannerSession (1:1).
+    Resumen de una ScannerSession (1:1).
+    Se mantiene incrementalmente mientras llegan resultados y se finaliza
+    (finalized_at) cuando la sesión se completa.
     """
     session = models.OneToOneField(
         'scanners.ScannerSession',
@@ -29,6 +30,11 @@ class SessionReport(models.Model):
     average_confidence = models.FloatField(null=True, blank=True)
     median_confidence = models.FloatField(null=True, blank=True)
 
+    # estado incremental (se actualiza a medida que llegan resultados)
+    confidence_sum = models.FloatField(default=0)
+    label_histogram = models.JSONField(default=dict)      # {label: count}
+    confidence_sketch = models.JSONField(default=list)    # ver reports/sketch.py
+
     # geolocalización promedio
     lat_avg = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     lon_avg = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
@@ -40,12 +46,18 @@ class SessionReport(models.Model):
     notes = models.TextField(blank=True, null=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
+    # marca de agua para refrescar los AggregatedReport (reports/rollups.py)
+    updated_at = models.DateTimeField(auto_now=True)
     generated_at = models.DateTimeField(default=timezone.now)
+    # null mientras la sesión sigue activa (reporte en construcción)
+    finalized_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         indexes = [
             models.Index(fields=['empresa', 'zona', 'cultivo']),
             models.Index(fields=['generated_at']),
+            models.Index(fields=['empresa', 'finalized_at']),
+            models.Index(fields=['empresa', 'updated_at']),
         ]
         ordering = ['-generated_at']
 
@@ -56,6 +68,9 @@ class SessionReport(models.Model):
 class AggregatedReport(models.Model):
     """
     Datos agregados para dashboards (ETL / KPI).
+    Un registro por (empresa, zona, cultivo, día/mes) con los SessionReport
+    finalizados de ese bucket; se refresca en reports/rollups.py.
+    prevalence = {label: cantidad de reportes que la contienen}.
     """
     GRANULARITY_CHOICES = [
         ('daily', 'Daily'),
@@ -72,6 +87,7 @@ class AggregatedReport(models.Model):
     total_sessions = models.PositiveIntegerField(default=0)
     total_images = models.PositiveIntegerField(default=0)
     total_detections = models.PositiveIntegerField(default=0)
+    total_suspicious = models.PositiveIntegerField(default=0)
     avg_confidence = models.FloatField(null=True, blank=True)
     top_labels = models.JSONField(default=list)
     prevalence = models.JSONField(default=dict)
@@ -85,3 +101,22 @@ class AggregatedReport(models.Model):
 
     def __str__(self):
         return f"AggregatedReport({self.empresa.name}, {self.date}, {self.granularity})"
+
+
+class RollupPendingBucket(models.Model):
+    """
+    Bucket de rollup afectado por un SessionReport borrado (los borrados no dejan
+    updated_at que reports/rollups.py pueda ver). Se consume en el próximo refresco.
+    Sin FKs: la fila sobrevive al borrado en cascada de zona/cultivo/empresa.
+    """
+    empresa_id = models.BigIntegerField()
+    zona_id = models.BigIntegerField()
+    cultivo_id = models.BigIntegerField()
+    day = models.DateField()   # fecha local de generated_at del reporte borrado
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['empresa_id'])]
+
+    def __str__(self):
+        return f"RollupPendingBucket({self.empresa_id}, {self.zona_id}, {self.cultivo_id}, {self.day})"
@@ -0,0 +1,219 @@
+# reports/rollups.py
+"""
+Rollups de SessionReport en AggregatedReport (diario y mensual por empresa/zona/cultivo).
+
+refresh_rollups() recalcula solo los buckets (zona, cultivo, día/mes) que
+contienen reportes finalizados modificados desde el último refresco
+(max(last_refreshed_at) de la empresa, menos un margen para transacciones que
+confirman tarde) o con reportes borrados (RollupPendingBucket, anotados por
+reports/signals.py); los buckets que quedan vacíos se eliminan. Con full=True se
+reconstruyen todos los buckets.
+
+metrics/ responde desde los rollups (rollup_metrics) cuando están al día y los
+filtros caen en bordes de bucket; así el costo depende de la cantidad de
+buckets y no de la cantidad de sesiones.
+"""
+from collections import Counter
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DateField, Max, Q
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from .metrics import rank_diseases, summarize
+from .models import AggregatedReport, RollupPendingBucket, SessionReport
+
+
+ROLLUP_SAFETY_SECONDS = getattr(settings, 'REPORTS_ROLLUP_SAFETY_SECONDS', 60)
+TOP_LABELS = 5
+
+ROLLUP_FIELDS = {
+    'detections': 'total_detections',
+    'suspicious': 'total_suspicious',
+    'confidence': 'avg_confidence',
+    'date': 'date',
+}
+BUCKET_FIELDS = [
+    'total_sessions', 'total_images', 'total_detections', 'total_suspicious',
+    'avg_confidence', 'top_labels', 'prevalence', 'last_refreshed_at',
+]
+GRANULARITIES = ('daily', 'monthly')
+
+
+def finalized_reports(empresa_id):
+    return SessionReport.objects.filter(empresa_id=empresa_id, finalized_at__isnull=False)
+
+
+def watermark(empresa_id):
+    """Último refresco de los rollups de la empresa (None si nunca se generaron)."""
+    return AggregatedReport.objects.filter(empresa_id=empresa_id).aggregate(m=Max('last_refreshed_at'))['m']
+
+
+def _bucket_of(granularity):
+    if granularity == 'daily':
+        return TruncDate('generated_at')
+    return TruncMonth('generated_at', output_field=DateField())
+
+
+def _month_end(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _aggregate(reports, granularity):
+    """{(zona_id, cultivo_id, fecha): stats} recorriendo una vez los reportes dados."""
+    buckets = {}
+    rows = reports.order_by().annotate(bucket=_bucket_of(granularity)).values(
+        'zona_id', 'cultivo_id', 'bucket', 'images_count', 'detections_count',
+        'suspicious_detections_count', 'average_confidence', 'unique_labels',
+        'label_histogram', 'top_labels',
+    )
+    for row in rows.iterator(chunk_size=2000):
+        stats = buckets.setdefault((row['zona_id'], row['cultivo_id'], row['bucket']), {
+            'sessions': 0, 'images': 0, 'detections': 0, 'suspicious': 0,
+            'confidence': 0.0, 'labels': Counter(), 'prevalence': Counter(),
+        })
+        detections = row['detections_count'] or 0
+        stats['sessions'] += 1
+        stats['images'] += row['images_count'] or 0
+        stats['detections'] += detections
+        stats['suspicious'] += row['suspicious_detections_count'] or 0
+        stats['confidence'] += (row['average_confidence'] or 0) * detections
+        stats['prevalence'].update(row['unique_labels'] or [])
+        # Reportes previos al estado incremental solo guardan el top
+        stats['labels'].update(
+            row['label_histogram'] or {t['classification']: t['count'] for t in row['top_labels'] or []}
+        )
+    return buckets
+
+
+def _rows(empresa_id, granularity, buckets, refreshed_at):
+    return [
+        AggregatedReport(
+            empresa_id=empresa_id, zona_id=zona_id, cultivo_id=cultivo_id,
+            date=day, granularity=granularity,
+            total_sessions=stats['sessions'],
+            total_images=stats['images'],
+            total_detections=stats['detections'],
+            total_suspicious=stats['suspicious'],
+            avg_confidence=stats['confidence'] / stats['detections'] if stats['detections'] else None,
+            top_labels=[
+                {'classification': label, 'count': count}
+                for label, count in sorted(stats['labels'].items(), key=lambda item: (-item[1], item[0]))[:TOP_LABELS]
+            ],
+            prevalence=dict(stats['prevalence']),
+            last_refreshed_at=refreshed_at,
+        )
+        for (zona_id, cultivo_id, day), stats in buckets.items()
+    ]
+
+
+def _pending_buckets(pending, granularity):
+    """Buckets de reportes borrados (RollupPendingBucket) en la granularidad dada."""
+    return {
+        (zona_id, cultivo_id, day if granularity == 'daily' else day.replace(day=1))
+        for zona_id, cultivo_id, day in pending
+    }
+
+
+def _touched(reports, granularity, since, pending=()):
+    """Buckets con reportes modificados después de `since` o con reportes borrados."""
+    return set(
+        reports.filter(updated_at__gt=since).order_by()
+        .annotate(bucket=_bucket_of(granularity))
+        .values_list('zona_id', 'cultivo_id', 'bucket').distinct()
+    ) | _pending_buckets(pending, granularity)
+
+
+def refresh_rollups(empresa_id, full=False):
+    """Refresca los rollups diarios y mensuales de la empresa. Devuelve los buckets escritos."""
+    refreshed_at = timezone.now()
+    reports = finalized_reports(empresa_id)
+    since = None if full else watermark(empresa_id)
+
+    written = 0
+    with transaction.atomic():
+        # Se consumen solo las filas leídas aquí: las que lleguen durante el refresco quedan para el próximo
+        pending_rows = list(
+            RollupPendingBucket.objects.filter(empresa_id=empresa_id).values_list('pk', 'zona_id', 'cultivo_id', 'day')
+        )
+        pending = [row[1:] for row in pending_rows]
+        if since is None:
+            AggregatedReport.objects.filter(empresa_id=empresa_id).delete()
+
+        for granularity in GRANULARITIES:
+            if since is None:
+                buckets = _aggregate(reports, granularity)
+            else:
+                touched = _touched(reports, granularity, since - timedelta(seconds=ROLLUP_SAFETY_SECONDS), pending)
+                if not touched:
+                    continue
+                first = min(day for _, _, day in touched)
+                last = max(day for _, _, day in touched)
+                if granularity == 'monthly':
+                    last = _month_end(last) - timedelta(days=1)
+                scoped = reports.filter(
+                    cultivo_id__in={cultivo_id for _, cultivo_id, _ in touched},
+                    generated_at__date__gte=first,
+                    generated_at__date__lte=last,
+                )
+                buckets = {key: stats for key, stats in _aggregate(scoped, granularity).items() if key in touched}
+                _delete_buckets(empresa_id, granularity, touched - buckets.keys())
+
+            rows = _rows(empresa_id, granularity, buckets, refreshed_at)
+            AggregatedReport.objects.bulk_create(
+                rows,
+                batch_size=2000,
+                update_conflicts=True,
+                unique_fields=['empresa', 'zona', 'cultivo', 'date', 'granularity'],
+                update_fields=BUCKET_FIELDS,
+            )
+            written += len(rows)
+        RollupPendingBucket.objects.filter(pk__in=[row[0] for row in pending_rows]).delete()
+    return written
+
+
+def _delete_buckets(empresa_id, granularity, keys):
+    """Borra los AggregatedReport de buckets que quedaron sin reportes."""
+    if not keys:
+        return
+    match = Q()
+    for zona_id, cultivo_id, day in keys:
+        match |= Q(zona_id=zona_id, cultivo_id=cultivo_id, date=day)
+    AggregatedReport.objects.filter(match, empresa_id=empresa_id, granularity=granularity).delete()
+
+
+def is_fresh(empresa_id):
+    """True si ningún reporte finalizado cambió ni se borró desde el último refresco."""
+    mark = watermark(empresa_id)
+    return (
+        mark is not None
+        and not RollupPendingBucket.objects.filter(empresa_id=empresa_id).exists()
+        and not finalized_reports(empresa_id).filter(updated_at__gt=mark).exists()
+    )
+
+
+def rollup_metrics(empresa_id, period='month', date_from=None, cultivo_id=None, zona_id=None):
+    """
+    Respuesta de metrics/ desde AggregatedReport, o None si los rollups no sirven
+    (desactualizados, o date_from no es un día/mes completo).
+    """
+    if date_from is not None and not isinstance(date_from, date):
+        return None
+    if not is_fresh(empresa_id):
+        return None
+
+    monthly = period in ('month', 'year') and (date_from is None or date_from.day == 1)
+    rows = AggregatedReport.objects.filter(empresa_id=empresa_id, granularity='monthly' if monthly else 'daily')
+    if date_from is not None:
+        rows = rows.filter(date__gte=date_from)
+    if cultivo_id:
+        rows = rows.filter(cultivo_id=cultivo_id)
+    if zona_id:
+        rows = rows.filter(zona_id=zona_id)
+
+    prevalence = Counter()
+    for bucket in rows.order_by().values_list('prevalence', flat=True).iterator(chunk_size=2000):
+        prevalence.update(bucket or {})
+    return summarize(rows, period, rank_diseases(prevalence), ROLLUP_FIELDS)
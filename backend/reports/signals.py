@@ -1,83 +1,68 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from django.utils import timezone
 from scanners.models import ScannerSession
+from scanners.signals import results_changed, sessions_synced
+from .cache import invalidate_metrics
+from .models import RollupPendingBucket, SessionReport
 
 
-@receiver(post_save, sender=ScannerSession)
-def on_session_finished(sender, instance, created, **kwargs):
+def _schedule_report(session):
     """
-    Genera un reporte automáticamente cuando la sesión se marca como COMPLETED.
+    Programa la finalización del reporte cuando la sesión se marca como COMPLETED.
+    Corre fuera del request, después del commit (ver core.background).
     """
-    # Solo generar si la sesión está completada
-    if instance.status == 'COMPLETED' and instance.finished_at:
-        from .models import SessionReport
-        from django.db.models import Avg, Count
-        import statistics
+    if session.status == 'COMPLETED' and session.finished_at:
+        from core.background import dispatch
+        from .tasks import generate_session_report_async
 
-        # Evitar crear reportes duplicados
-        if SessionReport.objects.filter(session=instance).exists():
-            print(f"Reporte ya existe para sesión {instance.session_id}")
-            return
+        dispatch(
+            f"session-report:{session.session_id}",
+            generate_session_report_async,
+            session.session_id,
+        )
 
-        try:
-            # Obtener datos de la sesión
-            images = instance.images.all()
-            results = instance.scan_results.all()
 
-            detections_count = results.count()
+@receiver(post_save, sender=ScannerSession)
+def on_session_finished(sender, instance, created, **kwargs):
+    _schedule_report(instance)
 
-            # Obtener todas las clasificaciones
-            labels = list(results.values_list('classification', flat=True))
-            confidences = [r.confidence for r in results]
 
-            # detecciones con plaga vs sanas
-            plague_labels = [label for label in labels if 'Healthy' not in label]
-            suspicious_detections_count = len(plague_labels)
-            healthy_detections_count = detections_count - suspicious_detections_count
+@receiver(sessions_synced)
+def on_sessions_synced(sender, sessions, **kwargs):
+    """Igual que on_session_finished para las sesiones escritas en bloque por el sync."""
+    for session in sessions:
+        _schedule_report(session)
 
-            # Top 5 clasificaciones más comunes
-            top_labels = (
-                results.values('classification')
-                .annotate(count=Count('classification'))
-                .order_by('-count')[:5]
-            )
 
-            # Estadísticas de confianza
-            avg_conf = statistics.mean(confidences) if confidences else 0.0
-            med_conf = statistics.median(confidences) if confidences else 0.0
+@receiver(results_changed)
+def on_results_changed(sender, previous, current, **kwargs):
+    """Aplica el lote de resultados a los SessionReport en la misma transacción."""
+    from .incremental import apply_result_changes
 
-            # Promedios de ubicación
-            lat_avg = images.aggregate(avg_lat=Avg('latitude'))['avg_lat']
-            lon_avg = images.aggregate(avg_lon=Avg('longitude'))['avg_lon']
+    apply_result_changes(previous, current)
 
-            # Flag de baja confianza (si el promedio es menor a 60%)
-            low_confidence = avg_conf < 0.6
 
-            # Crear reporte
-            report = SessionReport.objects.create(
-                session=instance,
-                empresa=instance.empresa,
-                zona=instance.zona,
-                cultivo=instance.cultivo,
-                owner=instance.owner,
-                images_count=images.count(),
-                detections_count=detections_count,
-                suspicious_detections_count=suspicious_detections_count,
-                unique_labels=list(set(labels)),
-                top_labels=list(top_labels),
-                average_confidence=avg_conf,
-                median_confidence=med_conf,
-                lat_avg=lat_avg,
-                lon_avg=lon_avg,
-                low_confidence_flag=low_confidence,
-                suspicious_flag=(suspicious_detections_count > 0),
-            )
+@receiver(post_save, sender=SessionReport)
+def on_report_changed(sender, instance, **kwargs):
+    """Invalida la caché de metrics/ de la empresa (solo cuentan reportes finalizados)."""
+    if instance.finalized_at is not None:
+        invalidate_metrics(instance.empresa_id)
 
-            print(f"SessionReport {report.id} generado para sesión {instance.session_id}")
-            print(
-                f"   Detecciones: {detections_count} | Plagas: {suspicious_detections_count} | Sanas: {healthy_detections_count} | Confianza: {avg_conf:.2%}")
 
-        except Exception as e:
-            print(f"Error generando SessionReport para sesión {instance.session_id}: {e}")
-            import traceback
-            traceback.print_exc()
\ No newline at end of file
+@receiver(post_delete, sender=SessionReport)
+def on_report_deleted(sender, instance, **kwargs):
+    """
+    Un reporte finalizado borrado (p. ej. en cascada desde la sesión) no deja rastro
+    en updated_at: se anota su bucket para que los rollups lo recalculen.
+    """
+    if instance.finalized_at is None:
+        return
+    from .incremental import schedule_rollup_refresh
+
+    RollupPendingBucket.objects.create(
+        empresa_id=instance.empresa_id, zona_id=instance.zona_id, cultivo_id=instance.cultivo_id,
+        day=timezone.localdate(instance.generated_at),
+    )
+    invalidate_metrics(instance.empresa_id)
+    schedule_rollup_refresh(instance.empresa_id)
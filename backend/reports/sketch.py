@@ -0,0 +1,55 @@
+# reports/sketch.py
+"""
+Sketch de cuantiles para la confianza (valores en [0, 1]).
+
+Es un histograma de ancho fijo: se combina sumando buckets y admite restas
+(un resultado re-sincronizado con otra confianza), algo que los sketches
+aleatorios no permiten. El error de un cuantil es menor al ancho de un bucket.
+"""
+BUCKETS = 100
+
+
+def bucket_of(value):
+    value = min(max(float(value), 0.0), 1.0)
+    return min(int(value * BUCKETS), BUCKETS - 1)
+
+
+class ConfidenceSketch:
+    def __init__(self, counts=None):
+        counts = list(counts or [])
+        self.counts = counts + [0] * (BUCKETS - len(counts)) if len(counts) < BUCKETS else counts[:BUCKETS]
+
+    @property
+    def total(self):
+        return sum(self.counts)
+
+    def add(self, value, n=1):
+        self.counts[bucket_of(value)] += n
+
+    def remove(self, value, n=1):
+        index = bucket_of(value)
+        self.counts[index] = max(self.counts[index] - n, 0)
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        return self
+
+    def quantile(self, q):
+        """Cuantil q interpolando linealmente dentro del bucket."""
+        total = self.total
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                return (index + (rank - seen) / count) / BUCKETS
+            seen += count
+        return 1.0
+
+    def to_json(self):
+        # Se recorta la cola de ceros para no guardar 100 enteros por reporte
+        counts = list(self.counts)
+        while counts and not counts[-1]:
+            counts.pop()
+        return counts
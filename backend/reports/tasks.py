@@ -1,72 +1,39 @@
+import logging
+
 from celery import shared_task
-from django.db.models import Avg, Count
-from scanners.models import ScannerSession, ScannerResult
-from .models import SessionReport
-import statistics
+from scanners.models import ScannerSession
+from .incremental import finalize_session_report
+
+logger = logging.getLogger(__name__)
 
 
 @shared_task
 def generate_session_report_async(session_id):
     """
-    Genera un reporte de sesión de forma asíncrona.
+    Finaliza el reporte de una sesión de forma asíncrona.
+
+    Las métricas de resultados se mantienen incrementalmente (reports.incremental);
+    aquí solo se agregan las imágenes y se marca finalized_at. Los errores se
+    propagan (core.background los registra; celery los ve como fallos).
 
     Args:
         session_id: UUID de la sesión (session_id, no id)
     """
     try:
-        # Usar session_id como primary key
-        session = ScannerSession.objects.get(session_id=session_id)
-        images = session.images.all()
-
-        # Filtrar por session directamente
-        results = ScannerResult.objects.filter(session=session)
-
-        detections_count = results.count()
-
-        # Usar 'classification'
-        labels = list(results.values_list('classification', flat=True))
-        confidences = [r.confidence for r in results]
-
-        # Contar detecciones con plaga
-        plague_labels = [label for label in labels if 'Healthy' not in label]
-        suspicious_detections_count = len(plague_labels)
-
-        top_labels = (
-            results.values('classification')
-            .annotate(count=Count('classification'))
-            .order_by('-count')[:5]
-        )
-
-        avg_conf = statistics.mean(confidences) if confidences else 0.0
-        med_conf = statistics.median(confidences) if confidences else 0.0
-
-        lat_avg = images.aggregate(avg_lat=Avg('latitude'))['avg_lat']
-        lon_avg = images.aggregate(avg_lon=Avg('longitude'))['avg_lon']
+        report = finalize_session_report(session_id)
+    except ScannerSession.DoesNotExist:
+        # La sesión se borró antes de que corriera la tarea: no hay nada que finalizar
+        logger.warning("Sesión %s no encontrada al finalizar su SessionReport", session_id)
+        return
+    logger.debug(
+        "SessionReport finalizado para sesión %s (total: %s, plagas: %s)",
+        session_id, report.detections_count, report.suspicious_detections_count,
+    )
 
-        SessionReport.objects.create(
-            session=session,
-            empresa=session.empresa,
-            zona=session.zona,
-            cultivo=session.cultivo,
-            owner=session.owner,
-            images_count=images.count(),
-            detections_count=detections_count,
-            suspicious_detections_count=suspicious_detections_count,
-            unique_labels=list(set(labels)),
-            top_labels=list(top_labels),
-            average_confidence=avg_conf,
-            median_confidence=med_conf,
-            lat_avg=lat_avg,
-            lon_avg=lon_avg,
-            low_confidence_flag=(avg_conf < 0.6),
-            suspicious_flag=(suspicious_detections_count > 0),
-        )
 
-        print(f"SessionReport generado para sesión {session_id}")
-        print(
-            f" Total: {detections_count}, Plagas: {suspicious_detections_count}, Sanas: {detections_count - suspicious_detections_count}")
+@shared_task
+def refresh_rollups_async(empresa_id):
+    """Refresca los AggregatedReport de la empresa (solo los buckets modificados)."""
+    from .rollups import refresh_rollups
 
-    except ScannerSession.DoesNotExist:
-        print(f"Sesión {session_id} no encontrada")
-    except Exception as e:
-        print(f"Error generando SessionReport para session {session_id}: {e}")
\ No newline at end of file
+    refresh_rollups(empresa_id)
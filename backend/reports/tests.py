@@ -1,3 +1,185 @@
-from django.test import TestCase
+import time
+from datetime import date, datetime
+from datetime import time as day_time
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from reports.builders import build_session_report
+from reports.cache import METRICS_CACHE_TTL, etag_for, invalidate_metrics, metrics_key, metrics_version
+from reports.metrics import compute_metrics
+from reports.models import SessionReport
+from reports.rollups import refresh_rollups, rollup_metrics
+from scanners.models import LabelTaxonomy, ScannerSession
+from scanners.sync import sync_results, sync_sessions
+from scanners.taxonomy import parse_label
+from scanners.tests import LABELS, ScannerFixtureMixin
+from zonecrop.models import Cultivo, Zona
+
+
+class MetricsCacheVersionTests(TestCase):
+    """La versión de metrics/ por empresa: invalidar cambia clave y ETag; nunca queda fija para siempre."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_invalidate_changes_key_and_etag(self):
+        params = {'period': 'month'}
+        before = metrics_key(1, params)
+        self.assertEqual(metrics_key(1, params), before)
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_metrics(1)
+        after = metrics_key(1, params)
+        self.assertNotEqual(etag_for(after), etag_for(before))
+
+    def test_version_expires_with_the_responses(self):
+        # Otro proceso con locmem no ve invalidate_metrics: su versión debe expirar igual que las respuestas
+        now = time.time()
+        with mock.patch('time.time', return_value=now):
+            version = metrics_version(1)
+            self.assertEqual(metrics_version(1), version)
+        with mock.patch('time.time', return_value=now + METRICS_CACHE_TTL + 1):
+            self.assertNotEqual(metrics_version(1), version)
+
+
+class ReportsFixtureMixin(ScannerFixtureMixin):
+    """Segunda zona/cultivo y sesiones sincronizadas con resultados de confianza variada."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for label in LABELS:
+            LabelTaxonomy.objects.create(classification=label, **parse_label(label))
+        zona = Zona.objects.create(nombre='Zona 2', empresa=cls.empresa)
+        cls.other_cultivo = Cultivo.objects.create(nombre='Maíz', zona=zona)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def payload(self, results, cultivo=None, completed=False, confidence=0.5):
+        payload = self.session_payload(results)
+        cultivo = cultivo or self.cultivo
+        payload.update(cultivo_id=cultivo.id, zona_id=cultivo.zona_id)
+        for i, result in enumerate(payload['scan_results']):
+            result['confidence'] = round(confidence + i * 0.07, 2)
+        if completed:
+            payload.update(status='COMPLETED', finished_at=timezone.now().isoformat())
+        return payload
+
+    def sync(self, *payloads):
+        with self.captureOnCommitCallbacks(execute=True):
+            synced, errors = sync_sessions(list(payloads), self.user)
+        self.assertEqual(errors, [])
+        return payloads
+
+    def assertReportMatchesRebuild(self, session_id):
+        """El reporte incremental coincide con reconstruirlo desde los resultados."""
+        report = SessionReport.objects.get(session_id=session_id)
+        expected = build_session_report(ScannerSession.objects.get(pk=session_id))
+        for field in ('detections_count', 'suspicious_detections_count', 'label_histogram',
+                      'suspicious_flag', 'low_confidence_flag'):
+            self.assertEqual(getattr(report, field), expected[field], field)
+        self.assertEqual(sorted(report.unique_labels), sorted(expected['unique_labels']))
+        self.assertAlmostEqual(report.confidence_sum, expected['confidence_sum'])
+        self.assertAlmostEqual(report.average_confidence, expected['average_confidence'])
+        self.assertEqual(report.confidence_sketch, expected['confidence_sketch'])
+
+
+@override_settings(BACKGROUND_TASK_BACKEND='sync')
+class IncrementalSessionReportTests(ReportsFixtureMixin, TestCase):
+    """Cada lote de resultados actualiza el SessionReport por deltas, sin recalcular la sesión."""
+
+    def test_batches_update_the_report(self):
+        payload, = self.sync(self.payload(4))
+        session_id = payload['session_id']
+        self.assertReportMatchesRebuild(session_id)
+
+        # Reclasificar uno, agregar otros y repetir uno sin cambios
+        changed = {**payload['scan_results'][0], 'classification': LABELS[1], 'confidence': 0.99,
+                   'session': session_id}
+        added = [{**r, 'session': session_id} for r in self.session_payload(3)['scan_results']]
+        same = {**payload['scan_results'][1], 'session': session_id}
+        with self.captureOnCommitCallbacks(execute=True):
+            synced, errors = sync_results([changed, same, *added], self.empresa)
+        self.assertEqual(errors, [])
+        self.assertEqual(SessionReport.objects.get(session_id=session_id).detections_count, 7)
+        self.assertReportMatchesRebuild(session_id)
+
+        # Borrar desde la API
+        response = self.client.delete(f"/api/scanners/results/{payload['scan_results'][2]['result_id']}/")
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(SessionReport.objects.get(session_id=session_id).detections_count, 6)
+        self.assertReportMatchesRebuild(session_id)
+
+    def test_completed_session_is_finalized(self):
+        payload, = self.sync(self.payload(3, completed=True))
+        report = SessionReport.objects.get(session_id=payload['session_id'])
+        self.assertIsNotNone(report.finalized_at)
+        self.assertReportMatchesRebuild(payload['session_id'])
+
+
+@override_settings(BACKGROUND_TASK_BACKEND='sync')
+class RollupMetricsTests(ReportsFixtureMixin, TestCase):
+    """metrics/ desde AggregatedReport responde lo mismo que agregando los SessionReport."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        days = [date(2025, 1, 5), date(2025, 1, 20), date(2025, 2, 3), date(2025, 3, 15), date(2025, 3, 15)]
+        for i, day in enumerate(days):
+            cultivo = self.cultivo if i % 2 else self.other_cultivo
+            payload, = self.sync(self.payload(2 + i, cultivo=cultivo, completed=True, confidence=0.4 + i * 0.05))
+            moment = timezone.make_aware(datetime.combine(day, day_time(12)))
+            SessionReport.objects.filter(session_id=payload['session_id']).update(generated_at=moment)
+        refresh_rollups(self.empresa.pk, full=True)
+
+    def direct(self, period, date_from=None, cultivo_id=None):
+        reports = SessionReport.objects.filter(empresa=self.empresa, finalized_at__isnull=False)
+        if date_from:
+            reports = reports.filter(generated_at__gte=timezone.make_aware(datetime.combine(date_from, day_time.min)))
+        if cultivo_id:
+            reports = reports.filter(cultivo_id=cultivo_id)
+        return compute_metrics(reports, period)
+
+    def test_equivalent_to_direct_metrics(self):
+        for period in ('day', 'week', 'month', 'year'):
+            with self.subTest(period=period):
+                self.assertEqual(rollup_metrics(self.empresa.pk, period), self.direct(period))
+
+    def test_equivalent_with_filters(self):
+        self.assertEqual(
+            rollup_metrics(self.empresa.pk, 'month', date(2025, 2, 1)), self.direct('month', date(2025, 2, 1)),
+        )
+        self.assertEqual(
+            rollup_metrics(self.empresa.pk, 'day', cultivo_id=self.cultivo.pk),
+            self.direct('day', cultivo_id=self.cultivo.pk),
+        )
+
+    def test_stale_rollups_are_not_used(self):
+        # Reporte modificado sin que corra el refresco (p. ej. la tarea aún en cola)
+        with mock.patch('reports.incremental.schedule_rollup_refresh'):
+            self.sync(self.payload(2, completed=True))
+        self.assertIsNone(rollup_metrics(self.empresa.pk, 'month'))
+        refresh_rollups(self.empresa.pk)
+        self.assertEqual(rollup_metrics(self.empresa.pk, 'month'), self.direct('month'))
+
+    def test_endpoint_etag(self):
+        url = '/api/reports/session-reports/metrics/'
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.data['summary']['total_reports'], self.direct('month')['summary']['total_reports'])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        # Un reporte nuevo finalizado invalida la versión: otro ETag y datos al día
+        self.sync(self.payload(1, completed=True))
+        second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second.data['summary']['total_reports'], first.data['summary']['total_reports'] + 1)
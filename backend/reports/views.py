@@ -3,10 +3,13 @@ from rest_framework.permissions import IsAuthenticated
 from .models import SessionReport, AggregatedReport
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import Count, Avg, Q, F
-from django.db.models.functions import TruncDate, TruncWeek, TruncMonth, TruncYear
-from datetime import datetime, timedelta
-from collections import defaultdict
+from datetime import datetime
+from core.pagination import KeysetPagination
+from django.utils.dateparse import parse_date
+from django.utils.http import parse_etags
+from .cache import cached_metrics, etag_for, metrics_key, normalize_params
+from .metrics import compute_metrics
+from .rollups import rollup_metrics
 from .serializers import SessionReportSerializer, AggregatedReportSerializer
 
 
@@ -17,25 +20,46 @@ class SessionReportViewSet(viewsets.ReadOnlyModelViewSet):
     """
     permission_classes = [IsAuthenticated]
     serializer_class = SessionReportSerializer
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-generated_at', '-id')
 
     def get_queryset(self):
         """Filtrar reportes por empresa del usuario"""
         user = self.request.user
         if hasattr(user, 'empresa'):
-            return SessionReport.objects.filter(empresa=user.empresa).order_by('-generated_at')
+            return SessionReport.objects.filter(empresa=user.empresa, finalized_at__isnull=False).order_by('-generated_at')
         return SessionReport.objects.none()
 
     @action(detail=False, methods=['get'])
     def metrics(self, request):
         """
-        Obtiene métricas agregadas de reportes.
+        Obtiene métricas agregadas de reportes (ver reports/metrics.py).
+        Respuesta cacheada por empresa y filtros; admite If-None-Match (304).
         """
         user = request.user
         if not hasattr(user, 'empresa'):
             return Response({})
 
+        key = metrics_key(user.empresa.pk, normalize_params(request.query_params))
+        etag = etag_for(key)
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and (if_none_match.strip() == '*' or etag in parse_etags(if_none_match)):
+            response = Response(status=304)
+        else:
+            response = Response(cached_metrics(key, lambda: self._compute_metrics(request)))
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def _metrics_data(self, request):
+        key = metrics_key(request.user.empresa.pk, normalize_params(request.query_params))
+        return cached_metrics(key, lambda: self._compute_metrics(request))
+
+    def _compute_metrics(self, request):
+        user = request.user
+
         # Filtros base
-        reports = SessionReport.objects.filter(empresa=user.empresa)
+        reports = SessionReport.objects.filter(empresa=user.empresa, finalized_at__isnull=False)
 
         # Filtros opcionales
         period = request.query_params.get('period', 'month')
@@ -53,168 +77,18 @@ class SessionReportViewSet(viewsets.ReadOnlyModelViewSet):
         if zona_id:
             reports = reports.filter(zona_id=zona_id)
 
-        # Contar usando suspicious_detections_count
-        total_reports = 0
-        reports_with_plagues = 0
-        reports_healthy = 0
-        all_labels = []
-        total_confidence = 0
-
-        for session in reports:
-            # Total de detecciones
-            session_detections = session.detections_count or 0
-            total_reports += session_detections
-
-            # Detecciones con plaga (del nuevo campo)
-            session_plagues = session.suspicious_detections_count or 0
-            reports_with_plagues += session_plagues
-
-            # Sanas = Total - Plagas
-            reports_healthy += (session_detections - session_plagues)
-
-            # Acumular etiquetas
-            if session.unique_labels:
-                all_labels.extend(session.unique_labels)
-
-            # Acumular confianza
-            if session.average_confidence:
-                total_confidence += session.average_confidence * session_detections
-
-        avg_confidence = (total_confidence / total_reports) if total_reports > 0 else 0
-
-        # Distribución de plagas vs sanas
-        plague_distribution = {
-            'healthy': reports_healthy,
-            'with_plague': reports_with_plagues,
-            'total': total_reports
-        }
-
-        # Top clasificaciones (enfermedades más comunes)
-        label_counts = defaultdict(int)
-        for label in all_labels:
-            if 'Healthy' not in label and 'healthy' not in label.lower():
-                label_counts[label] += 1
-
-        top_diseases = [
-            {'label': label, 'count': count}
-            for label, count in sorted(label_counts.items(), key=lambda x: x[1], reverse=True)[:10]
-        ]
+        # Con filtros alineados a días/meses se responde desde los rollups (AggregatedReport)
+        if not date_to:
+            try:
+                day_from = parse_date(date_from) if date_from else None
+            except ValueError:
+                day_from = None
+            if day_from or not date_from:
+                data = rollup_metrics(user.empresa.pk, period, day_from, cultivo_id, zona_id)
+                if data is not None:
+                    return data
 
-        # Distribución por cultivo
-        cultivo_stats = []
-        for cultivo_group in reports.values('cultivo__nombre').annotate(session_count=Count('id')):
-            cultivo_name = cultivo_group['cultivo__nombre']
-            cultivo_sessions = reports.filter(cultivo__nombre=cultivo_name)
-
-            cultivo_total = 0
-            cultivo_plagues = 0
-
-            for s in cultivo_sessions:
-                s_detections = s.detections_count or 0
-                s_plagues = s.suspicious_detections_count or 0
-
-                cultivo_total += s_detections
-                cultivo_plagues += s_plagues
-
-            cultivo_healthy = cultivo_total - cultivo_plagues
-
-            if cultivo_total > 0:
-                cultivo_stats.append({
-                    'cultivo__nombre': cultivo_name,
-                    'total': cultivo_total,
-                    'with_plague': cultivo_plagues,
-                    'healthy': cultivo_healthy
-                })
-
-        cultivo_stats.sort(key=lambda x: x['total'], reverse=True)
-
-        # Distribución por zona
-        zona_stats = []
-        for zona_group in reports.values('zona__nombre').annotate(session_count=Count('id')):
-            zona_name = zona_group['zona__nombre']
-            zona_sessions = reports.filter(zona__nombre=zona_name)
-
-            zona_total = 0
-            zona_plagues = 0
-
-            for s in zona_sessions:
-                s_detections = s.detections_count or 0
-                s_plagues = s.suspicious_detections_count or 0
-
-                zona_total += s_detections
-                zona_plagues += s_plagues
-
-            zona_healthy = zona_total - zona_plagues
-
-            if zona_total > 0:
-                zona_stats.append({
-                    'zona__nombre': zona_name,
-                    'total': zona_total,
-                    'with_plague': zona_plagues,
-                    'healthy': zona_healthy
-                })
-
-        zona_stats.sort(key=lambda x: x['total'], reverse=True)
-
-        # Tendencia temporal
-        trunc_func = {
-            'day': TruncDate,
-            'week': TruncWeek,
-            'month': TruncMonth,
-            'year': TruncYear
-        }.get(period, TruncMonth)
-
-        timeline_data = reports.annotate(
-            period=trunc_func('generated_at')
-        ).values('period').annotate(
-            session_count=Count('id')
-        ).order_by('period')
-
-        timeline = []
-        for item in timeline_data:
-            period_sessions = reports.annotate(
-                period_trunc=trunc_func('generated_at')
-            ).filter(period_trunc=item['period'])
-
-            period_total = 0
-            period_plagues = 0
-            period_confidence = 0
-
-            for s in period_sessions:
-                s_detections = s.detections_count or 0
-                s_plagues = s.suspicious_detections_count or 0
-
-                period_total += s_detections
-                period_plagues += s_plagues
-
-                if s.average_confidence:
-                    period_confidence += s.average_confidence * s_detections
-
-            period_healthy = period_total - period_plagues
-            period_avg_confidence = (period_confidence / period_total) if period_total > 0 else 0
-
-            timeline.append({
-                'date': item['period'].isoformat() if item['period'] else None,
-                'total': period_total,
-                'with_plague': period_plagues,
-                'healthy': period_healthy,
-                'avg_confidence': round(period_avg_confidence, 2)
-            })
-
-        return Response({
-            'summary': {
-                'total_reports': total_reports,
-                'reports_with_plagues': reports_with_plagues,
-                'reports_healthy': reports_healthy,
-                'avg_confidence': round(avg_confidence, 2),
-                'plague_percentage': round((reports_with_plagues / total_reports * 100) if total_reports > 0 else 0, 1)
-            },
-            'plague_distribution': plague_distribution,
-            'top_diseases': top_diseases,
-            'by_cultivo': cultivo_stats,
-            'by_zona': zona_stats,
-            'timeline': timeline
-        })
+        return compute_metrics(reports, period)
 
     @action(detail=False, methods=['get'])
     def export_pdf(self, request):
@@ -236,9 +110,8 @@ class SessionReportViewSet(viewsets.ReadOnlyModelViewSet):
         if not hasattr(user, 'empresa'):
             return Response({'error': 'Usuario sin empresa'}, status=400)
 
-        # Obtener métricas (reutilizar lógica)
-        metrics_view = self.metrics(request)
-        metrics = metrics_view.data
+        # Obtener métricas (misma caché que metrics/)
+        metrics = self._metrics_data(request)
 
         # Crear PDF
         buffer = BytesIO()
@@ -360,6 +233,8 @@ class AggregatedReportViewSet(viewsets.ReadOnlyModelViewSet):
     """
     permission_classes = [IsAuthenticated]
     serializer_class = AggregatedReportSerializer
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-date', '-id')
 
     def get_queryset(self):
         """Filtrar por empresa del usuario"""
@@ -1,6 +1,6 @@
 # scanners/admin.py
 from django.contrib import admin
-from .models import ScannerSession, ScannerImage, ScannerResult, ModelVersion
+from .models import ScannerSession, ScannerImage, ScannerResult, ModelVersion, LabelTaxonomy
 
 @admin.register(ScannerSession)
 class ScannerSessionAdmin(admin.ModelAdmin):
@@ -11,4 +11,16 @@ class ScannerSessionAdmin(admin.ModelAdmin):
 @admin.register(ScannerResult)
 class ScannerResultAdmin(admin.ModelAdmin):
     list_display = ['result_id', 'session', 'classification', 'confidence', 'has_plague']
-    list_filter = ['has_plague', 'classification']
\ No newline at end of file
+    list_filter = ['has_plague', 'label']
+    list_select_related = ['label']
+
+@admin.register(LabelTaxonomy)
+class LabelTaxonomyAdmin(admin.ModelAdmin):
+    list_display = ['classification', 'crop', 'disease', 'is_healthy', 'confidence_threshold', 'calibrated_at']
+    list_filter = ['is_healthy', 'crop']
+    list_editable = ['is_healthy', 'confidence_threshold']
+    search_fields = ['classification', 'disease']
+
+    def get_readonly_fields(self, request, obj=None):
+        # Los resultados guardan el id: renombrar una etiqueta cambiaría resultados ya escritos
+        return ['classification'] if obj else []
@@ -5,3 +5,6 @@ class ScannersConfig(AppConfig):
     name = 'scanners'
     label = 'scanners'
     verbose_name = 'Módulo de Escaneo e Inferencia de Imágenes'
+
+    def ready(self):
+        import scanners.signals  # noqa
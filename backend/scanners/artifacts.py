@@ -0,0 +1,195 @@
+# scanners/artifacts.py
+"""
+Artefactos de modelos (.tflite) servidos por el backend.
+
+register_model() sube el archivo a models/{name}/{version}.tflite, guarda
+sha256, tamaño y etiquetas en el ModelVersion y, si bsdiff4 está instalado,
+genera el parche binario desde la versión anterior del mismo modelo
+(models/{name}/{anterior}-{version}.patch). Un teléfono con la versión
+anterior baja solo el parche y lo aplica con bspatch. Si se vuelve a
+registrar una versión con otro artefacto, sus parches se borran y se regeneran.
+
+serve_artifact() responde la descarga con ETag (el sha256), 304 ante un
+If-None-Match vigente y 206 para `Range: bytes=...` (reanudar descargas
+cortadas en conexiones rurales).
+"""
+import hashlib
+import os
+import re
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponse, StreamingHttpResponse
+
+from .models import ModelPatch, ModelVersion
+from .taxonomy import load_taxonomy
+
+
+MODELS_PREFIX = 'models/'
+STREAM_CHUNK_SIZE = 256 * 1024
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class ArtifactError(Exception):
+    """El artefacto no se puede registrar o el parche no se puede generar."""
+
+
+def _bucket():
+    return settings.AWS_STORAGE_BUCKET_NAME
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def read_artifact(key):
+    from cropcareBackend.object_storage import get_client
+
+    return get_client().get_object(Bucket=_bucket(), Key=key)['Body'].read()
+
+
+def build_patch(previous, model_version, data):
+    """Parche bsdiff previous -> model_version (data: bytes de la versión nueva)."""
+    try:
+        import bsdiff4
+    except ImportError:
+        raise ArtifactError("bsdiff4 no está instalado: no se generan parches.")
+    from cropcareBackend.object_storage import get_client
+
+    patch = bsdiff4.diff(read_artifact(previous.file_path), data)
+    key = f"{MODELS_PREFIX}{model_version.name}/{previous.version}-{model_version.version}.patch"
+    get_client().put_object(Bucket=_bucket(), Key=key, Body=patch, ContentType='application/octet-stream')
+    model_patch, _ = ModelPatch.objects.update_or_create(
+        from_version=previous, to_version=model_version,
+        defaults={'file_path': key, 'sha256': _digest(patch), 'size': len(patch)},
+    )
+    return model_patch
+
+
+def register_model(name, version, data, labels, framework='tflite'):
+    """
+    Sube el artefacto y crea (o actualiza) el ModelVersion.
+    Devuelve (model_version, patch | None, motivo si no hubo parche).
+    """
+    from cropcareBackend.object_storage import get_client
+
+    key = f"{MODELS_PREFIX}{name}/{version}.{framework}"
+    sha256 = _digest(data)
+    client = get_client()
+    client.put_object(Bucket=_bucket(), Key=key, Body=data, ContentType='application/octet-stream')
+    with transaction.atomic():
+        stored = ModelVersion.objects.filter(name=name, version=version).values_list('sha256', flat=True).first()
+        model_version, _ = ModelVersion.objects.update_or_create(
+            name=name, version=version,
+            defaults={
+                'framework': framework, 'file_path': key, 'sha256': sha256,
+                'size': len(data), 'labels': labels,
+            },
+        )
+        load_taxonomy(labels)
+        # Artefacto nuevo para una versión existente: sus parches (hacia y desde ella) ya no aplican
+        stale = []
+        if stored and stored != sha256:
+            stale = list(ModelPatch.objects.filter(
+                Q(from_version=model_version) | Q(to_version=model_version)
+            ).select_related('to_version'))
+            ModelPatch.objects.filter(pk__in=[p.pk for p in stale]).delete()
+    if stale:
+        client.delete_objects(
+            Bucket=_bucket(), Delete={'Objects': [{'Key': p.file_path} for p in stale], 'Quiet': True},
+        )
+        # Los parches hacia versiones siguientes se regeneran desde el artefacto nuevo
+        for patch in stale:
+            if patch.from_version_id == model_version.pk:
+                try:
+                    build_patch(model_version, patch.to_version, read_artifact(patch.to_version.file_path))
+                except ArtifactError:
+                    pass
+
+    previous = (
+        ModelVersion.objects.filter(name=name, created_at__lt=model_version.created_at)
+        .exclude(sha256='').order_by('-created_at').first()
+    )
+    if previous is None:
+        return model_version, None, "primera versión del modelo"
+    try:
+        return model_version, build_patch(previous, model_version, data), None
+    except ArtifactError as e:
+        return model_version, None, str(e)
+
+
+# ------------------- DESCARGA -------------------
+def _parse_range(header, size):
+    """(inicio, fin inclusivo) de un Range de un solo tramo, None si no aplica, o False si no es satisfacible."""
+    match = _RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    start, end = match.groups()
+    if start == '' and end == '':
+        return None
+    if start == '':
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def _etag_matches(header, etag):
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    return etag in [tag.strip().removeprefix('W/') for tag in header.split(',')]
+
+
+def serve_artifact(request, key, sha256, size, filename):
+    """Respuesta de descarga con ETag/304 y Range/206 para un objeto del bucket."""
+    from cropcareBackend.object_storage import get_client
+
+    etag = f'"{sha256}"'
+    headers = {'ETag': etag, 'Accept-Ranges': 'bytes', 'Cache-Control': 'private, max-age=0, must-revalidate'}
+
+    if _etag_matches(request.headers.get('If-None-Match'), etag):
+        response = HttpResponse(status=304)
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    byte_range = _parse_range(request.headers.get('Range'), size)
+    # If-Range con otro ETag: el archivo cambió, se manda completo
+    if byte_range and request.headers.get('If-Range', etag) != etag:
+        byte_range = None
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    params = {'Bucket': _bucket(), 'Key': key}
+    if byte_range:
+        params['Range'] = f'bytes={byte_range[0]}-{byte_range[1]}'
+    body = get_client().get_object(**params)['Body']
+
+    response = StreamingHttpResponse(
+        iter(lambda: body.read(STREAM_CHUNK_SIZE), b''),
+        status=206 if byte_range else 200,
+        content_type='application/octet-stream',
+    )
+    for name, value in headers.items():
+        response[name] = value
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    if byte_range:
+        response['Content-Range'] = f'bytes {byte_range[0]}-{byte_range[1]}/{size}'
+        response['Content-Length'] = str(byte_range[1] - byte_range[0] + 1)
+    else:
+        response['Content-Length'] = str(size)
+    return response
+
+
+def artifact_filename(model_version):
+    return os.path.basename(model_version.file_path or f"{model_version.name}-{model_version.version}.tflite")
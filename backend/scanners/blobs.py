@@ -0,0 +1,193 @@
+# scanners/blobs.py
+"""
+Almacenamiento de fotos por contenido.
+
+Cada foto subida por Django se guarda una sola vez en
+scanner_photos/blobs/{sha[:2]}/{sha}.jpg y los resultados apuntan a esa key
+desde photo_path. PhotoBlob.refcount cuenta los resultados que la usan: sube
+al asociar una foto y baja al reemplazarla o al borrar el resultado (desde la
+API, o en bloque al borrar su sesión o su ScannerImage: ver scanners/signals.py).
+gc_photo_blobs borra los blobs sin referencias pasado un margen; con --recount
+corrige los refcount de borrados que no pasan por aquí (admin, shell).
+
+Las subidas directas con URL prefirmada (uploads.presign_upload) siguen
+usando la key por resultado y no pasan por aquí.
+"""
+import hashlib
+import os
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .models import PhotoBlob, ScannerResult
+
+
+BLOB_DIR = f"{getattr(settings, 'SCANNER_PHOTOS_DIR', 'scanner_photos/')}blobs/"
+# Un blob sin referencias puede volver a usarse por una subida en curso: se espera antes de borrarlo
+GC_GRACE_SECONDS = getattr(settings, 'SCANNER_BLOB_GC_GRACE_SECONDS', 24 * 60 * 60)
+HASH_CHUNK_SIZE = 256 * 1024
+
+
+def blob_key(sha256):
+    return f"{BLOB_DIR}{sha256[:2]}/{sha256}.jpg"
+
+
+def blob_sha(key):
+    """sha256 de una key de blob, o None si photo_path no es un blob."""
+    if not key or not key.startswith(BLOB_DIR):
+        return None
+    return os.path.splitext(os.path.basename(key))[0]
+
+
+def hash_stream(stream):
+    """sha256 leyendo por bloques (no carga la foto completa en memoria)."""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def adjust_refcounts(deltas):
+    """Aplica {sha256: delta} en una sola consulta."""
+    deltas = {sha: delta for sha, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    PhotoBlob.objects.filter(sha256__in=deltas).update(
+        refcount=F('refcount') + Case(
+            *[When(sha256=sha, then=Value(delta)) for sha, delta in deltas.items()],
+            default=Value(0), output_field=IntegerField(),
+        ),
+        last_used_at=timezone.now(),
+    )
+
+
+def claim_blobs(shas):
+    """
+    Blobs ya guardados entre shas, reservados para una subida que no los va a
+    reescribir: se bloquean y se marcan como recién usados, así collect_garbage
+    (que solo toma blobs sin uso dentro del margen) no los borra antes de que
+    attach_photos sume la referencia. Los que el GC ya borró no se devuelven y
+    se vuelven a subir.
+    """
+    with transaction.atomic():
+        existing = set(PhotoBlob.objects.select_for_update().filter(sha256__in=shas).values_list('sha256', flat=True))
+        PhotoBlob.objects.filter(sha256__in=existing).update(last_used_at=timezone.now())
+    return existing
+
+
+def attach_photos(pairs):
+    """
+    Apunta cada resultado a su blob: [(result, sha256)].
+
+    Actualiza photo_path (y reinicia photo_variants si cambió) con un solo
+    bulk_update y ajusta los refcount de los blobs nuevos y los reemplazados.
+    """
+    deltas = Counter()
+    changed = []
+    for result, sha in pairs:
+        key = blob_key(sha)
+        if result.photo_path == key:
+            continue
+        previous = blob_sha(result.photo_path)
+        if previous:
+            deltas[previous] -= 1
+        deltas[sha] += 1
+        result.photo_path = key
+        result.photo_variants = []
+        changed.append(result)
+
+    with transaction.atomic():
+        ScannerResult.objects.bulk_update(changed, ['photo_path', 'photo_variants'], batch_size=500)
+        adjust_refcounts(deltas)
+    return changed
+
+
+def release_photo(result):
+    """El resultado se borró: su blob pierde una referencia."""
+    sha = blob_sha(result.photo_path)
+    if sha:
+        adjust_refcounts({sha: -1})
+
+
+def _release_results(results):
+    """Cada blob pierde tantas referencias como resultados lo usan. Una consulta agregada y un UPDATE."""
+    counts = (
+        results.filter(photo_path__startswith=BLOB_DIR)
+        .order_by().values_list('photo_path').annotate(n=Count('pk'))
+    )
+    adjust_refcounts({blob_sha(photo_path): -n for photo_path, n in counts})
+
+
+def release_session_photos(session_ids):
+    """Las sesiones se van a borrar (con sus resultados en cascada)."""
+    _release_results(ScannerResult.objects.filter(session_id__in=session_ids))
+
+
+def release_image_photos(image_ids):
+    """Las ScannerImage se van a borrar (con sus resultados en cascada)."""
+    _release_results(ScannerResult.objects.filter(image_id__in=image_ids))
+
+
+def recount():
+    """Recalcula todos los refcount desde ScannerResult.photo_path. Devuelve los blobs corregidos."""
+    actual = Counter()
+    for key in ScannerResult.objects.filter(photo_path__startswith=BLOB_DIR).values_list('photo_path', flat=True).iterator():
+        actual[blob_sha(key)] += 1
+    fixed = []
+    for blob in PhotoBlob.objects.only('sha256', 'refcount').iterator():
+        if blob.refcount != actual.get(blob.sha256, 0):
+            blob.refcount = actual.get(blob.sha256, 0)
+            fixed.append(blob)
+    PhotoBlob.objects.bulk_update(fixed, ['refcount'], batch_size=1000)
+    return len(fixed)
+
+
+def collect_garbage(client, grace_seconds=GC_GRACE_SECONDS, dry_run=False, batch_size=500):
+    """
+    Borra del bucket y de la BD los blobs sin referencias (y sus variantes).
+    Devuelve la cantidad de blobs eliminados.
+    """
+    from .imaging import SIZES, variant_key
+
+    cutoff = timezone.now() - timedelta(seconds=grace_seconds)
+    candidates = PhotoBlob.objects.filter(refcount__lte=0, last_used_at__lt=cutoff)
+    if dry_run:
+        return candidates.count()
+
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            blobs = list(candidates.select_for_update(skip_locked=True).order_by('last_used_at')[:batch_size])
+            if not blobs:
+                break
+            # Nunca se borra una key que algún resultado aún usa (refcount desfasado)
+            used = Counter(ScannerResult.objects.filter(
+                photo_path__in=[blob_key(b.sha256) for b in blobs]
+            ).values_list('photo_path', flat=True))
+            orphans = [b for b in blobs if blob_key(b.sha256) not in used]
+
+            if orphans:
+                keys = []
+                for blob in orphans:
+                    key = blob_key(blob.sha256)
+                    keys.append(key)
+                    keys.extend(variant_key(key, size) for size in SIZES)
+                for start in range(0, len(keys), 1000):
+                    client.delete_objects(
+                        Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+                        Delete={'Objects': [{'Key': k} for k in keys[start:start + 1000]], 'Quiet': True},
+                    )
+                PhotoBlob.objects.filter(pk__in=[b.pk for b in orphans]).delete()
+                deleted += len(orphans)
+            # Los que sí están en uso quedan con su refcount real
+            stale = [b for b in blobs if blob_key(b.sha256) in used]
+            for blob in stale:
+                blob.refcount = used[blob_key(blob.sha256)]
+            PhotoBlob.objects.bulk_update(stale, ['refcount'])
+        if len(blobs) < batch_size:
+            break
+    return deleted
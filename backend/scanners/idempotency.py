@@ -0,0 +1,127 @@
+# scanners/idempotency.py
+"""
+Idempotencia para los endpoints de sync.
+
+El cliente envía la cabecera `Idempotency-Key`. Si el mismo usuario repite la
+misma key con el mismo payload, se devuelve la respuesta guardada sin volver a
+escribir ScannerSession/ScannerResult. Las entradas expiran tras
+SCANNER_IDEMPOTENCY_TTL segundos.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import SyncLedger
+
+
+IDEMPOTENCY_TTL = getattr(settings, 'SCANNER_IDEMPOTENCY_TTL', 24 * 60 * 60)
+# Tiempo tras el cual un lote "en proceso" se considera abandonado
+IDEMPOTENCY_LOCK_SECONDS = getattr(settings, 'SCANNER_IDEMPOTENCY_LOCK_SECONDS', 5 * 60)
+MAX_KEY_LENGTH = SyncLedger._meta.get_field('key').max_length
+
+
+def payload_hash(data):
+    """sha256 del payload normalizado (orden de claves estable)."""
+    raw = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def purge_expired(owner=None):
+    """Elimina entradas vencidas (de un usuario o de todos)."""
+    expired = SyncLedger.objects.filter(expires_at__lte=timezone.now())
+    if owner is not None:
+        expired = expired.filter(owner=owner)
+    deleted, _ = expired.delete()
+    return deleted
+
+
+def _reserve(owner, endpoint, key, digest):
+    """
+    Reserva la key antes de procesar el lote.
+    Devuelve (entry, None) si hay que procesar o (None, Response) si no.
+    """
+    now = timezone.now()
+    try:
+        entry, created = SyncLedger.objects.get_or_create(
+            owner=owner, endpoint=endpoint, key=key,
+            defaults={'payload_hash': digest, 'expires_at': now + timedelta(seconds=IDEMPOTENCY_TTL)},
+        )
+    except IntegrityError:
+        # Otra petición concurrente reservó la misma key
+        return None, Response({"error": "Lote en proceso, reintenta más tarde"}, status=status.HTTP_409_CONFLICT)
+    if created:
+        return entry, None
+
+    expired = entry.expires_at <= now
+    abandoned = entry.response is None and entry.created_at <= now - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)
+    if expired or abandoned:
+        # UPDATE condicional: de varias peticiones que ven la entrada vencida, solo una la reclama
+        reclaimable = Q(expires_at__lte=now) | Q(
+            response__isnull=True, created_at__lte=now - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+        )
+        fields = {
+            'payload_hash': digest, 'response': None, 'status_code': None,
+            'created_at': now, 'expires_at': now + timedelta(seconds=IDEMPOTENCY_TTL),
+        }
+        if not SyncLedger.objects.filter(reclaimable, pk=entry.pk).update(**fields):
+            return None, Response({"error": "Lote en proceso, reintenta más tarde"}, status=status.HTTP_409_CONFLICT)
+        for name, value in fields.items():
+            setattr(entry, name, value)
+        return entry, None
+
+    if entry.payload_hash != digest:
+        return None, Response(
+            {"error": "Idempotency-Key ya usada con un payload distinto"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    if entry.response is None:
+        return None, Response({"error": "Lote en proceso, reintenta más tarde"}, status=status.HTTP_409_CONFLICT)
+
+    replay = Response(entry.response, status=entry.status_code)
+    replay['Idempotent-Replayed'] = 'true'
+    return None, replay
+
+
+def idempotent(endpoint):
+    """Decorador para acciones de ViewSet que acepta la cabecera Idempotency-Key."""
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(self, request, *args, **kwargs):
+            key = request.headers.get('Idempotency-Key')
+            if not key:
+                return view_func(self, request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return Response(
+                    {"error": f"Idempotency-Key excede {MAX_KEY_LENGTH} caracteres"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            entry, early = _reserve(request.user, endpoint, key, payload_hash(request.data))
+            if early is not None:
+                return early
+
+            try:
+                response = view_func(self, request, *args, **kwargs)
+            except Exception:
+                entry.delete()
+                raise
+
+            if status.is_success(response.status_code):
+                entry.response = response.data
+                entry.status_code = response.status_code
+                entry.save(update_fields=['response', 'status_code'])
+                purge_expired(owner=request.user)
+            else:
+                # Errores de validación no se guardan: el cliente puede corregir y reintentar
+                entry.delete()
+            return response
+        return wrapper
+    return decorator
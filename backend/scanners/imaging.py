@@ -0,0 +1,175 @@
+# scanners/imaging.py
+"""
+Variantes de las fotos de escaneo, generadas después de subirlas.
+
+Por cada foto (p. ej. scanner_photos/{session_id}/{result_id}.jpg) se
+escriben, al lado y con key determinística:
+  - {nombre}_full.jpg:  re-encodada, lado mayor <= SCANNER_PHOTO_MAX_SIDE
+  - {nombre}_thumb.jpg: miniatura para listados (SCANNER_THUMB_SIDE)
+  - {nombre}_model.jpg: recorte central cuadrado del tamaño de entrada del modelo
+
+El trabajo corre en el pool de core.background (o en Celery) vía
+schedule_photo_processing, una vez por foto aunque la compartan varios
+resultados (scanners/blobs.py); results/{id}/image/?size=thumb|full|model sirve
+la variante cuando ya existe y la foto original mientras tanto.
+
+La petición solo valida la cabecera (models.validate_image_format); la
+verificación completa corre aquí, también para los ScannerImage subidos por la
+API (verify_scanner_image). Una foto que no decodifica se rechaza: los
+resultados dejan de apuntarla y el archivo se borra.
+"""
+import io
+import logging
+import os
+
+from django.conf import settings
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .models import MAX_IMAGE_PIXELS, ScannerImage, ScannerResult
+
+logger = logging.getLogger(__name__)
+
+
+MAX_SIDE = getattr(settings, 'SCANNER_PHOTO_MAX_SIDE', 2048)
+THUMB_SIDE = getattr(settings, 'SCANNER_THUMB_SIDE', 256)
+MODEL_INPUT_SIDE = getattr(settings, 'SCANNER_MODEL_INPUT_SIDE', 224)
+JPEG_QUALITY = 85
+
+SIZES = ('full', 'thumb', 'model')
+
+
+def variant_key(photo_key, size):
+    """scanner_photos/s/r.jpg -> scanner_photos/s/r_thumb.jpg"""
+    base, _ = os.path.splitext(photo_key)
+    return f"{base}_{size}.jpg"
+
+
+def render_variants(img):
+    """{size: bytes JPEG} a partir de una imagen ya decodificada."""
+    img = ImageOps.exif_transpose(img).convert('RGB')
+
+    full = img.copy()
+    full.thumbnail((MAX_SIDE, MAX_SIDE), Image.Resampling.LANCZOS)
+    thumb = full.copy()
+    thumb.thumbnail((THUMB_SIDE, THUMB_SIDE), Image.Resampling.LANCZOS)
+    model = ImageOps.fit(full, (MODEL_INPUT_SIDE, MODEL_INPUT_SIDE), Image.Resampling.BILINEAR)
+
+    variants = {}
+    for size, image in (('full', full), ('thumb', thumb), ('model', model)):
+        out = io.BytesIO()
+        image.save(out, format='JPEG', quality=JPEG_QUALITY, optimize=True)
+        variants[size] = out.getvalue()
+    return variants
+
+
+class InvalidPhoto(Exception):
+    """El archivo pasó la validación de cabecera pero no es una imagen válida (truncada, corrupta)."""
+
+
+def decode_photo(raw):
+    """
+    Verificación completa diferida desde validate_image_format: límite de píxeles,
+    verify() y decodificación de todos los datos (detecta archivos truncados).
+    Devuelve la imagen cargada.
+    """
+    try:
+        with Image.open(io.BytesIO(raw)) as img:
+            if img.width * img.height > MAX_IMAGE_PIXELS:
+                raise InvalidPhoto("La imagen excede el límite de píxeles.")
+            img.verify()
+        img = Image.open(io.BytesIO(raw))
+        img.load()
+        return img
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+        raise InvalidPhoto(f"Imagen inválida o corrupta: {e}")
+
+
+def reject_photo(client, key, error):
+    """
+    La foto en `key` no es una imagen válida: los resultados dejan de apuntarla
+    (photo_path vacío). Un blob pierde esas referencias y lo borra gc_photo_blobs;
+    una key por resultado se borra del bucket de inmediato.
+    """
+    from .blobs import adjust_refcounts, blob_sha
+
+    logger.warning("Foto %s rechazada: %s", key, error)
+    sha = blob_sha(key)
+    with transaction.atomic():
+        released = ScannerResult.objects.filter(photo_path=key).update(photo_path='', photo_variants=[])
+        if sha:
+            adjust_refcounts({sha: -released})
+    if not sha:
+        client.delete_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key)
+
+
+def verify_scanner_image(image_id):
+    """
+    Verificación completa de un ScannerImage subido por la API. Si no es una imagen
+    válida se borra el archivo y el campo image queda vacío (la API lo devuelve null).
+    Devuelve True si la imagen es válida.
+    """
+    image = ScannerImage.objects.filter(pk=image_id).first()
+    if image is None or not image.image:
+        return False
+    with image.image.open('rb') as fileobj:
+        raw = fileobj.read()
+    try:
+        decode_photo(raw).close()
+    except InvalidPhoto as e:
+        logger.warning("Imagen %s rechazada (%s): %s", image_id, image.image.name, e)
+        image.image.delete(save=False)
+        ScannerImage.objects.filter(pk=image_id).update(image='')
+        return False
+    return True
+
+
+def process_photo(client, key):
+    """
+    Genera y sube las variantes de la foto en `key` y las marca en los
+    resultados que la usan. Devuelve las variantes disponibles.
+    """
+    from .uploads import UPLOAD_ACL
+
+    users = ScannerResult.objects.filter(photo_path=key)
+    # Foto compartida (blob por contenido) que ya tiene variantes: no se rehacen
+    ready = users.exclude(photo_variants=[]).values_list('photo_variants', flat=True).first()
+    if ready:
+        users.filter(photo_variants=[]).update(photo_variants=ready)
+        return ready
+
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    raw = client.get_object(Bucket=bucket, Key=key)['Body'].read()
+    try:
+        img = decode_photo(raw)
+    except InvalidPhoto as e:
+        reject_photo(client, key, e)
+        return []
+    with img:
+        variants = render_variants(img)
+
+    for size, data in variants.items():
+        client.put_object(
+            Bucket=bucket, Key=variant_key(key, size), Body=data,
+            ACL=UPLOAD_ACL, ContentType='image/jpeg',
+        )
+    users.update(photo_variants=list(variants))
+    return list(variants)
+
+
+def schedule_photo_processing(keys):
+    """Programa el procesamiento de las fotos después del commit (una vez por key)."""
+    from core.background import dispatch
+    from .tasks import process_photo_async
+
+    for key in keys:
+        dispatch(f"photo:{key}", process_photo_async, key)
+
+
+def schedule_image_verification(image_ids):
+    """Programa la verificación completa de ScannerImage subidos (después del commit)."""
+    from core.background import dispatch
+    from .tasks import verify_image_async
+
+    for image_id in image_ids:
+        dispatch(f"image:{image_id}", verify_image_async, image_id)
@@ -0,0 +1,348 @@
+# scanners/inference.py
+"""
+Inferencia en el servidor con los modelos TFLite registrados en ModelVersion.
+
+- El intérprete de cada ModelVersion se carga una vez por proceso y queda
+  residente (se recarga si el proceso fue forkeado).
+- Las imágenes se encolan en un MicroBatcher por modelo: un hilo junta hasta
+  SCANNER_INFERENCE_BATCH_SIZE imágenes (o espera SCANNER_INFERENCE_MAX_WAIT_MS)
+  y las corre en una sola invocación.
+- score_results() clasifica ScannerResult y guarda server_classification /
+  server_confidence junto a los valores del teléfono, sin tocarlos.
+
+El preprocesamiento replica al de la app (PlantDiseaseClassifier.kt): RGB,
+resize bilinear a 224x224 sin recorte y normalización a [0, 1].
+
+Dependencias opcionales: numpy y tflite-runtime (o ai-edge-litert, o
+tensorflow). Sin ellas se lanza InferenceUnavailable.
+"""
+import io
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+from django.utils import timezone
+from PIL import Image
+
+from .models import ModelVersion, ScannerResult
+
+logger = logging.getLogger(__name__)
+
+
+BATCH_SIZE = getattr(settings, 'SCANNER_INFERENCE_BATCH_SIZE', 16)
+MAX_WAIT_MS = getattr(settings, 'SCANNER_INFERENCE_MAX_WAIT_MS', 20)
+NUM_THREADS = getattr(settings, 'SCANNER_INFERENCE_THREADS', 1)
+INPUT_SIDE = getattr(settings, 'SCANNER_MODEL_INPUT_SIDE', 224)
+MODELS_DIR = getattr(settings, 'SCANNER_MODELS_DIR', os.path.join(settings.BASE_DIR, 'ml_models'))
+IO_WORKERS = 8
+
+
+class InferenceUnavailable(Exception):
+    """No hay runtime de TFLite o no se encuentra el modelo."""
+
+
+def _interpreter_class():
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        import tensorflow as tf
+        return tf.lite.Interpreter
+    except ImportError:
+        raise InferenceUnavailable(
+            "Inferencia no disponible: instala numpy y tflite-runtime (o tensorflow)."
+        )
+
+
+# ------------------- ARCHIVOS DEL MODELO -------------------
+def model_path(model_version):
+    """
+    Ruta local del .tflite de un ModelVersion.
+
+    file_path puede ser absoluto, relativo a SCANNER_MODELS_DIR o una key del
+    bucket; en ese caso se descarga una vez a SCANNER_MODELS_DIR.
+    """
+    if not model_version.file_path:
+        raise InferenceUnavailable(f"{model_version} no tiene file_path.")
+    path = model_version.file_path
+    local = path if os.path.isabs(path) else os.path.join(MODELS_DIR, path)
+    if os.path.exists(local):
+        return local
+
+    from cropcareBackend.object_storage import get_client
+
+    os.makedirs(os.path.dirname(local), exist_ok=True)
+    try:
+        body = get_client().get_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=path)['Body']
+    except Exception as e:
+        raise InferenceUnavailable(f"No se encontró el modelo {path}: {e}")
+    tmp = f"{local}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as out:
+        for chunk in iter(lambda: body.read(1024 * 1024), b''):
+            out.write(chunk)
+    os.replace(tmp, local)
+    return local
+
+
+def load_labels(model_version):
+    """Etiquetas del modelo: las registradas, o {modelo}.labels.txt / labels.txt junto al .tflite."""
+    if model_version.labels:
+        return list(model_version.labels)
+    path = model_path(model_version)
+    base, _ = os.path.splitext(path)
+    for candidate in (f"{base}.labels.txt", os.path.join(os.path.dirname(path), 'labels.txt')):
+        if os.path.exists(candidate):
+            with open(candidate, encoding='utf-8') as f:
+                return [line.strip() for line in f if line.strip()]
+    raise InferenceUnavailable(f"No se encontraron etiquetas para {model_version}.")
+
+
+# ------------------- MODELO RESIDENTE -------------------
+class LoadedModel:
+    """Intérprete TFLite de un ModelVersion, con sus etiquetas."""
+
+    def __init__(self, model_version):
+        self.model_version = model_version
+        self.labels = load_labels(model_version)
+        self.interpreter = _interpreter_class()(model_path=model_path(model_version), num_threads=NUM_THREADS)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.batch = int(self.input['shape'][0])
+        # El intérprete no es seguro entre hilos; el MicroBatcher ya serializa, esto cubre usos directos
+        self.lock = threading.Lock()
+
+    def _resize(self, n):
+        if n == self.batch:
+            return True
+        try:
+            self.interpreter.resize_tensor_input(self.input['index'], [n, *self.input['shape'][1:]])
+            self.interpreter.allocate_tensors()
+        except Exception:
+            return False
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.batch = n
+        return True
+
+    def _invoke(self, batch):
+        import numpy as np
+
+        if self.input['dtype'] == np.uint8:
+            batch = np.clip(batch * 255.0, 0, 255).astype(np.uint8)
+        self.interpreter.set_tensor(self.input['index'], batch.astype(self.input['dtype'], copy=False))
+        self.interpreter.invoke()
+        scores = self.interpreter.get_tensor(self.output['index']).astype(np.float32)
+        scale, zero_point = self.output.get('quantization', (0.0, 0))
+        if scale:
+            scores = (scores - zero_point) * scale
+        return scores
+
+    def predict(self, batch):
+        """batch: ndarray (n, 224, 224, 3) float32 en [0, 1] -> scores (n, clases)."""
+        import numpy as np
+
+        with self.lock:
+            if self._resize(len(batch)):
+                return self._invoke(batch)
+            # Modelo con batch fijo: una invocación por imagen
+            self._resize(1)
+            return np.concatenate([self._invoke(batch[i:i + 1]) for i in range(len(batch))])
+
+
+_models = {}
+_models_pid = None
+_models_lock = threading.Lock()
+
+
+def get_model(model_version):
+    """LoadedModel residente del proceso para el ModelVersion."""
+    global _models_pid
+    with _models_lock:
+        if _models_pid != os.getpid():
+            _models.clear()
+            _batchers.clear()
+            _models_pid = os.getpid()
+        model = _models.get(model_version.pk)
+        if model is None:
+            model = _models[model_version.pk] = LoadedModel(model_version)
+        return model
+
+
+# ------------------- MICRO-BATCHES -------------------
+class MicroBatcher:
+    """Cola de imágenes de un modelo; un hilo las agrupa en lotes."""
+
+    def __init__(self, model, batch_size=BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.model = model
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._loop, name=f'inference-{model.model_version.pk}', daemon=True)
+        self.thread.start()
+
+    def submit(self, array):
+        future = Future()
+        self.queue.put((array, future))
+        return future
+
+    def _loop(self):
+        import numpy as np
+
+        while True:
+            items = [self.queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(items) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                scores = self.model.predict(np.stack([array for array, _ in items]))
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            for (_, future), row in zip(items, scores):
+                best = int(row.argmax())
+                future.set_result((self.model.labels[best], float(row[best])))
+
+
+_batchers = {}
+
+
+def get_batcher(model_version):
+    model = get_model(model_version)
+    with _models_lock:
+        batcher = _batchers.get(model_version.pk)
+        if batcher is None:
+            batcher = _batchers[model_version.pk] = MicroBatcher(model)
+        return batcher
+
+
+def preprocess(raw):
+    """Bytes de la foto -> ndarray (224, 224, 3) float32 en [0, 1], como en la app."""
+    import numpy as np
+
+    with Image.open(io.BytesIO(raw)) as img:
+        img = img.convert('RGB').resize((INPUT_SIDE, INPUT_SIDE), Image.Resampling.BILINEAR)
+        return np.asarray(img, dtype=np.float32) / 255.0
+
+
+def classify(model_version, images):
+    """[(bytes)] -> [(label, confidence)] pasando por la cola del modelo."""
+    batcher = get_batcher(model_version)
+    futures = [batcher.submit(preprocess(raw)) for raw in images]
+    return [future.result() for future in futures]
+
+
+# ------------------- RESULTADOS -------------------
+def read_photo(result):
+    """Bytes de la foto de un resultado: photo_path en el bucket o el archivo de su ScannerImage."""
+    return read_photo_source(result.photo_path, result.image.image.name if result.image_id else None)
+
+
+def read_photo_source(photo_path, image_name=None):
+    """Igual que read_photo, a partir de las columnas (sin instancias: sirve en procesos hijos)."""
+    from django.core.files.storage import default_storage
+    from cropcareBackend.object_storage import get_client
+
+    photos_dir = getattr(settings, 'SCANNER_PHOTOS_DIR', 'scanner_photos/')
+    if photo_path and photo_path.startswith(photos_dir):
+        return get_client().get_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=photo_path)['Body'].read()
+    if image_name:
+        with default_storage.open(image_name, 'rb') as f:
+            return f.read()
+    return None
+
+
+def session_model_version(session, cache=None):
+    """
+    ModelVersion con que se clasifica una sesión: la FK model_version si está; si no
+    (el sync solo trae model_version_string), la versión registrada con ese string
+    (la más reciente si varios modelos la comparten) y, en último caso, la última
+    versión registrada con artefacto. cache: {model_version_string: ModelVersion}.
+    """
+    if session.model_version_id is not None:
+        return session.model_version
+    cache = {} if cache is None else cache
+    key = session.model_version_string
+    if key not in cache:
+        versions = ModelVersion.objects.exclude(file_path__isnull=True).exclude(file_path='').order_by('-created_at')
+        cache[key] = versions.filter(version=key).first() or versions.first()
+        if cache[key] is None:
+            logger.warning("No hay ModelVersion registrado para clasificar la versión '%s'", key)
+    return cache[key]
+
+
+def score_results(results, model_version=None):
+    """
+    Clasifica en el servidor los resultados dados y guarda server_*.
+
+    Sin model_version se usa el de la sesión de cada resultado (el que usó el
+    teléfono, ver session_model_version); los resultados sin modelo o sin foto
+    se omiten. Devuelve la cantidad de resultados clasificados.
+    """
+    pending = []
+    versions = {}
+    for result in results:
+        version = model_version or session_model_version(result.session, versions)
+        if version is not None:
+            pending.append((result, version))
+    if not pending:
+        return 0
+
+    with ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix='inference-io') as pool:
+        photos = list(pool.map(lambda item: _safe_read(item[0]), pending))
+
+    futures = []
+    for (result, version), raw in zip(pending, photos):
+        if raw is None:
+            continue
+        try:
+            array = preprocess(raw)
+        except Exception:
+            continue
+        futures.append((result, version, get_batcher(version).submit(array)))
+
+    now = timezone.now()
+    scored = []
+    for result, version, future in futures:
+        try:
+            label, confidence = future.result()
+        except InferenceUnavailable:
+            raise
+        except Exception:
+            continue
+        result.server_classification = label
+        result.server_confidence = confidence
+        result.server_model_version = version
+        result.server_scored_at = now
+        scored.append(result)
+
+    ScannerResult.objects.bulk_update(
+        scored, ['server_classification', 'server_confidence', 'server_model_version', 'server_scored_at'],
+        batch_size=500,
+    )
+    return len(scored)
+
+
+def _safe_read(result):
+    try:
+        return read_photo(result)
+    except Exception:
+        return None
@@ -0,0 +1,144 @@
+# scanners/ingest.py
+"""
+Ingesta incremental de backlogs offline en formato NDJSON (opcionalmente gzip).
+
+Cada línea es una sesión con el mismo formato que sessions/sync/, o un
+resultado suelto (con campo `session`) como en results/sync/. El stream se
+lee línea a línea y se confirma en chunks acotados; tras cada chunk se guarda el
+offset (número de líneas) en IngestCheckpoint para poder reanudar.
+"""
+import gzip
+import json
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import IngestCheckpoint
+from .sync import sync_sessions, sync_results
+
+
+# Filas (sesiones + resultados) por chunk confirmado
+DEFAULT_CHUNK_ROWS = getattr(settings, 'SCANNER_INGEST_CHUNK_ROWS', 2000)
+MAX_CHUNK_ROWS = getattr(settings, 'SCANNER_INGEST_MAX_CHUNK_ROWS', 10000)
+MAX_LINE_BYTES = getattr(settings, 'SCANNER_INGEST_MAX_LINE_BYTES', 5 * 1024 * 1024)
+
+
+class IngestError(Exception):
+    """Error que invalida el stream completo (no una línea puntual)."""
+
+
+def open_stream(request):
+    """Devuelve un objeto file-like con el cuerpo crudo, descomprimiendo gzip si corresponde."""
+    stream = request.stream
+    if stream is None:
+        raise IngestError("El cuerpo de la petición está vacío.")
+    encoding = request.META.get('HTTP_CONTENT_ENCODING', '').lower()
+    if encoding == 'gzip' or request.content_type in ('application/gzip', 'application/x-gzip'):
+        return gzip.GzipFile(fileobj=stream, mode='rb')
+    return stream
+
+
+def iter_lines(stream, max_line_bytes=MAX_LINE_BYTES):
+    """Itera las líneas del stream sin cargarlo completo en memoria."""
+    while True:
+        try:
+            line = stream.readline(max_line_bytes + 1)
+        except (OSError, EOFError) as e:  # gzip truncado o corrupto
+            raise IngestError(f"Stream comprimido inválido: {e}")
+        if not line:
+            return
+        if len(line) > max_line_bytes:
+            raise IngestError(f"Línea de más de {max_line_bytes} bytes.")
+        yield line
+
+
+def ingest_sessions(stream, owner, checkpoint=None, offset=0, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Procesa un stream NDJSON de sesiones/resultados confirmando cada chunk por separado.
+
+    offset es el número de línea (absoluto) de la primera línea del cuerpo; las
+    líneas anteriores a checkpoint.committed_offset se omiten sin parsear.
+    """
+    committed = checkpoint.committed_offset if checkpoint else offset
+    chunks = []
+    errors = []
+    total_synced = 0
+
+    pending = []        # sesiones parseadas del chunk actual
+    pending_results = []  # resultados sueltos del chunk actual
+    pending_rows = 0
+    empresa = getattr(owner, 'empresa', None)
+    line_no = offset
+
+    def flush(end):
+        nonlocal committed, total_synced, pending, pending_results, pending_rows
+        with transaction.atomic():
+            synced, chunk_errors = sync_sessions(pending, owner) if pending else ([], [])
+            if pending_results:
+                synced_results, result_errors = sync_results(pending_results, empresa)
+                synced = synced + synced_results
+                chunk_errors = chunk_errors + result_errors
+            if checkpoint:
+                checkpoint.committed_offset = end
+                checkpoint.chunks_committed += 1
+                checkpoint.save(update_fields=['committed_offset', 'chunks_committed', 'updated_at'])
+        chunks.append({
+            'chunk': len(chunks),
+            'start_offset': committed,
+            'end_offset': end,
+            'synced': len(synced),
+            'errors': len(chunk_errors),
+        })
+        errors.extend(chunk_errors)
+        total_synced += len(synced)
+        committed = end
+        pending = []
+        pending_results = []
+        pending_rows = 0
+
+    for raw in iter_lines(stream):
+        line_no += 1
+        if line_no <= committed:
+            continue  # ya confirmada en un intento anterior
+        complete = raw.endswith(b'\n')
+        raw = raw.strip()
+        if not raw:
+            continue
+        try:
+            record = json.loads(raw)
+        except ValueError as e:
+            if not complete:
+                # Conexión cortada a mitad de línea: no se confirma, se reenviará
+                line_no -= 1
+                break
+            errors.append({'line': line_no, 'error': f"JSON inválido: {e}"})
+            continue
+        if not isinstance(record, dict):
+            errors.append({'line': line_no, 'error': "Se esperaba un objeto JSON por línea."})
+            continue
+
+        if 'session' in record:
+            pending_results.append(record)
+            pending_rows += 1
+        else:
+            pending.append(record)
+            scan_results = record.get('scan_results')
+            pending_rows += 1 + (len(scan_results) if isinstance(scan_results, list) else 0)
+        if pending_rows >= chunk_rows:
+            flush(line_no)
+
+    if line_no > committed:
+        flush(line_no)
+
+    return {
+        'committed_offset': committed,
+        'chunks': chunks,
+        'errors': errors,
+        'total_synced': total_synced,
+        'total_errors': len(errors),
+    }
+
+
+def get_checkpoint(owner, upload_id):
+    checkpoint, _ = IngestCheckpoint.objects.get_or_create(owner=owner, upload_id=upload_id)
+    return checkpoint
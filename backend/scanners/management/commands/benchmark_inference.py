@@ -0,0 +1,94 @@
+# scanners/management/commands/benchmark_inference.py
+import io
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from scanners.inference import (
+    BATCH_SIZE, NUM_THREADS, InferenceUnavailable, MicroBatcher, get_model, preprocess, read_photo,
+)
+from scanners.models import ModelVersion, ScannerResult
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide la inferencia en el servidor de un ModelVersion: imágenes/s por núcleo y latencia p50/p95 "
+        "por imagen, pasando por la cola de micro-batches con distintos tamaños de lote."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model-id', type=int, required=True, help='id del ModelVersion')
+        parser.add_argument('--images', type=int, default=256, help='Imágenes por corrida (por defecto 256)')
+        parser.add_argument('--batch-sizes', default=f'1,{BATCH_SIZE}',
+                            help=f'Tamaños de lote a comparar, separados por coma (por defecto 1,{BATCH_SIZE})')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Clientes que encolan imágenes en paralelo (por defecto 8)')
+        parser.add_argument('--from-results', action='store_true',
+                            help='Usa fotos reales de ScannerResult en vez de imágenes sintéticas')
+
+    def handle(self, *args, **options):
+        model_version = ModelVersion.objects.filter(pk=options['model_id']).first()
+        if not model_version:
+            raise CommandError(f"ModelVersion {options['model_id']} no encontrado.")
+        try:
+            model = get_model(model_version)
+        except InferenceUnavailable as e:
+            raise CommandError(str(e))
+
+        arrays = [preprocess(raw) for raw in self._images(options)]
+        if not arrays:
+            raise CommandError("No hay imágenes para medir.")
+        self.stdout.write(
+            f"{model_version}: {len(arrays)} imágenes, {len(model.labels)} clases, "
+            f"{NUM_THREADS} hilo(s) de intérprete, {options['concurrency']} clientes"
+        )
+
+        model.predict(arrays[0][None])  # calentamiento
+        for batch_size in [int(b) for b in options['batch_sizes'].split(',') if b.strip()]:
+            batcher = MicroBatcher(model, batch_size=batch_size)
+            latencies = []
+
+            def one(array):
+                start = time.perf_counter()
+                batcher.submit(array).result()
+                latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                list(pool.map(one, arrays))
+            elapsed = time.perf_counter() - start
+
+            latencies.sort()
+            p50 = latencies[len(latencies) // 2] * 1000
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000
+            throughput = len(arrays) / elapsed
+            self.stdout.write(self.style.SUCCESS(
+                f"lote {batch_size:>3}: {throughput:8.1f} img/s  "
+                f"{throughput / NUM_THREADS:8.1f} img/s/núcleo  p50 {p50:7.1f} ms  p95 {p95:7.1f} ms"
+            ))
+
+    def _images(self, options):
+        if options['from_results']:
+            results = ScannerResult.objects.exclude(photo_path='').select_related('image')[:options['images']]
+            images = []
+            for result in results:
+                try:
+                    raw = read_photo(result)
+                except Exception:
+                    continue
+                if raw:
+                    images.append(raw)
+            return images
+
+        # Sintéticas: fotos de cámara de 1600x1200 con ruido
+        images = []
+        for _ in range(min(options['images'], 32)):
+            img = Image.frombytes('RGB', (1600, 1200), os.urandom(1600 * 1200 * 3))
+            out = io.BytesIO()
+            img.save(out, format='JPEG', quality=85)
+            images.append(out.getvalue())
+        return [random.choice(images) for _ in range(options['images'])]
@@ -0,0 +1,174 @@
+# scanners/management/commands/benchmark_sync.py
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from emprises.models import Empresa
+from zonecrop.models import Cultivo
+from scanners.models import ScannerSession, ScannerResult
+from scanners.sync import sync_sessions, sync_results
+from scanners.taxonomy import ensure_labels
+
+
+class QueryCounter:
+    """Cuenta las sentencias ejecutadas (sin el límite del log de consultas de Django)."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def legacy_sync_sessions(sessions_data, owner):
+    """Implementación original (update_or_create fila a fila), usada como línea base."""
+    synced = []
+    for session_data in sessions_data:
+        with transaction.atomic():
+            scan_results_data = session_data.get('scan_results', [])
+            plague_count = sum(1 for r in scan_results_data if r.get('has_plague'))
+            session, created = ScannerSession.objects.update_or_create(
+                session_id=session_data['session_id'],
+                defaults={
+                    'empresa_id': session_data['empresa_id'],
+                    'zona_id': session_data['zona_id'],
+                    'cultivo_id': session_data['cultivo_id'],
+                    'owner': owner,
+                    'worker_name': session_data['worker_name'],
+                    'model_version_string': session_data['model_version_string'],
+                    'started_at': session_data['started_at'],
+                    'finished_at': session_data.get('finished_at'),
+                    'status': session_data['status'],
+                    'total_scans': len(scan_results_data),
+                    'healthy_count': len(scan_results_data) - plague_count,
+                    'plague_count': plague_count,
+                    'notes': session_data.get('notes', ''),
+                }
+            )
+            for result_data in scan_results_data:
+                ScannerResult.objects.update_or_create(
+                    result_id=result_data['result_id'],
+                    defaults={
+                        'session': session,
+                        'photo_path': result_data['photo_path'],
+                        'classification': result_data['classification'],
+                        'confidence': result_data['confidence'],
+                        'has_plague': result_data['has_plague'],
+                        'report_id': result_data.get('report_id'),
+                        'scanned_at': result_data['scanned_at'],
+                    }
+                )
+            synced.append({'session_id': session.session_id, 'created': created})
+    return synced, []
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide consultas SQL y tiempo del sync de sesiones (fila a fila vs. bloque). "
+        "Todo se ejecuta dentro de una transacción que se revierte al final."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company-tax', dest='company_tax', required=True,
+                            help='tax_id de la empresa con al menos un cultivo (ej: DEMO123)')
+        parser.add_argument('--sessions', type=int, default=4, help='Sesiones por payload (por defecto 4)')
+        parser.add_argument('--results', type=int, default=250,
+                            help='Resultados por sesión (por defecto 250)')
+        parser.add_argument('--target', choices=['sessions', 'results'], default='sessions',
+                            help='sessions: sessions/sync/ antes vs después; '
+                                 'results: results/sync/ con 10 vs --results resultados (consultas constantes)')
+
+    def handle(self, *args, **options):
+        empresa = Empresa.objects.filter(tax_id=options['company_tax']).select_related('owner').first()
+        if not empresa:
+            raise CommandError(f"Empresa con tax_id='{options['company_tax']}' no encontrada.")
+        cultivo = Cultivo.objects.filter(zona__empresa=empresa).select_related('zona').first()
+        if not cultivo:
+            raise CommandError("La empresa no tiene cultivos. Ejecuta seed_demo seed_zones primero.")
+        owner = empresa.owner or empresa.members.first()
+        if not owner:
+            raise CommandError("La empresa no tiene usuarios.")
+
+        if options['target'] == 'results':
+            return self._bench_results(empresa, cultivo, owner, options)
+
+        total_results = options['sessions'] * options['results']
+        self.stdout.write(self.style.NOTICE(
+            f"Payload: {options['sessions']} sesiones x {options['results']} resultados = {total_results}"
+        ))
+
+        for label, func in (('antes (update_or_create)', legacy_sync_sessions), ('después (bulk upsert)', sync_sessions)):
+            for run in ('insert', 'update'):
+                payload = self._payload(empresa, cultivo, options['sessions'], options['results'])
+                with transaction.atomic():
+                    # La propiedad classification no registra etiquetas (ver scanners/taxonomy.py)
+                    ensure_labels({r['classification'] for s in payload for r in s['scan_results']})
+                    if run == 'update':
+                        # Segunda pasada sobre las mismas filas: camino de reintento/actualización
+                        sync_sessions(payload, owner)
+                    counter = QueryCounter()
+                    with connection.execute_wrapper(counter):
+                        start = time.perf_counter()
+                        func(payload, owner)
+                        elapsed = time.perf_counter() - start
+                    transaction.set_rollback(True)
+
+                queries = counter.count
+                per_1k = queries * 1000 / total_results if total_results else queries
+                self.stdout.write(
+                    f"{label:<26} {run:<7} queries={queries:<7} queries/1k resultados={per_1k:<9.1f} "
+                    f"tiempo={elapsed * 1000:.1f}ms"
+                )
+
+    def _bench_results(self, empresa, cultivo, owner, options):
+        """results/sync/: la cantidad de consultas no debe crecer con el tamaño del lote."""
+        for size in (10, options['results']):
+            payload = self._payload(empresa, cultivo, 2, 0)
+            results = [
+                {**r, 'session': payload[i % 2]['session_id']}
+                for i, r in enumerate(self._payload(empresa, cultivo, 1, size)[0]['scan_results'])
+            ]
+            with transaction.atomic():
+                sync_sessions(payload, owner)
+                counter = QueryCounter()
+                with connection.execute_wrapper(counter):
+                    start = time.perf_counter()
+                    synced, errors = sync_results(results, empresa)
+                    elapsed = time.perf_counter() - start
+                transaction.set_rollback(True)
+            self.stdout.write(
+                f"results/sync {size:<6} resultados  queries={counter.count:<4} "
+                f"synced={len(synced)} errors={len(errors)} tiempo={elapsed * 1000:.1f}ms"
+            )
+
+    def _payload(self, empresa, cultivo, sessions, results):
+        now = timezone.now().isoformat()
+        payload = []
+        for _ in range(sessions):
+            session_id = str(uuid.uuid4())
+            payload.append({
+                'session_id': session_id,
+                'empresa_id': empresa.id,
+                'zona_id': cultivo.zona_id,
+                'cultivo_id': cultivo.id,
+                'worker_name': 'benchmark',
+                'model_version_string': '1.0',
+                'started_at': now,
+                'status': 'ACTIVE',
+                'scan_results': [
+                    {
+                        'result_id': str(uuid.uuid4()),
+                        'photo_path': f'scanner_photos/{session_id}/{i}.jpg',
+                        'classification': 'Potato___Late_blight' if i % 3 else 'Potato___healthy',
+                        'confidence': 0.9,
+                        'has_plague': bool(i % 3),
+                        'scanned_at': now,
+                    }
+                    for i in range(results)
+                ],
+            })
+        return payload
@@ -0,0 +1,27 @@
+# scanners/management/commands/gc_photo_blobs.py
+from django.core.management.base import BaseCommand
+
+from cropcareBackend.object_storage import get_client
+from scanners.blobs import GC_GRACE_SECONDS, collect_garbage, recount
+
+
+class Command(BaseCommand):
+    help = (
+        "Elimina del bucket las fotos por contenido (PhotoBlob) que ningún resultado usa, "
+        "junto con sus variantes (pensado para cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, default=GC_GRACE_SECONDS,
+                            help=f'Segundos sin uso antes de borrar un blob (por defecto {GC_GRACE_SECONDS})')
+        parser.add_argument('--recount', action='store_true',
+                            help='Recalcula antes los refcount desde ScannerResult.photo_path')
+        parser.add_argument('--dry-run', action='store_true', help='Solo informa cuántos blobs se borrarían')
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            fixed = recount()
+            self.stdout.write(f"Refcount corregidos: {fixed}")
+        deleted = collect_garbage(get_client(), grace_seconds=options['grace'], dry_run=options['dry_run'])
+        label = "Blobs a eliminar" if options['dry_run'] else "Blobs eliminados"
+        self.stdout.write(self.style.SUCCESS(f"{label}: {deleted}"))
@@ -0,0 +1,12 @@
+# scanners/management/commands/purge_sync_ledger.py
+from django.core.management.base import BaseCommand
+
+from scanners.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = "Elimina las entradas vencidas del ledger de idempotencia de sync (pensado para cron)."
+
+    def handle(self, *args, **options):
+        deleted = purge_expired()
+        self.stdout.write(self.style.SUCCESS(f"Entradas eliminadas: {deleted}"))
@@ -0,0 +1,48 @@
+# scanners/management/commands/register_model.py
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from scanners.artifacts import register_model
+
+
+class Command(BaseCommand):
+    help = (
+        "Registra un modelo (.tflite) para la app: lo sube al bucket con su sha256, tamaño y etiquetas, "
+        "y genera el parche bsdiff desde la versión anterior del mismo modelo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='Ruta del archivo del modelo')
+        parser.add_argument('--name', required=True, help='Nombre del modelo (p. ej. potato)')
+        parser.add_argument('--model-version', required=True, help='Versión (p. ej. 1.3.0)')
+        parser.add_argument('--labels', help='Archivo de etiquetas, una por línea (por defecto {modelo}.labels.txt)')
+        parser.add_argument('--framework', default='tflite', help='Framework (por defecto tflite)')
+
+    def handle(self, *args, **options):
+        path = options['file']
+        if not os.path.isfile(path):
+            raise CommandError(f"No existe el archivo {path}.")
+        labels_path = options['labels'] or f"{os.path.splitext(path)[0]}.labels.txt"
+        if not os.path.isfile(labels_path):
+            raise CommandError(f"No existe el archivo de etiquetas {labels_path}.")
+
+        with open(labels_path, encoding='utf-8') as f:
+            labels = [line.strip() for line in f if line.strip()]
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        model_version, patch, reason = register_model(
+            options['name'], options['model_version'], data, labels, framework=options['framework'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{model_version} (id {model_version.pk}): {model_version.size} bytes, "
+            f"{len(labels)} etiquetas, sha256 {model_version.sha256[:12]}…"
+        ))
+        if patch:
+            self.stdout.write(self.style.SUCCESS(
+                f"Parche desde v{patch.from_version.version}: {patch.size} bytes "
+                f"({patch.size / model_version.size:.1%} del modelo)"
+            ))
+        else:
+            self.stdout.write(self.style.WARNING(f"Sin parche: {reason}"))
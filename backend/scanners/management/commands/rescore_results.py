@@ -0,0 +1,85 @@
+# scanners/management/commands/rescore_results.py
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from emprises.models import Empresa
+from scanners.inference import InferenceUnavailable
+from scanners.models import ModelVersion, RescoreJob
+from scanners.rescore import CHUNK_SIZE, create_job, run_job
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-clasifica los resultados históricos de una empresa con un ModelVersion del servidor, en un pool de "
+        "procesos. Guarda ScannerResultScore por versión (no pisa la clasificación original) y es reanudable."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model-id', type=int, help='id del ModelVersion con el que re-clasificar')
+        parser.add_argument('--company-tax', dest='company_tax', help='tax_id de la empresa (ej: DEMO123)')
+        parser.add_argument('--date-from', help='YYYY-MM-DD (incluido)')
+        parser.add_argument('--date-to', help='YYYY-MM-DD (excluido)')
+        parser.add_argument('--resume', type=int, metavar='JOB_ID', help='Reanuda un job desde su último checkpoint')
+        parser.add_argument('--list', action='store_true', help='Lista los jobs y su avance')
+        parser.add_argument('--processes', type=int, default=None, help='Procesos del pool (por defecto, núcleos)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help=f'Filas por chunk (por defecto {CHUNK_SIZE})')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for job in RescoreJob.objects.select_related('model_version', 'empresa')[:50]:
+                self.stdout.write(
+                    f"#{job.pk:<5} {job.status:<8} {job.empresa.tax_id:<12} {job.model_version} "
+                    f"{job.processed}/{job.total} ({job.progress}%) clasificados={job.scored} fallidos={job.failed}"
+                )
+            return
+
+        if options['resume']:
+            job = RescoreJob.objects.filter(pk=options['resume']).first()
+            if not job:
+                raise CommandError(f"Job {options['resume']} no encontrado.")
+        else:
+            job = self._new_job(options)
+        self.stdout.write(f"Job #{job.pk}: {job.model_version} sobre {job.empresa.tax_id}")
+
+        def progress(job):
+            self.stdout.write(f"  {job.processed}/{job.total} ({job.progress}%)", ending='\r')
+            self.stdout.flush()
+
+        try:
+            run_job(job, processes=options['processes'], chunk_size=options['chunk_size'], progress=progress)
+        except InferenceUnavailable as e:
+            raise CommandError(f"{e} (reanudar con --resume {job.pk})")
+        except Exception as e:
+            raise CommandError(f"Job #{job.pk} falló: {e} (reanudar con --resume {job.pk})")
+
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(
+            f"Job #{job.pk} terminado: {job.processed} resultados, {job.scored} clasificados, {job.failed} sin foto o ilegibles"
+        ))
+
+    def _new_job(self, options):
+        if not options['model_id'] or not options['company_tax']:
+            raise CommandError("Se requieren --model-id y --company-tax (o --resume / --list).")
+        model_version = ModelVersion.objects.filter(pk=options['model_id']).first()
+        if not model_version:
+            raise CommandError(f"ModelVersion {options['model_id']} no encontrado.")
+        empresa = Empresa.objects.filter(tax_id=options['company_tax']).first()
+        if not empresa:
+            raise CommandError(f"Empresa con tax_id='{options['company_tax']}' no encontrada.")
+        return create_job(
+            model_version, empresa,
+            date_from=self._date(options['date_from'], '--date-from'),
+            date_to=self._date(options['date_to'], '--date-to'),
+        )
+
+    def _date(self, value, flag):
+        if not value:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"{flag} debe tener formato YYYY-MM-DD.")
+        return timezone.make_aware(datetime.combine(day, time.min))
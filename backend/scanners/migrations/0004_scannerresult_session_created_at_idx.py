@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanners', '0003_syncledger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='scannerresult',
+            index=models.Index(fields=['session', 'created_at'], name='scanners_sc_session_6093a8_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanners', '0004_scannerresult_session_created_at_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scannerresult',
+            name='photo_variants',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanners', '0005_scannerresult_photo_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PhotoBlob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('size', models.PositiveIntegerField()),
+                ('content_type', models.CharField(default='image/jpeg', max_length=100)),
+                ('refcount', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Photo Blob',
+                'verbose_name_plural': 'Photo Blobs',
+                'indexes': [models.Index(fields=['refcount', 'last_used_at'], name='scanners_ph_refcoun_36c4c6_idx')],
+            },
+        ),
+    ]
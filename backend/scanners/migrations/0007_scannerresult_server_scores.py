@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanners', '0006_photoblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scannerresult',
+            name='server_classification',
+            field=models.CharField(blank=True, max_length=200, null=True),
+        ),
+        migrations.AddField(
+            model_name='scannerresult',
+            name='server_confidence',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='scannerresult',
+            name='server_model_version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='server_results', to='scanners.modelversion'),
+        ),
+        migrations.AddField(
+            model_name='scannerresult',
+            name='server_scored_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
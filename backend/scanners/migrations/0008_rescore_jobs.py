@@ -0,0 +1,86 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:46
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emprises', '0002_alter_empresa_owner'),
+        ('scanners', '0007_scannerresult_server_scores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RescoreJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_from', models.DateTimeField(blank=True, null=True)),
+                ('date_to', models.DateTimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('PENDING', 'Pendiente'), ('RUNNING', 'En curso'), ('DONE', 'Terminado'), ('FAILED', 'Fallido')], default='PENDING', max_length=20)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('scored', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('cursor_scanned_at', models.DateTimeField(blank=True, null=True)),
+                ('cursor_result_id', models.CharField(blank=True, default='', max_length=36)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Rescore Job',
+                'verbose_name_plural': 'Rescore Jobs',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ScannerResultScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('classification', models.CharField(max_length=200)),
+                ('confidence', models.FloatField()),
+                ('scored_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Scanner Result Score',
+                'verbose_name_plural': 'Scanner Result Scores',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='scannerresult',
+            index=models.Index(fields=['scanned_at', 'result_id'], name='scanners_sc_scanned_ffa45b_idx'),
+        ),
+        migrations.AddField(
+            model_name='rescorejob',
+            name='empresa',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rescore_jobs', to='emprises.empresa'),
+        ),
+        migrations.AddField(
+            model_name='rescorejob',
+            name='model_version',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rescore_jobs', to='scanners.modelversion'),
+        ),
+        migrations.AddField(
+            model_name='scannerresultscore',
+            name='model_version',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scores', to='scanners.modelversion'),
+        ),
+        migrations.AddField(
+            model_name='scannerresultscore',
+            name='result',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scores', to='scanners.scannerresult'),
+        ),
+        migrations.AddIndex(
+            model_name='scannerresultscore',
+            index=models.Index(fields=['model_version', 'classification'], name='scanners_sc_model_v_a4e73c_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='scannerresultscore',
+            unique_together={('result', 'model_version')},
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanners', '0008_rescore_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modelversion',
+            name='labels',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='modelversion',
+            name='sha256',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='modelversion',
+            name='size',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ModelPatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_path', models.CharField(max_length=512)),
+                ('sha256', models.CharField(max_length=64)),
+                ('size', models.BigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('from_version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='patches_from', to='scanners.modelversion')),
+                ('to_version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='patches_to', to='scanners.modelversion')),
+            ],
+            options={
+                'verbose_name': 'Model Patch',
+                'verbose_name_plural': 'Model Patches',
+                'unique_together': {('from_version', 'to_version')},
+            },
+        ),
+    ]
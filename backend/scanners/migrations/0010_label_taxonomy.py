@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:51
+
+from django.db import migrations, models
+
+
+def populate_taxonomy(apps, schema_editor):
+    # Etiquetas ya vistas; mismo criterio que scanners.taxonomy.parse_label (se corrige en el admin)
+    ScannerResult = apps.get_model('scanners', 'ScannerResult')
+    LabelTaxonomy = apps.get_model('scanners', 'LabelTaxonomy')
+    labels = ScannerResult.objects.order_by().values_list('classification', flat=True).distinct()
+    rows = []
+    for label in labels:
+        crop, _, disease = label.partition('___') if '___' in label else label.partition('_')
+        is_healthy = 'healthy' in label.lower()
+        rows.append(LabelTaxonomy(
+            classification=label, crop=crop[:100], is_healthy=is_healthy,
+            disease='' if is_healthy else disease.replace('_', ' ').strip()[:100],
+        ))
+    LabelTaxonomy.objects.bulk_create(rows, batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanners', '0009_model_artifacts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LabelTaxonomy',
+            fields=[
+                ('id', models.SmallAutoField(primary_key=True, serialize=False)),
+                ('classification', models.CharField(max_length=200, unique=True)),
+                ('crop', models.CharField(blank=True, default='', max_length=100)),
+                ('disease', models.CharField(blank=True, default='', max_length=100)),
+                ('is_healthy', models.BooleanField(default=False)),
+                ('confidence_threshold', models.FloatField(default=0.6)),
+                ('calibrated_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Label Taxonomy',
+                'verbose_name_plural': 'Label Taxonomy',
+                'ordering': ['crop', 'classification'],
+            },
+        ),
+        migrations.RunPython(populate_taxonomy, migrations.RunPython.noop),
+    ]
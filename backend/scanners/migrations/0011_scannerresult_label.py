@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanners', '0010_label_taxonomy'),
+    ]
+
+    operations = [
+        # Nullable: se agrega sin reescribir la tabla; el backfill va en 0012
+        migrations.AddField(
+            model_name='scannerresult',
+            name='label',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='results', to='scanners.labeltaxonomy'),
+        ),
+    ]
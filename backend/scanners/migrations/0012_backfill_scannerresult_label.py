@@ -0,0 +1,52 @@
+from django.db import migrations, transaction
+from django.db.models import OuterRef, Subquery
+
+
+BATCH_SIZE = 5000
+
+
+def backfill_labels(apps, schema_editor):
+    """
+    label_id desde classification, por lotes de BATCH_SIZE filas ordenadas por
+    result_id, cada uno en su propia transacción (bloqueos cortos; se puede
+    cortar y volver a correr: solo toma filas sin label).
+    """
+    ScannerResult = apps.get_model('scanners', 'ScannerResult')
+    LabelTaxonomy = apps.get_model('scanners', 'LabelTaxonomy')
+
+    # Etiquetas que llegaron después de 0010
+    known = set(LabelTaxonomy.objects.values_list('classification', flat=True))
+    labels = set(ScannerResult.objects.order_by().values_list('classification', flat=True).distinct())
+    rows = []
+    for label in labels - known:
+        crop, _, disease = label.partition('___') if '___' in label else label.partition('_')
+        is_healthy = 'healthy' in label.lower()
+        rows.append(LabelTaxonomy(
+            classification=label, crop=crop[:100], is_healthy=is_healthy,
+            disease='' if is_healthy else disease.replace('_', ' ').strip()[:100],
+        ))
+    LabelTaxonomy.objects.bulk_create(rows, ignore_conflicts=True)
+
+    label_id = Subquery(LabelTaxonomy.objects.filter(classification=OuterRef('classification')).values('pk')[:1])
+    pending = ScannerResult.objects.filter(label__isnull=True).order_by('result_id')
+    last = ''
+    while True:
+        ids = list(pending.filter(result_id__gt=last).values_list('result_id', flat=True)[:BATCH_SIZE])
+        if not ids:
+            break
+        with transaction.atomic():
+            ScannerResult.objects.filter(result_id__in=ids).update(label_id=label_id)
+        last = ids[-1]
+
+
+class Migration(migrations.Migration):
+    # Sin transacción global: cada lote confirma por separado
+    atomic = False
+
+    dependencies = [
+        ('scanners', '0011_scannerresult_label'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_labels, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+
+
+def restore_classification(apps, schema_editor):
+    ScannerResult = apps.get_model('scanners', 'ScannerResult')
+    LabelTaxonomy = apps.get_model('scanners', 'LabelTaxonomy')
+    for pk, classification in LabelTaxonomy.objects.values_list('pk', 'classification'):
+        ScannerResult.objects.filter(label_id=pk).update(classification=classification)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanners', '0012_backfill_scannerresult_label'),
+    ]
+
+    # Al revertir: la columna vuelve nullable, se completa desde label y recién ahí vuelve a NOT NULL
+    operations = [
+        migrations.AlterField(
+            model_name='scannerresult',
+            name='classification',
+            field=models.CharField(max_length=200, null=True),
+        ),
+        migrations.RunPython(migrations.RunPython.noop, restore_classification),
+        migrations.RemoveIndex(
+            model_name='scannerresult',
+            name='scanners_sc_classif_560247_idx',
+        ),
+        migrations.RemoveField(
+            model_name='scannerresult',
+            name='classification',
+        ),
+    ]
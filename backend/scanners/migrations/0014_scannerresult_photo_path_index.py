@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanners', '0013_remove_scannerresult_classification'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='scannerresult',
+            index=models.Index(fields=['photo_path'], name='scanners_sc_photo_p_ce7c54_idx'),
+        ),
+    ]
@@ -8,17 +8,44 @@ User = settings.AUTH_USER_MODEL
 
 
 # ------------------- VALIDADORES -------------------
+MAX_IMAGE_BYTES = 5 * 1024 * 1024  # 5MB máximo
+MAX_IMAGE_PIXELS = getattr(settings, 'SCANNER_MAX_IMAGE_PIXELS', 40_000_000)
+IMAGE_SIGNATURES = {
+    b'\xff\xd8\xff': 'JPEG',
+    b'\x89PNG\r\n\x1a\n': 'PNG',
+}
+
+
 def validate_image_format(image):
-    """Valida que el formato sea válido y no corrupto."""
+    """
+    Valida tamaño, formato y dimensiones leyendo solo la cabecera.
+
+    El tamaño sale del largo declarado del upload y el formato de los primeros
+    bytes; Pillow abre la imagen de forma perezosa (solo cabecera) para el
+    límite de píxeles. La verificación completa se hace en el worker
+    (scanners/imaging.py), no en la petición.
+    """
+    size = getattr(image, 'size', None)
+    if size is not None and size > MAX_IMAGE_BYTES:
+        raise ValidationError("La imagen excede los 5MB permitidos.")
+
+    fileobj = getattr(image, 'file', image)
+    position = fileobj.tell()
     try:
-        img = Image.open(image)
-        img.verify()
-        if img.format not in ["JPEG", "PNG"]:
+        header = fileobj.read(8)
+        if not any(header.startswith(signature) for signature in IMAGE_SIGNATURES):
             raise ValidationError("Solo se permiten imágenes JPEG o PNG.")
-        if image.size > 5 * 1024 * 1024:  # 5MB máximo
-            raise ValidationError("La imagen excede los 5MB permitidos.")
-    except Exception:
-        raise ValidationError("Imagen inválida o corrupta.")
+        fileobj.seek(position)
+        try:
+            with Image.open(fileobj) as img:
+                width, height = img.size
+        except Exception:
+            # Cabecera ilegible o ya sobre el límite de Pillow (DecompressionBombError)
+            raise ValidationError("Imagen inválida o corrupta.")
+        if width * height > MAX_IMAGE_PIXELS:
+            raise ValidationError(f"La imagen excede los {MAX_IMAGE_PIXELS // 1_000_000} megapíxeles permitidos.")
+    finally:
+        fileobj.seek(position)
 
 
 # ------------------- MODELOS -------------------
@@ -28,6 +55,10 @@ class ModelVersion(models.Model):
     version = models.CharField(max_length=50)
     file_path = models.CharField(max_length=512, blank=True, null=True)
     framework = models.CharField(max_length=50, default='tflite')
+    # Artefacto en el bucket (scanners/artifacts.py): hash de contenido, bytes y etiquetas en orden de salida
+    sha256 = models.CharField(max_length=64, blank=True, default='')
+    size = models.BigIntegerField(null=True, blank=True)
+    labels = models.JSONField(default=list, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -39,6 +70,47 @@ class ModelVersion(models.Model):
         return f"{self.name} v{self.version} ({self.framework})"
 
 
+class ModelPatch(models.Model):
+    """Diff binario (bsdiff) entre dos versiones de un modelo, para descargas livianas."""
+    from_version = models.ForeignKey(ModelVersion, on_delete=models.CASCADE, related_name='patches_from')
+    to_version = models.ForeignKey(ModelVersion, on_delete=models.CASCADE, related_name='patches_to')
+    file_path = models.CharField(max_length=512)
+    sha256 = models.CharField(max_length=64)
+    size = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('from_version', 'to_version')
+        verbose_name = 'Model Patch'
+        verbose_name_plural = 'Model Patches'
+
+    def __str__(self):
+        return f"{self.from_version} -> {self.to_version.version} ({self.size} B)"
+
+
+class LabelTaxonomy(models.Model):
+    """
+    Qué significa cada classification del modelo: cultivo, enfermedad y si es sana,
+    con el umbral de confianza calibrado para esa clase (ver scanners/taxonomy.py).
+    """
+    id = models.SmallAutoField(primary_key=True)  # pocas filas: una por clase
+    classification = models.CharField(max_length=200, unique=True)
+    crop = models.CharField(max_length=100, blank=True, default='')
+    disease = models.CharField(max_length=100, blank=True, default='')
+    is_healthy = models.BooleanField(default=False)
+    confidence_threshold = models.FloatField(default=0.6)
+    calibrated_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Label Taxonomy'
+        verbose_name_plural = 'Label Taxonomy'
+        ordering = ['crop', 'classification']
+
+    def __str__(self):
+        return f"{self.classification} ({'sana' if self.is_healthy else self.disease or 'plaga'})"
+
+
 class ScannerSession(models.Model):
     """Una sesión de escaneo iniciada por un worker en un cultivo."""
     
@@ -128,11 +200,21 @@ class ScannerResult(models.Model):
     
     # Path local de la foto (sin subir imagen completa si no es necesario)
     photo_path = models.CharField(max_length=500)
+    # Variantes ya generadas de la foto (scanners/imaging.py): ['full', 'thumb', 'model']
+    photo_variants = models.JSONField(default=list, blank=True)
     
-    # Clasificación
-    classification = models.CharField(max_length=200)  # ej: "healthy" o "Potato___Late_blight"
+    # Clasificación: FK entera a la taxonomía; la API sigue usando el texto (propiedad classification)
+    label = models.ForeignKey(LabelTaxonomy, on_delete=models.PROTECT, related_name='results', null=True, blank=True)
     confidence = models.FloatField()  # 0.0 - 1.0
     has_plague = models.BooleanField(default=False)
+
+    # Clasificación hecha en el servidor (scanners/inference.py); no reemplaza la del teléfono
+    server_classification = models.CharField(max_length=200, null=True, blank=True)
+    server_confidence = models.FloatField(null=True, blank=True)
+    server_model_version = models.ForeignKey(
+        ModelVersion, on_delete=models.SET_NULL, null=True, blank=True, related_name='server_results'
+    )
+    server_scored_at = models.DateTimeField(null=True, blank=True)
     
     # Vinculación con reporte (si se creó uno)
     report_id = models.IntegerField(null=True, blank=True)
@@ -145,11 +227,160 @@ class ScannerResult(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=['session', 'has_plague']),
-            models.Index(fields=['classification']),
+            models.Index(fields=['session', 'created_at']),
+            # Recorridos por cursor (listados paginados, rescore_results)
+            models.Index(fields=['scanned_at', 'result_id']),
+            # Resultados que usan una foto (imaging.process_photo, tasks.score_photo_async, blobs)
+            models.Index(fields=['photo_path']),
         ]
         verbose_name = 'Scanner Result'
         verbose_name_plural = 'Scanner Results'
         ordering = ['-scanned_at']
 
     def __str__(self):
-        return f"{self.classification} ({self.confidence:.2f})"
\ No newline at end of file
+        return f"{self.classification} ({self.confidence:.2f})"
+
+    @property
+    def classification(self):
+        """Etiqueta en texto, ej: "Potato___Late_blight" (sin consulta: ver scanners/taxonomy.py)."""
+        from .taxonomy import label_name
+
+        return label_name(self.label_id) if self.label_id is not None else ''
+
+    @classification.setter
+    def classification(self, value):
+        """Solo busca la etiqueta; si es nueva hay que registrarla antes con taxonomy.ensure_labels()."""
+        from .taxonomy import label_id_for
+
+        label_id = label_id_for(value) if value else None
+        if value and label_id is None:
+            raise ValueError(f"Etiqueta '{value}' no registrada en LabelTaxonomy.")
+        self.label_id = label_id
+
+
+class ScannerResultScore(models.Model):
+    """Clasificación de un resultado por un modelo del servidor (una fila por versión, no pisa la original)."""
+    result = models.ForeignKey(ScannerResult, on_delete=models.CASCADE, related_name='scores')
+    model_version = models.ForeignKey(ModelVersion, on_delete=models.CASCADE, related_name='scores')
+    classification = models.CharField(max_length=200)
+    confidence = models.FloatField()
+    scored_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ('result', 'model_version')
+        indexes = [models.Index(fields=['model_version', 'classification'])]
+        verbose_name = 'Scanner Result Score'
+        verbose_name_plural = 'Scanner Result Scores'
+
+    def __str__(self):
+        return f"{self.result_id} @ {self.model_version_id}: {self.classification}"
+
+
+class RescoreJob(models.Model):
+    """Re-clasificación masiva de resultados históricos con un ModelVersion (reanudable)."""
+
+    STATUS_CHOICES = [
+        ('PENDING', 'Pendiente'),
+        ('RUNNING', 'En curso'),
+        ('DONE', 'Terminado'),
+        ('FAILED', 'Fallido'),
+    ]
+
+    model_version = models.ForeignKey(ModelVersion, on_delete=models.CASCADE, related_name='rescore_jobs')
+    empresa = models.ForeignKey('emprises.Empresa', on_delete=models.CASCADE, related_name='rescore_jobs')
+    date_from = models.DateTimeField(null=True, blank=True)
+    date_to = models.DateTimeField(null=True, blank=True)
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    scored = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+
+    # Checkpoint: último (scanned_at, result_id) confirmado, en el orden del recorrido
+    cursor_scanned_at = models.DateTimeField(null=True, blank=True)
+    cursor_result_id = models.CharField(max_length=36, blank=True, default='')
+
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Rescore Job'
+        verbose_name_plural = 'Rescore Jobs'
+
+    def __str__(self):
+        return f"Rescore {self.pk} ({self.model_version}) {self.processed}/{self.total}"
+
+    @property
+    def progress(self):
+        return round(self.processed / self.total * 100, 1) if self.total else 0.0
+
+
+class PhotoBlob(models.Model):
+    """Foto almacenada por contenido (sha256), compartida por los resultados que la usan."""
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    size = models.PositiveIntegerField()
+    content_type = models.CharField(max_length=100, default='image/jpeg')
+
+    # Resultados cuyo photo_path apunta a este blob; en 0 lo recoge gc_photo_blobs
+    refcount = models.IntegerField(default=0)
+
+    created_at = models.DateTimeField(default=timezone.now)
+    last_used_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['refcount', 'last_used_at'])]
+        verbose_name = 'Photo Blob'
+        verbose_name_plural = 'Photo Blobs'
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.refcount})"
+
+
+class IngestCheckpoint(models.Model):
+    """Progreso confirmado de una carga NDJSON (para reanudar tras un corte)."""
+    upload_id = models.CharField(max_length=64)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ingest_checkpoints')
+
+    # Líneas del stream ya confirmadas en la BD
+    committed_offset = models.PositiveIntegerField(default=0)
+    chunks_committed = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('owner', 'upload_id')
+        verbose_name = 'Ingest Checkpoint'
+        verbose_name_plural = 'Ingest Checkpoints'
+
+    def __str__(self):
+        return f"{self.upload_id} @ {self.committed_offset}"
+
+
+class SyncLedger(models.Model):
+    """Registro de lotes de sync ya procesados (Idempotency-Key), con expiración."""
+    key = models.CharField(max_length=128)
+    endpoint = models.CharField(max_length=64)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sync_ledger')
+
+    payload_hash = models.CharField(max_length=64)
+    # null mientras el lote se está procesando
+    response = models.JSONField(null=True, blank=True)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('owner', 'endpoint', 'key')
+        indexes = [models.Index(fields=['expires_at'])]
+        verbose_name = 'Sync Ledger Entry'
+        verbose_name_plural = 'Sync Ledger'
+
+    def __str__(self):
+        return f"{self.endpoint}:{self.key}"
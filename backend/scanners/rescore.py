@@ -0,0 +1,182 @@
+# scanners/rescore.py
+"""
+Re-clasificación masiva de resultados históricos con un ModelVersion.
+
+run_job() recorre los ScannerResult de la empresa/rango del RescoreJob por
+cursor (scanned_at, result_id), en chunks de SCANNER_RESCORE_CHUNK_SIZE filas
+(solo las columnas necesarias), y los reparte en un pool de procesos. Cada
+proceso carga el modelo una vez, lee las fotos y las clasifica en lotes.
+
+Los chunks se confirman en orden: por cada uno se escriben las
+ScannerResultScore (una fila por resultado y versión, la clasificación
+original no se toca) y se avanza el checkpoint del job en la misma
+transacción. Un job interrumpido se reanuda desde el último chunk confirmado.
+Nunca hay más de 2 chunks por proceso en vuelo, así que la memoria no depende
+de la cantidad de filas.
+"""
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .inference import get_model
+from .models import RescoreJob, ScannerResult, ScannerResultScore
+
+
+CHUNK_SIZE = getattr(settings, 'SCANNER_RESCORE_CHUNK_SIZE', 500)
+READ_THREADS = 4
+
+
+def job_results(job):
+    """ScannerResult que abarca el job, sin el corte del checkpoint."""
+    results = ScannerResult.objects.filter(session__empresa_id=job.empresa_id)
+    if job.date_from:
+        results = results.filter(scanned_at__gte=job.date_from)
+    if job.date_to:
+        results = results.filter(scanned_at__lt=job.date_to)
+    return results
+
+
+def iter_chunks(job, chunk_size=CHUNK_SIZE):
+    """Chunks [(result_id, photo_path, image_name, scanned_at)] desde el checkpoint, por cursor."""
+    results = job_results(job).order_by('scanned_at', 'result_id')
+    scanned_at, result_id = job.cursor_scanned_at, job.cursor_result_id
+    while True:
+        page = results
+        if scanned_at is not None:
+            page = page.filter(Q(scanned_at__gt=scanned_at) | Q(scanned_at=scanned_at, result_id__gt=result_id))
+        rows = list(page.values_list('result_id', 'photo_path', 'image__image', 'scanned_at')[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        scanned_at, result_id = rows[-1][3], rows[-1][0]
+
+
+# ------------------- PROCESOS HIJOS -------------------
+_worker_model = None
+_worker_error = None
+
+
+def _init_worker(model_version_id):
+    # Un initializer que lanza hace que el Pool reemplace el proceso sin fin: el error se
+    # guarda y lo relanza _score_chunk, así llega al proceso principal por async_result.get()
+    global _worker_model, _worker_error
+    try:
+        import django
+        django.setup()  # no-op con fork; necesario con spawn
+
+        from .models import ModelVersion
+
+        _worker_model = get_model(ModelVersion.objects.get(pk=model_version_id))
+    except Exception as e:
+        _worker_error = e
+    finally:
+        connections.close_all()
+
+
+def _read(row):
+    from .inference import preprocess, read_photo_source
+
+    try:
+        raw = read_photo_source(row[1], row[2])
+        return preprocess(raw) if raw else None
+    except Exception:
+        return None
+
+
+def _score_chunk(rows):
+    """[(result_id, label, confidence)], fallidos — se ejecuta en un proceso del pool."""
+    import numpy as np
+    from .inference import BATCH_SIZE
+
+    if _worker_error is not None:
+        raise _worker_error
+    with ThreadPoolExecutor(max_workers=READ_THREADS) as pool:
+        arrays = list(pool.map(_read, rows))
+
+    ready = [(row[0], array) for row, array in zip(rows, arrays) if array is not None]
+    scores = []
+    for start in range(0, len(ready), BATCH_SIZE):
+        batch = ready[start:start + BATCH_SIZE]
+        for (result_id, _), row in zip(batch, _worker_model.predict(np.stack([a for _, a in batch]))):
+            best = int(row.argmax())
+            scores.append((result_id, _worker_model.labels[best], float(row[best])))
+    return scores, len(rows) - len(scores)
+
+
+# ------------------- PROCESO PRINCIPAL -------------------
+def _commit(job, last_row, size, async_result):
+    scores, failed = async_result.get()
+    now = timezone.now()
+    with transaction.atomic():
+        ScannerResultScore.objects.bulk_create(
+            [
+                ScannerResultScore(result_id=result_id, model_version_id=job.model_version_id,
+                                   classification=label, confidence=confidence, scored_at=now)
+                for result_id, label, confidence in scores
+            ],
+            update_conflicts=True,
+            unique_fields=['result', 'model_version'],
+            update_fields=['classification', 'confidence', 'scored_at'],
+        )
+        job.processed += size
+        job.scored += len(scores)
+        job.failed += failed
+        job.cursor_result_id, job.cursor_scanned_at = last_row[0], last_row[3]
+        job.save(update_fields=[
+            'processed', 'scored', 'failed', 'cursor_result_id', 'cursor_scanned_at', 'updated_at',
+        ])
+
+
+def run_job(job, processes=None, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Ejecuta (o reanuda) un RescoreJob. progress(job) se llama tras cada chunk confirmado.
+    """
+    processes = processes or os.cpu_count() or 1
+    if job.status == 'DONE':
+        return job
+    if not job.total:
+        job.total = job_results(job).count()
+    job.status = 'RUNNING'
+    job.error = ''
+    job.started_at = job.started_at or timezone.now()
+    job.save(update_fields=['total', 'status', 'error', 'started_at', 'updated_at'])
+
+    context = multiprocessing.get_context()
+    pending = deque()
+    try:
+        # Se carga una vez acá: sin runtime o sin archivo (InferenceUnavailable) el job
+        # queda FAILED antes de crear el pool
+        get_model(job.model_version)
+        # Los procesos hijos no deben heredar conexiones abiertas
+        connections.close_all()
+        with context.Pool(processes, initializer=_init_worker, initargs=(job.model_version_id,)) as pool:
+            for rows in iter_chunks(job, chunk_size):
+                pending.append((rows[-1], len(rows), pool.apply_async(_score_chunk, (rows,))))
+                while len(pending) >= processes * 2:
+                    _commit(job, *pending.popleft())
+                    if progress:
+                        progress(job)
+            while pending:
+                _commit(job, *pending.popleft())
+                if progress:
+                    progress(job)
+    except Exception as e:
+        job.status = 'FAILED'
+        job.error = str(e)
+        job.save(update_fields=['status', 'error', 'updated_at'])
+        raise
+
+    job.status = 'DONE'
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'finished_at', 'updated_at'])
+    return job
+
+
+def create_job(model_version, empresa, date_from=None, date_to=None):
+    return RescoreJob.objects.create(model_version=model_version, empresa=empresa, date_from=date_from, date_to=date_to)
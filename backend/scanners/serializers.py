@@ -1,13 +1,58 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
-from .models import ModelVersion, ScannerSession, ScannerImage, ScannerResult
+
+from core.projection import FieldProjectionMixin
+from .models import ModelVersion, RescoreJob, ScannerSession, ScannerImage, ScannerResult
+from .taxonomy import ensure_labels
+
+
+class RescoreJobSerializer(serializers.ModelSerializer):
+    progress = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = RescoreJob
+        fields = [
+            'id', 'model_version', 'date_from', 'date_to', 'status', 'total', 'processed',
+            'scored', 'failed', 'progress', 'error', 'created_at', 'started_at', 'finished_at', 'updated_at',
+        ]
+        read_only_fields = fields
 
 
 class ModelVersionSerializer(serializers.ModelSerializer):
+    # Versiones desde las que hay parche (GET models/{id}/patch/?from=<id>)
+    patch_from = serializers.SerializerMethodField()
+
     class Meta:
         model = ModelVersion
-        fields = ['id', 'name', 'version', 'framework', 'file_path', 'created_at']
+        fields = ['id', 'name', 'version', 'framework', 'file_path', 'sha256', 'size', 'labels',
+                  'patch_from', 'created_at']
+
+    def get_patch_from(self, obj):
+        return sorted(patch.from_version_id for patch in obj.patches_to.all())
+
+class LabelWriteMixin:
+    """
+    classification llega en texto y se guarda como FK a LabelTaxonomy. La etiqueta se
+    resuelve al guardar (dentro del atomic de perform_create/perform_update), no al
+    validar: las nuevas se registran con ensure_labels().
+    """
+
+    def _resolve_label(self, validated_data):
+        classification = validated_data.pop('classification', None)
+        if classification is not None:
+            validated_data['label_id'] = ensure_labels([classification])[classification]
+        return validated_data
+
+    def create(self, validated_data):
+        return super().create(self._resolve_label(validated_data))
+
+    def update(self, instance, validated_data):
+        return super().update(instance, self._resolve_label(validated_data))
 
-class ScannerResultSerializer(serializers.ModelSerializer):
+
+class ScannerResultSerializer(LabelWriteMixin, FieldProjectionMixin, serializers.ModelSerializer):
+    # Se guarda como FK a LabelTaxonomy; la API sigue en texto
+    classification = serializers.CharField(max_length=200)
     image_url = serializers.SerializerMethodField()
     
     class Meta:
@@ -15,9 +60,13 @@ class ScannerResultSerializer(serializers.ModelSerializer):
         fields = [
             'result_id', 'session', 'photo_path', 'classification', 
             'confidence', 'has_plague', 'report_id', 'scanned_at', 
-            'created_at', 'bbox', 'image_url'
+            'created_at', 'bbox', 'image_url',
+            'server_classification', 'server_confidence', 'server_model_version', 'server_scored_at',
+        ]
+        read_only_fields = [
+            'created_at', 'image_url',
+            'server_classification', 'server_confidence', 'server_model_version', 'server_scored_at',
         ]
-        read_only_fields = ['created_at', 'image_url']
     
     def get_image_url(self, obj):
         """Genera URL para obtener la imagen"""
@@ -30,6 +79,8 @@ class ScannerResultSerializer(serializers.ModelSerializer):
 
 class ScannerImageSerializer(serializers.ModelSerializer):
     results = ScannerResultSerializer(many=True, read_only=True)
+    # FileField y no ImageField: este último decodifica la imagen completa en la petición
+    image = serializers.FileField()
 
     class Meta:
         model = ScannerImage
@@ -46,7 +97,9 @@ class ScannerImageSerializer(serializers.ModelSerializer):
         return image
 
 
-class ScannerSessionSerializer(serializers.ModelSerializer):
+class ScannerSessionSerializer(FieldProjectionMixin, serializers.ModelSerializer):
+    expandable_fields = ('images', 'scan_results')
+
     images = ScannerImageSerializer(many=True, read_only=True)
     scan_results = ScannerResultSerializer(many=True, read_only=True)
     
@@ -68,6 +121,23 @@ class ScannerSessionSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at', 'updated_at', 'images', 'scan_results']
 
+    @classmethod
+    def setup_eager_loading(cls, queryset, query_params=None):
+        """
+        select/prefetch de todo lo que serializa esta clase: la cantidad de consultas
+        no depende de la cantidad de sesiones. Al agregar un campo anidado o una
+        relación (source='x.y'), agregarlo también aquí. Los anidados que la
+        proyección (?fields=/?expand=) omite no se cargan.
+        """
+        queryset = queryset.select_related('empresa', 'zona', 'cultivo')
+        if cls.wants(query_params, 'images'):
+            queryset = queryset.prefetch_related(
+                Prefetch('images', queryset=ScannerImage.objects.prefetch_related('results'))
+            )
+        if cls.wants(query_params, 'scan_results'):
+            queryset = queryset.prefetch_related('scan_results')
+        return queryset
+
     def validate(self, attrs):
         empresa = attrs.get('empresa')
         cultivo = attrs.get('cultivo')
@@ -90,9 +160,10 @@ class ScannerSessionCreateSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class ScanResultCreateSerializer(serializers.ModelSerializer):
+class ScanResultCreateSerializer(LabelWriteMixin, serializers.ModelSerializer):
     """Serializer para crear resultados de escaneo desde el cliente."""
-    
+    classification = serializers.CharField(max_length=200)
+
     class Meta:
         model = ScannerResult
         fields = [
@@ -106,9 +177,11 @@ class ScanResultCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("No se pueden agregar escaneos a una sesión no activa.")
         return value
 
-class ScannerSessionWithReportSerializer(serializers.ModelSerializer):
+class ScannerSessionWithReportSerializer(FieldProjectionMixin, serializers.ModelSerializer):
     """Sesión con reporte Y resultados anidados"""
     from reports.serializers import SessionReportSerializer
+
+    expandable_fields = ('report', 'scan_results')
     
     report = SessionReportSerializer(source='session_report', read_only=True)
     scan_results = ScannerResultSerializer(many=True, read_only=True)
@@ -124,4 +197,47 @@ class ScannerSessionWithReportSerializer(serializers.ModelSerializer):
             'started_at', 'finished_at', 'status',
             'total_scans', 'healthy_count', 'plague_count',
             'notes', 'report', 'scan_results'
-        ]
\ No newline at end of file
+        ]
+
+# with_reports?mode=summary: columnas escalares leídas con values() (sin instanciar
+# modelos ni serializers anidados); el reporte se reduce a su titular.
+SESSION_SUMMARY_COLUMNS = {
+    'session_id': 'session_id',
+    'worker_name': 'worker_name',
+    'zona': 'zona_id',
+    'zona_name': 'zona__nombre',
+    'cultivo': 'cultivo_id',
+    'cultivo_name': 'cultivo__nombre',
+    'started_at': 'started_at',
+    'finished_at': 'finished_at',
+    'status': 'status',
+    'total_scans': 'total_scans',
+    'healthy_count': 'healthy_count',
+    'plague_count': 'plague_count',
+}
+REPORT_SUMMARY_COLUMNS = {
+    'id': 'session_report__id',
+    'detections_count': 'session_report__detections_count',
+    'suspicious_detections_count': 'session_report__suspicious_detections_count',
+    'average_confidence': 'session_report__average_confidence',
+    'low_confidence_flag': 'session_report__low_confidence_flag',
+    'suspicious_flag': 'session_report__suspicious_flag',
+    'generated_at': 'session_report__generated_at',
+}
+
+
+def session_summary_values(queryset):
+    return queryset.values(*SESSION_SUMMARY_COLUMNS.values(), *REPORT_SUMMARY_COLUMNS.values())
+
+
+def session_summary(row):
+    """Fila de session_summary_values() -> dict de la respuesta (fechas como en los serializers)."""
+    as_datetime = serializers.DateTimeField().to_representation
+    data = {key: row[column] for key, column in SESSION_SUMMARY_COLUMNS.items()}
+    data['started_at'] = as_datetime(data['started_at'])
+    data['finished_at'] = as_datetime(data['finished_at'])
+    data['report'] = None
+    if row['session_report__id'] is not None:
+        data['report'] = {key: row[column] for key, column in REPORT_SUMMARY_COLUMNS.items()}
+        data['report']['generated_at'] = as_datetime(data['report']['generated_at'])
+    return data
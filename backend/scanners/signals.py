@@ -0,0 +1,56 @@
+# scanners/signals.py
+"""
+Señales propias de la app scanners.
+
+results_changed se emite cada vez que se escriben o borran ScannerResult, ya
+sea en bloque (sync/ingesta, donde bulk_create no emite post_save) o desde el
+ViewSet. Argumentos:
+  - previous: {result_id: (session_id, classification, confidence)} con los
+    valores anteriores de los resultados que ya existían (o que se borraron)
+  - current:  lista de ScannerResult tal como quedaron guardados
+
+sessions_synced reemplaza a post_save para las sesiones escritas en bloque por
+el sync/ingesta (bulk_create no lo emite). Se emite dentro de la transacción
+de escritura. Argumentos:
+  - sessions: lista de ScannerSession tal como quedaron guardadas
+  - created:  set de session_id que no existían antes del lote
+Receptores: reports.signals.on_sessions_synced (SessionReport de las
+sesiones completadas).
+"""
+from django.db.models.signals import pre_delete
+from django.dispatch import Signal, receiver
+
+from .models import ScannerImage, ScannerSession
+
+results_changed = Signal()
+sessions_synced = Signal()
+
+
+def result_snapshot(results):
+    """{result_id: (session_id, classification, confidence)} para una lista de resultados."""
+    return {r.result_id: (r.session_id, r.classification, r.confidence) for r in results}
+
+
+@receiver(pre_delete, sender=ScannerSession)
+def on_session_deleted(sender, instance, **kwargs):
+    """
+    Libera en bloque las referencias a blobs de los resultados de la sesión. Es un
+    receiver de la sesión y no de ScannerResult: así el borrado en cascada de los
+    resultados sigue siendo un DELETE por lote (fast delete) y no uno por fila.
+    """
+    from .blobs import release_session_photos
+
+    release_session_photos([instance.pk])
+
+
+@receiver(pre_delete, sender=ScannerImage)
+def on_image_deleted(sender, instance, origin=None, **kwargs):
+    """
+    Igual para los resultados de una ScannerImage borrada por su cuenta. Si el
+    borrado viene de la sesión, on_session_deleted ya liberó todos sus resultados.
+    """
+    if isinstance(origin, ScannerSession) or getattr(origin, 'model', None) is ScannerSession:
+        return
+    from .blobs import release_image_photos
+
+    release_image_photos([instance.pk])
@@ -0,0 +1,423 @@
+# scanners/sync.py
+"""
+Motor de sincronización masiva para sesiones y resultados de escaneo.
+
+Valida todo el payload en memoria y luego escribe sesiones y resultados con
+INSERT ... ON CONFLICT DO UPDATE por lotes (bulk_create con update_conflicts),
+de modo que la cantidad de sentencias no depende de la cantidad de filas.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from zonecrop.models import Cultivo
+from .blobs import blob_sha
+from .models import LabelTaxonomy, ScannerSession, ScannerResult
+from .signals import results_changed, sessions_synced
+from .taxonomy import ensure_labels, label_name
+
+
+# Filas por sentencia INSERT (una sola sentencia hasta este tamaño)
+BULK_BATCH_SIZE = getattr(settings, 'SCANNER_SYNC_BATCH_SIZE', 2000)
+# Sesiones por savepoint al escribir (un chunk que falla se reintenta sesión por sesión)
+SYNC_CHUNK_SESSIONS = getattr(settings, 'SCANNER_SYNC_CHUNK_SESSIONS', 200)
+# Margen para transacciones que confirman con un timestamp anterior al cursor
+DELTA_SAFETY_SECONDS = getattr(settings, 'SCANNER_DELTA_SAFETY_SECONDS', 60)
+
+SESSION_FIELDS = (
+    'worker_name', 'model_version_string', 'started_at', 'finished_at', 'status', 'notes',
+)
+SESSION_REQUIRED = (
+    'session_id', 'empresa_id', 'zona_id', 'cultivo_id',
+    'worker_name', 'model_version_string', 'started_at', 'status',
+)
+SESSION_UPDATE_FIELDS = [
+    'empresa', 'zona', 'cultivo', 'owner',
+    'worker_name', 'model_version_string', 'started_at', 'finished_at', 'status',
+    'total_scans', 'healthy_count', 'plague_count', 'notes', 'updated_at',
+]
+
+RESULT_FIELDS = (
+    'photo_path', 'confidence', 'has_plague', 'report_id', 'scanned_at',
+)
+RESULT_REQUIRED = (
+    'result_id', 'photo_path', 'classification', 'confidence', 'has_plague', 'scanned_at',
+)
+RESULT_UPDATE_FIELDS = [
+    'session', 'photo_path', 'label', 'confidence', 'has_plague', 'report_id', 'scanned_at',
+]
+
+
+def _clean_value(field, value):
+    """to_python + validadores del campo (sin consultas a la BD ni regla de blank)."""
+    value = field.to_python(value)
+    if value is None:
+        if not field.null:
+            raise ValidationError(f"{field.name}: no puede ser nulo.")
+        return value
+    if field.choices and value not in dict(field.flatchoices):
+        raise ValidationError(f"{field.name}: valor inválido '{value}'.")
+    field.run_validators(value)
+    return value
+
+
+def _clean(model, data, field_names):
+    """Convierte y valida los valores crudos usando los campos del modelo."""
+    cleaned = {}
+    for name in field_names:
+        value = data.get(name)
+        if value is None and name == 'notes':
+            value = ''
+        cleaned[name] = _clean_value(model._meta.get_field(name), value)
+    return cleaned
+
+
+def _missing(data, required):
+    missing = [key for key in required if key not in data]
+    if missing:
+        raise ValidationError(f"Campos requeridos faltantes: {', '.join(missing)}")
+
+
+def _error_message(exc):
+    if isinstance(exc, ValidationError):
+        return '; '.join(exc.messages)
+    return str(exc)
+
+
+def _session_key(session_data):
+    if isinstance(session_data, dict):
+        return session_data.get('session_id', 'unknown')
+    return 'unknown'
+
+
+def _clean_classification(value):
+    """La etiqueta llega como texto; se guarda como id de LabelTaxonomy."""
+    label_field = LabelTaxonomy._meta.get_field('classification')
+    value = label_field.to_python(value)
+    if not value:
+        raise ValidationError("classification: no puede estar vacío.")
+    label_field.run_validators(value)
+    return value
+
+
+def build_result(result_data, session_id):
+    """
+    Valida un resultado del payload sin consultar la BD.
+    Devuelve (instancia sin guardar ni label, classification); la etiqueta se
+    resuelve al escribir (bulk_upsert_results).
+    """
+    _missing(result_data, RESULT_REQUIRED)
+    values = _clean(ScannerResult, result_data, RESULT_FIELDS)
+    result_id = _clean_value(ScannerResult._meta.get_field('result_id'), result_data['result_id'])
+    classification = _clean_classification(result_data['classification'])
+    return ScannerResult(result_id=result_id, session_id=session_id, **values), classification
+
+
+def bulk_upsert_results(built):
+    """
+    INSERT ... ON CONFLICT (result_id) DO UPDATE para [(ScannerResult, classification)]
+    de build_result. Registra en bloque las etiquetas nuevas (debe llamarse dentro de
+    la transacción de escritura) y emite results_changed con los valores previos para
+    mantener los reportes al día.
+    """
+    label_ids = ensure_labels({classification for _, classification in built})
+    for result, classification in built:
+        result.label_id = label_ids[classification]
+    # Un mismo result_id repetido en el lote: gana el último (como el update_or_create secuencial)
+    unique = list({r.result_id: r for r, _ in built}.values())
+    if unique:
+        stored = ScannerResult.objects.filter(result_id__in=[r.result_id for r in unique]).values_list(
+            'result_id', 'session_id', 'label_id', 'confidence', 'photo_path',
+        )
+        previous, blob_paths = {}, {}
+        for result_id, session_id, label_id, confidence, photo_path in stored:
+            previous[result_id] = (session_id, label_name(label_id) if label_id is not None else '', confidence)
+            if blob_sha(photo_path):
+                blob_paths[result_id] = photo_path
+        # Una foto ya asociada a un blob (scanners/blobs.py) no se pisa con el path local del
+        # teléfono: el blob perdería la referencia sin bajar su refcount
+        for result in unique:
+            if result.result_id in blob_paths:
+                result.photo_path = blob_paths[result.result_id]
+        ScannerResult.objects.bulk_create(
+            unique,
+            batch_size=BULK_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['result_id'],
+            update_fields=RESULT_UPDATE_FIELDS,
+        )
+        results_changed.send(sender=ScannerResult, previous=previous, current=unique)
+    return unique
+
+
+def _count_results(**filters):
+    return Coalesce(
+        Subquery(
+            ScannerResult.objects.filter(session=OuterRef('pk'), **filters)
+            .order_by().values('session').annotate(n=Count('pk')).values('n'),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def refresh_session_counts(session_ids):
+    """
+    Recalcula total_scans/healthy_count/plague_count desde la BD en una sola sentencia.
+    Necesario porque con delta sync el payload puede traer solo parte de los resultados.
+    """
+    if not session_ids:
+        return
+    ScannerSession.objects.filter(session_id__in=session_ids).update(
+        total_scans=_count_results(),
+        healthy_count=_count_results(has_plague=False),
+        plague_count=_count_results(has_plague=True),
+        updated_at=timezone.now(),
+    )
+
+
+def sync_sessions(sessions_data, owner):
+    """
+    Sincroniza sesiones (con sus scan_results anidados) en bloque.
+
+    Devuelve (synced, errors) con la misma forma que la respuesta histórica
+    del endpoint sessions/sync/.
+    """
+    errors = []
+    prepared = []  # (índice, session, [(result, classification)])
+
+    # 1) Validación completa del payload en memoria
+    for index, session_data in enumerate(sessions_data):
+        try:
+            if not isinstance(session_data, dict):
+                raise ValidationError("Formato de sesión inválido.")
+            _missing(session_data, SESSION_REQUIRED)
+            session_id = _clean_value(ScannerSession._meta.get_field('session_id'), session_data['session_id'])
+            values = _clean(ScannerSession, session_data, SESSION_FIELDS)
+            related = {
+                f'{name}_id': _clean_value(ScannerSession._meta.get_field(name).target_field, session_data[f'{name}_id'])
+                for name in ('empresa', 'zona', 'cultivo')
+            }
+
+            scan_results_data = session_data.get('scan_results') or []
+            results = [build_result(r, session_id) for r in scan_results_data]
+            plague_count = sum(1 for r, _ in results if r.has_plague)
+
+            session = ScannerSession(
+                session_id=session_id,
+                owner=owner,
+                total_scans=len(results),
+                healthy_count=len(results) - plague_count,
+                plague_count=plague_count,
+                **related,
+                **values,
+            )
+            if session.started_at and session.finished_at and session.finished_at < session.started_at:
+                raise ValidationError("La fecha de finalización no puede ser anterior al inicio.")
+            prepared.append((index, session, results))
+        except Exception as e:
+            errors.append((index, {'session_id': _session_key(session_data), 'error': _error_message(e)}))
+
+    # 2) Coherencia empresa/zona/cultivo con una sola consulta
+    cultivo_ids = {s.cultivo_id for _, s, _ in prepared}
+    cultivos = {
+        pk: (zona_id, empresa_id)
+        for pk, zona_id, empresa_id in Cultivo.objects.filter(pk__in=cultivo_ids)
+        .values_list('pk', 'zona_id', 'zona__empresa_id')
+    } if cultivo_ids else {}
+
+    valid = []
+    for index, session, results in prepared:
+        owner_ids = cultivos.get(session.cultivo_id)
+        if owner_ids is None:
+            errors.append((index, {'session_id': session.session_id, 'error': f"Cultivo {session.cultivo_id} no encontrado"}))
+        elif owner_ids != (session.zona_id, session.empresa_id):
+            errors.append((index, {'session_id': session.session_id, 'error': "La empresa no coincide con la del cultivo."}))
+        else:
+            valid.append((index, session, results))
+
+    # Sesiones/resultados ya existentes en otra empresa no se pueden reasignar
+    session_ids = [s.session_id for _, s, _ in valid]
+    existing = dict(
+        ScannerSession.objects.filter(session_id__in=session_ids).values_list('session_id', 'empresa_id')
+    ) if session_ids else {}
+    result_ids = [r.result_id for _, _, results in valid for r, _ in results]
+    existing_results = dict(
+        ScannerResult.objects.filter(result_id__in=result_ids).values_list('result_id', 'session__empresa_id')
+    ) if result_ids else {}
+    checked = []
+    for index, session, results in valid:
+        if existing.get(session.session_id, session.empresa_id) != session.empresa_id:
+            errors.append((index, {'session_id': session.session_id, 'error': "La sesión pertenece a otra empresa"}))
+        elif any(existing_results.get(r.result_id, session.empresa_id) != session.empresa_id for r, _ in results):
+            errors.append((index, {'session_id': session.session_id, 'error': "Hay resultados que pertenecen a otra empresa"}))
+        else:
+            checked.append((index, session, results))
+    valid = checked
+
+    # 3) Escritura en bloque por chunks, cada uno en su savepoint: un chunk que falla no
+    #    descarta los demás y se reintenta sesión por sesión para reportar cuál falló
+    synced = []
+    seen = set()
+    for start in range(0, len(valid), SYNC_CHUNK_SESSIONS):
+        chunk = valid[start:start + SYNC_CHUNK_SESSIONS]
+        try:
+            with transaction.atomic():
+                _write_sessions(chunk, existing)
+            written = chunk
+        except Exception:
+            written = []
+            for item in chunk:
+                try:
+                    with transaction.atomic():
+                        _write_sessions([item], existing)
+                    written.append(item)
+                except Exception as e:
+                    errors.append((item[0], {'session_id': item[1].session_id, 'error': _error_message(e)}))
+
+        for _, session, results in written:
+            synced.append({
+                'session_id': session.session_id,
+                'created': session.session_id not in existing and session.session_id not in seen,
+                'scan_results_count': len(results),
+            })
+            seen.add(session.session_id)
+
+    # Errores en el orden del payload
+    return synced, [error for _, error in sorted(errors, key=lambda item: item[0])]
+
+
+def _write_sessions(items, existing):
+    """
+    Escribe [(índice, session, [(result, classification)])]: sesiones, resultados
+    y conteos. Debe llamarse dentro de una transacción (o savepoint).
+
+    bulk_create no emite post_save: se emite sessions_synced (scanners/signals.py)
+    con las sesiones escritas, p. ej. para programar el SessionReport de las completadas.
+    """
+    sessions = list({s.session_id: s for _, s, _ in items}.values())
+    ScannerSession.objects.bulk_create(
+        sessions,
+        batch_size=BULK_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['session_id'],
+        update_fields=SESSION_UPDATE_FIELDS,
+    )
+    bulk_upsert_results([built for _, _, results in items for built in results])
+    refresh_session_counts([s.session_id for s in sessions])
+    sessions_synced.send(
+        sender=ScannerSession, sessions=sessions,
+        created={s.session_id for s in sessions if s.session_id not in existing},
+    )
+
+
+def sync_results(results_data, empresa):
+    """
+    Sincroniza resultados sueltos (campo `session` = session_id) en bloque.
+
+    Todas las sesiones referenciadas se resuelven con una sola consulta IN,
+    restringida a la empresa del usuario. Devuelve (synced, errors).
+    """
+    errors = []
+    prepared = []  # (índice, (result, classification))
+
+    session_ids = {
+        r.get('session') for r in results_data
+        if isinstance(r, dict) and isinstance(r.get('session'), str)
+    }
+    known = set()
+    if session_ids and empresa is not None:
+        known = set(
+            ScannerSession.objects.filter(session_id__in=session_ids, empresa=empresa)
+            .values_list('session_id', flat=True)
+        )
+
+    for index, result_data in enumerate(results_data):
+        if not isinstance(result_data, dict):
+            errors.append((index, {'result_id': None, 'error': "Formato de resultado inválido."}))
+            continue
+        session_id = result_data.get('session')
+        if session_id not in known:
+            errors.append((index, {'result_id': result_data.get('result_id'), 'error': f"Sesión {session_id} no encontrada"}))
+            continue
+        try:
+            prepared.append((index, build_result(result_data, session_id)))
+        except Exception as e:
+            errors.append((index, {'result_id': result_data.get('result_id'), 'error': _error_message(e)}))
+
+    # Un result_id existente de otra empresa no se puede reasignar
+    existing = {}
+    if prepared:
+        existing = dict(
+            ScannerResult.objects.filter(result_id__in=[r.result_id for _, (r, _) in prepared])
+            .values_list('result_id', 'session__empresa_id')
+        )
+    writable = []
+    for index, built in prepared:
+        result = built[0]
+        if result.result_id in existing and existing[result.result_id] != empresa.pk:
+            errors.append((index, {'result_id': result.result_id, 'error': "El resultado pertenece a otra empresa"}))
+        else:
+            writable.append((index, built))
+    prepared = writable
+
+    if not prepared:
+        return [], [error for _, error in sorted(errors, key=lambda item: item[0])]
+
+    synced = []
+    try:
+        with transaction.atomic():
+            bulk_upsert_results([built for _, built in prepared])
+            refresh_session_counts({r.session_id for _, (r, _) in prepared})
+
+            seen = set()
+            for _, (result, _) in prepared:
+                created = result.result_id not in existing and result.result_id not in seen
+                seen.add(result.result_id)
+                synced.append({'result_id': result.result_id, 'created': created})
+    except Exception as e:
+        errors.extend((index, {'result_id': r.result_id, 'error': str(e)}) for index, (r, _) in prepared)
+        synced = []
+
+    return synced, [error for _, error in sorted(errors, key=lambda item: item[0])]
+
+
+def delta_for_sessions(session_ids, empresa, cursor=None):
+    """
+    Delta sync: para las sesiones pedidas devuelve qué tiene ya el servidor.
+
+    Sin cursor se devuelven todos los result_id de cada sesión; con cursor solo
+    las sesiones modificadas y los resultados creados después del cursor. El
+    nuevo cursor se calcula antes de consultar (menos un margen), así que un
+    resultado nunca queda entre dos cursores; a lo sumo se repite.
+    """
+    next_cursor = timezone.now() - timedelta(seconds=DELTA_SAFETY_SECONDS)
+
+    sessions = ScannerSession.objects.filter(session_id__in=session_ids, empresa=empresa)
+    results = ScannerResult.objects.filter(session_id__in=session_ids, session__empresa=empresa)
+    if cursor is not None:
+        results = results.filter(created_at__gt=cursor)
+
+    result_ids = {}
+    for session_id, result_id in results.order_by().values_list('session_id', 'result_id'):
+        result_ids.setdefault(session_id, []).append(result_id)
+
+    known = []
+    changed = []
+    for row in sessions.order_by().values('session_id', 'status', 'total_scans', 'updated_at'):
+        known.append(row['session_id'])
+        if cursor is not None and row['updated_at'] <= cursor and row['session_id'] not in result_ids:
+            continue
+        changed.append({**row, 'result_ids': result_ids.get(row['session_id'], [])})
+
+    known = set(known)
+    return {
+        'cursor': next_cursor.isoformat(),
+        'sessions': changed,
+        'missing_sessions': [sid for sid in session_ids if sid not in known],
+    }
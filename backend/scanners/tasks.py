@@ -0,0 +1,32 @@
+from celery import shared_task
+from django.conf import settings
+
+
+@shared_task
+def process_photo_async(key):
+    """Genera las variantes (full, thumb, model) de una foto del bucket."""
+    from cropcareBackend.object_storage import get_client
+    from .imaging import process_photo
+
+    if not process_photo(get_client(), key):
+        return  # foto rechazada: no hay nada que clasificar
+    if getattr(settings, 'SCANNER_SERVER_INFERENCE', False):
+        score_photo_async(key)
+
+
+@shared_task
+def score_photo_async(key):
+    """Clasifica en el servidor los resultados que usan la foto (modelo de su sesión)."""
+    from .inference import score_results
+    from .models import ScannerResult
+
+    results = ScannerResult.objects.filter(photo_path=key).select_related('session__model_version', 'image')
+    score_results(results)
+
+
+@shared_task
+def verify_image_async(image_id):
+    """Verificación completa de un ScannerImage subido (borra el archivo si no es válido)."""
+    from .imaging import verify_scanner_image
+
+    verify_scanner_image(image_id)
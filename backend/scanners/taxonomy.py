@@ -0,0 +1,197 @@
+# scanners/taxonomy.py
+"""
+Taxonomía de etiquetas (LabelTaxonomy): cultivo, enfermedad, si es sana y
+umbral de confianza de cada classification.
+
+Es la única fuente para decidir si una detección es plaga y si su confianza es
+baja (reports/builders.py, reports/flagging.py, reports/metrics.py). Las
+etiquetas nuevas se registran solas al llegar resultados, con parse_label()
+como valor inicial; cultivo/enfermedad/is_healthy se corrigen en el admin.
+
+ScannerResult guarda la etiqueta como FK entera a LabelTaxonomy (label_id) y
+expone classification como propiedad: label_id_for() / label_name() traducen
+con un diccionario en memoria del proceso (la tabla tiene pocas filas y una
+classification no cambia de id), así leer o escribir resultados no agrega JOINs
+ni consultas. La propiedad solo busca: las etiquetas nuevas se registran en
+bloque con ensure_labels() dentro de la transacción que escribe los resultados
+(sync, serializers), nunca al validar.
+
+calibrate_thresholds() ajusta el umbral de cada clase con los resultados que
+también clasificó el servidor (server_classification): el umbral es la menor
+confianza a partir de la cual el teléfono coincide con el servidor al menos
+en la precisión objetivo.
+"""
+import threading
+from collections import defaultdict
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Floor
+from django.utils import timezone
+
+from .models import LabelTaxonomy, ScannerResult
+
+
+DEFAULT_THRESHOLD = getattr(settings, 'SCANNER_DEFAULT_CONFIDENCE_THRESHOLD', 0.6)
+CALIBRATION_BUCKETS = 100
+
+
+class LabelInfo(NamedTuple):
+    is_healthy: bool
+    threshold: float
+
+
+def parse_label(classification):
+    """'Potato___Late_blight' / 'Potato_Healthy' -> crop, disease, is_healthy."""
+    if '___' in classification:
+        crop, _, disease = classification.partition('___')
+    else:
+        crop, _, disease = classification.partition('_')
+    is_healthy = 'healthy' in classification.lower()
+    return {
+        'crop': crop[:100],
+        'disease': '' if is_healthy else disease.replace('_', ' ').strip()[:100],
+        'is_healthy': is_healthy,
+    }
+
+
+# ------------------- DICCIONARIO DE ETIQUETAS -------------------
+_ids = {}      # classification -> id (solo filas confirmadas)
+_names = {}    # id -> classification
+_cache_lock = threading.Lock()
+
+
+def _remember(classification, pk):
+    with _cache_lock:
+        _ids[classification] = pk
+        _names[pk] = classification
+
+
+def forget_labels():
+    """Vacía el diccionario del proceso (tests: SQLite reutiliza ids de filas revertidas)."""
+    with _cache_lock:
+        _ids.clear()
+        _names.clear()
+
+
+def label_id_for(classification):
+    """id de LabelTaxonomy de la etiqueta, o None si no está registrada (solo lee: ver ensure_labels)."""
+    pk = _ids.get(classification)
+    if pk is None:
+        pk = LabelTaxonomy.objects.filter(classification=classification).values_list('pk', flat=True).first()
+        if pk is not None:
+            # Se cachea recién al confirmar: la fila puede venir de esta transacción
+            transaction.on_commit(lambda: _remember(classification, pk))
+    return pk
+
+
+def ensure_labels(classifications):
+    """
+    {classification: id} para las etiquetas dadas; las nuevas se registran en bloque
+    (bulk_create con ignore_conflicts, seguro ante escrituras concurrentes) con
+    parse_label(). Se llama dentro de la transacción que escribe los resultados.
+    """
+    labels = {label for label in classifications if label}
+    ids = {label: _ids[label] for label in labels if label in _ids}
+    missing = labels - ids.keys()
+    if not missing:
+        return ids
+    found = dict(LabelTaxonomy.objects.filter(classification__in=missing).values_list('classification', 'pk'))
+    new = missing - found.keys()
+    if new:
+        LabelTaxonomy.objects.bulk_create(
+            [LabelTaxonomy(classification=label, confidence_threshold=DEFAULT_THRESHOLD, **parse_label(label))
+             for label in new],
+            ignore_conflicts=True,
+        )
+        found.update(LabelTaxonomy.objects.filter(classification__in=new).values_list('classification', 'pk'))
+    ids.update(found)
+    transaction.on_commit(lambda: [_remember(label, pk) for label, pk in found.items()])
+    return ids
+
+
+def label_name(pk):
+    """classification de un id de LabelTaxonomy (recarga la tabla si no lo conoce)."""
+    name = _names.get(pk)
+    if name is None:
+        rows = list(LabelTaxonomy.objects.values_list('pk', 'classification'))
+        with _cache_lock:
+            # Los ids no se reutilizan: id -> nombre es seguro aunque la fila aún no esté confirmada
+            _names.update(rows)
+        name = _names.get(pk, '')
+    return name
+
+
+def load_taxonomy(labels, create=True):
+    """
+    {classification: LabelInfo} para las etiquetas dadas (una consulta).
+    Con create=True las que faltan se registran con parse_label().
+    """
+    labels = {label for label in labels if label}
+    rows = LabelTaxonomy.objects.filter(classification__in=labels).values_list(
+        'classification', 'is_healthy', 'confidence_threshold',
+    )
+    taxonomy = {label: LabelInfo(is_healthy, threshold) for label, is_healthy, threshold in rows}
+    missing = labels - taxonomy.keys()
+    if missing and create:
+        LabelTaxonomy.objects.bulk_create(
+            [LabelTaxonomy(classification=label, confidence_threshold=DEFAULT_THRESHOLD, **parse_label(label))
+             for label in missing],
+            ignore_conflicts=True,
+        )
+    for label in missing:
+        taxonomy[label] = LabelInfo(parse_label(label)['is_healthy'], DEFAULT_THRESHOLD)
+    return taxonomy
+
+
+def _threshold_for(buckets, target_precision, min_samples):
+    """Menor umbral con precisión >= objetivo, recorriendo los buckets de mayor a menor confianza."""
+    total = agree = 0
+    threshold = None
+    for bucket in sorted(buckets, reverse=True):
+        n, ok = buckets[bucket]
+        total += n
+        agree += ok
+        if total >= min_samples and agree / total >= target_precision:
+            threshold = bucket / CALIBRATION_BUCKETS
+    return threshold, total
+
+
+def calibrate_thresholds(target_precision=0.9, min_samples=50, dry_run=False):
+    """
+    Recalcula confidence_threshold por clase. Las clases con menos de min_samples
+    resultados clasificados por el servidor conservan su umbral.
+    Devuelve [(classification, umbral anterior, umbral nuevo, muestras)].
+    """
+    rows = (
+        ScannerResult.objects.filter(server_classification__isnull=False, label__isnull=False)
+        .order_by()
+        .annotate(bucket=Floor(F('confidence') * CALIBRATION_BUCKETS))
+        .values('label_id', 'bucket')
+        .annotate(n=Count('pk'), agree=Count('pk', filter=Q(server_classification=F('label__classification'))))
+    )
+    per_class = defaultdict(dict)
+    for row in rows:
+        bucket = min(max(int(row['bucket']), 0), CALIBRATION_BUCKETS - 1)
+        n, ok = per_class[row['label_id']].get(bucket, (0, 0))
+        per_class[row['label_id']][bucket] = (n + row['n'], ok + row['agree'])
+
+    entries = LabelTaxonomy.objects.in_bulk(per_class)
+    now = timezone.now()
+    changes, updated = [], []
+    for pk, buckets in sorted(per_class.items(), key=lambda item: entries[item[0]].classification):
+        threshold, samples = _threshold_for(buckets, target_precision, min_samples)
+        entry = entries[pk]
+        if threshold is None or samples < min_samples:
+            continue
+        changes.append((entry.classification, entry.confidence_threshold, threshold, samples))
+        entry.confidence_threshold = threshold
+        entry.calibrated_at = now
+        entry.updated_at = now
+        updated.append(entry)
+
+    if updated and not dry_run:
+        LabelTaxonomy.objects.bulk_update(updated, ['confidence_threshold', 'calibrated_at', 'updated_at'])
+    return changes
@@ -1,3 +1,829 @@
-from django.test import TestCase
+import copy
+import importlib.util
+import io
+import shutil
+import tempfile
+import uuid
+from concurrent.futures import Future
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from cropcareBackend.object_storage import get_client, reset_client
+
+from accounts.models import Role, User
+from emprises.models import Empresa
+from reports.models import SessionReport
+from zonecrop.models import Cultivo, Zona
+from scanners.models import LabelTaxonomy, ModelVersion, ScannerImage, ScannerResult, ScannerSession, SyncLedger
+from scanners.sync import sync_results, sync_sessions
+from scanners.taxonomy import forget_labels
+
+
+LABELS = ('Potato___Late_blight', 'Potato___healthy')
+
+
+def jpeg_bytes(size=(64, 64)):
+    out = io.BytesIO()
+    Image.effect_noise(size, 64).convert('RGB').save(out, format='JPEG')
+    return out.getvalue()
+
+
+def statements(queries):
+    """
+    Consultas capturadas, contando como una los lotes consecutivos del mismo bulk INSERT
+    (SQLite parte los bulk_create según max_query_params; PostgreSQL no).
+    """
+    count, previous = 0, None
+    for query in queries.captured_queries:
+        sql = query['sql']
+        head = sql[:sql.find('(')] if sql.startswith('INSERT') else None
+        if head is None or head != previous:
+            count += 1
+        previous = head
+    return count
+
+
+class ScannerFixtureMixin:
+    """Empresa con una zona, un cultivo y su admin."""
+
+    @classmethod
+    def setUpTestData(cls):
+        role, _ = Role.objects.get_or_create(code='ADMIN', defaults={'name': 'Administrador'})
+        cls.user = User.objects.create_user(
+            email='admin@test.com', password='TestPass123!', first_name='Admin', phone='+56900000000', role=role, is_staff=True,
+        )
+        cls.empresa = Empresa.objects.create(
+            tax_id='TEST123', name='Empresa Test', legal_name='Empresa Test S.A.', country='CL', owner=cls.user,
+        )
+        cls.user.empresa = cls.empresa
+        cls.user.save()
+        zona = Zona.objects.create(nombre='Zona 1', empresa=cls.empresa)
+        cls.cultivo = Cultivo.objects.create(nombre='Papa', zona=zona)
+
+    def setUp(self):
+        super().setUp()
+        forget_labels()
+        self.addCleanup(forget_labels)
+
+    def session_payload(self, results=0):
+        now = timezone.now().isoformat()
+        session_id = str(uuid.uuid4())
+        return {
+            'session_id': session_id,
+            'empresa_id': self.empresa.id,
+            'zona_id': self.cultivo.zona_id,
+            'cultivo_id': self.cultivo.id,
+            'worker_name': 'test',
+            'model_version_string': '1.0',
+            'started_at': now,
+            'status': 'ACTIVE',
+            'scan_results': [
+                {
+                    'result_id': str(uuid.uuid4()),
+                    'photo_path': f'scanner_photos/{session_id}/{i}.jpg',
+                    'classification': LABELS[i % 2],
+                    'confidence': 0.9,
+                    'has_plague': not i % 2,
+                    'scanned_at': now,
+                }
+                for i in range(results)
+            ],
+        }
+
+
+class LocalStorageMixin:
+    """Bucket y media en una carpeta temporal (OBJECT_STORAGE_BACKEND=local)."""
+
+    def setUp(self):
+        super().setUp()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, True)
+        bucket = settings.AWS_STORAGE_BUCKET_NAME
+        storage = override_settings(
+            OBJECT_STORAGE_BACKEND='local', OBJECT_STORAGE_LOCAL_ROOT=root,
+            STORAGES={**settings.STORAGES, 'default': {
+                'BACKEND': 'django.core.files.storage.FileSystemStorage',
+                'OPTIONS': {'location': f'{root}/{bucket}/media', 'base_url': f'/objects/{bucket}/media/'},
+            }},
+        )
+        storage.enable()
+        self.addCleanup(storage.disable)
+        reset_client()
+        self.addCleanup(reset_client)
+        self.bucket = bucket
+        self.storage_client = get_client()
+
+    def put_photo(self, key, data=None):
+        self.storage_client.put_object(Bucket=self.bucket, Key=key, Body=data or jpeg_bytes())
+        return key
+
+
+class SyncQueryCountTests(ScannerFixtureMixin, TestCase):
+    """El sync escribe en bloque: la cantidad de consultas no depende del tamaño del lote."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Etiquetas ya registradas: el lote no suma INSERTs en LabelTaxonomy
+        for label in LABELS:
+            LabelTaxonomy.objects.create(classification=label)
+
+    def count_sync_results(self, size):
+        sessions = [self.session_payload(), self.session_payload()]
+        sync_sessions(sessions, self.user)
+        results = [
+            {**result, 'session': sessions[i % 2]['session_id']}
+            for i, result in enumerate(self.session_payload(size)['scan_results'])
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            synced, errors = sync_results(results, self.empresa)
+        self.assertEqual((len(synced), errors), (size, []))
+        return statements(queries)
+
+    def count_sync_sessions(self, size):
+        sessions = [self.session_payload(size // 2), self.session_payload(size - size // 2)]
+        with CaptureQueriesContext(connection) as queries:
+            synced, errors = sync_sessions(sessions, self.user)
+        self.assertEqual((len(synced), errors), (2, []))
+        return statements(queries)
+
+    def test_sync_results_constant_queries(self):
+        self.count_sync_results(10)  # calentamiento: cachés por proceso (diccionario de etiquetas)
+        self.assertEqual(self.count_sync_results(10), self.count_sync_results(1000))
+
+    def test_sync_sessions_constant_queries(self):
+        self.count_sync_sessions(10)  # calentamiento: cachés por proceso (diccionario de etiquetas)
+        self.assertEqual(self.count_sync_sessions(10), self.count_sync_sessions(1000))
+
+
+class SessionListQueryCountTests(ScannerFixtureMixin, TestCase):
+    """
+    Listar/obtener sesiones usa una cantidad constante de consultas (sin N+1 en los
+    serializers): todo campo anidado o relación nueva debe sumarse a setup_eager_loading.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.labels = [LabelTaxonomy.objects.create(classification=label) for label in LABELS]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def create_sessions(self, size):
+        """Sesiones completadas con reporte, 2 imágenes (2 resultados c/u) y 2 resultados sin imagen."""
+        ScannerSession.objects.filter(empresa=self.empresa).delete()
+        now = timezone.now()
+        sessions = ScannerSession.objects.bulk_create([
+            ScannerSession(
+                session_id=str(uuid.uuid4()), empresa=self.empresa, zona_id=self.cultivo.zona_id,
+                cultivo=self.cultivo, owner=self.user, worker_name='test', model_version_string='1.0',
+                started_at=now, finished_at=now, status='COMPLETED',
+            )
+            for _ in range(size)
+        ])
+        images = ScannerImage.objects.bulk_create([
+            ScannerImage(session=session, image=f'scans/test/{session.session_id}-{i}.jpg')
+            for session in sessions for i in range(2)
+        ])
+        ScannerResult.objects.bulk_create([
+            ScannerResult(
+                result_id=str(uuid.uuid4()), session_id=image.session_id, image=image,
+                photo_path='x.jpg', label=self.labels[1], confidence=0.9,
+            )
+            for image in images for _ in range(2)
+        ] + [
+            ScannerResult(
+                result_id=str(uuid.uuid4()), session=session,
+                photo_path='x.jpg', label=self.labels[0], confidence=0.8, has_plague=True,
+            )
+            for session in sessions for _ in range(2)
+        ])
+        SessionReport.objects.bulk_create([
+            SessionReport(
+                session=session, empresa=self.empresa, zona_id=self.cultivo.zona_id, cultivo=self.cultivo,
+                owner=self.user, images_count=2, detections_count=6, suspicious_detections_count=2,
+                label_histogram={LABELS[0]: 2, LABELS[1]: 4}, finalized_at=now,
+            )
+            for session in sessions
+        ])
+        return sessions
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assertConstantQueries(self, url_for):
+        """url_for(session_id) se consulta con 1 y con 25 sesiones; las consultas deben coincidir."""
+        session = self.create_sessions(1)[0]
+        self.get(url_for(session.session_id))  # calentamiento: cachés por proceso (p. ej. user.empresa)
+        with CaptureQueriesContext(connection) as small:
+            self.get(url_for(session.session_id))
+
+        session = self.create_sessions(25)[0]
+        with self.assertNumQueries(len(small)):
+            self.get(url_for(session.session_id))
+
+    def test_list(self):
+        self.assertConstantQueries(lambda session_id: '/api/scanners/sessions/')
+
+    def test_list_paginated(self):
+        self.assertConstantQueries(lambda session_id: '/api/scanners/sessions/?page_size=10')
+
+    def test_retrieve(self):
+        self.assertConstantQueries(lambda session_id: f'/api/scanners/sessions/{session_id}/')
+
+    def test_with_reports(self):
+        self.assertConstantQueries(lambda session_id: '/api/scanners/sessions/with_reports/')
+
+    def test_with_reports_summary(self):
+        self.assertConstantQueries(lambda session_id: '/api/scanners/sessions/with_reports/?mode=summary')
+
+
+class FakeBatcher:
+    """Reemplaza al MicroBatcher: clasifica todo como la primera etiqueta del modelo."""
+
+    def __init__(self, model_version):
+        self.model_version = model_version
+
+    def submit(self, array):
+        future = Future()
+        future.set_result((self.model_version.labels[0], 0.93))
+        return future
+
+
+@skipUnless(importlib.util.find_spec('numpy'), "numpy no está instalado (inferencia opcional)")
+@mock.patch('scanners.inference.get_batcher', FakeBatcher)
+class ServerScoringTests(LocalStorageMixin, ScannerFixtureMixin, TestCase):
+    """score_photo_async clasifica sesiones sincronizadas (solo traen model_version_string)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for label in LABELS:
+            LabelTaxonomy.objects.create(classification=label)
+        cls.old = ModelVersion.objects.create(
+            name='plant', version='1.0', file_path='models/plant/1.0.tflite', labels=list(LABELS),
+        )
+        cls.latest = ModelVersion.objects.create(
+            name='plant', version='2.0', file_path='models/plant/2.0.tflite', labels=list(reversed(LABELS)),
+        )
+
+    def sync_and_score(self, model_version_string):
+        from scanners.tasks import score_photo_async
+
+        payload = self.session_payload(2)
+        payload['model_version_string'] = model_version_string
+        synced, errors = sync_sessions([payload], self.user)
+        self.assertEqual((len(synced), errors), (1, []))
+        key = self.put_photo(payload['scan_results'][0]['photo_path'])
+        score_photo_async(key)
+        return ScannerResult.objects.get(pk=payload['scan_results'][0]['result_id'])
+
+    def test_scores_with_the_session_version_string(self):
+        result = self.sync_and_score('1.0')
+        self.assertEqual(result.server_model_version, self.old)
+        self.assertEqual(result.server_classification, LABELS[0])
+        self.assertAlmostEqual(result.server_confidence, 0.93)
+        self.assertIsNotNone(result.server_scored_at)
+
+    def test_unknown_version_falls_back_to_latest(self):
+        result = self.sync_and_score('9.9')
+        self.assertEqual(result.server_model_version, self.latest)
+        self.assertEqual(result.server_classification, LABELS[1])
+
+
+class PhotoBlobRefcountTests(LocalStorageMixin, ScannerFixtureMixin, TestCase):
+    """Los refcount de PhotoBlob siguen a los resultados en subidas y borrados en cascada."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for label in LABELS:
+            LabelTaxonomy.objects.create(classification=label)
+
+    def store(self, results, data):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from scanners.uploads import store_photos
+
+        jobs = [
+            (result, SimpleUploadedFile(f'{result.result_id}.jpg', data, 'image/jpeg'), len(data), 'image/jpeg')
+            for result in results
+        ]
+        with self.captureOnCommitCallbacks():
+            done, errors = store_photos(self.storage_client, jobs)
+        self.assertEqual(errors, [])
+        return done
+
+    def synced_session(self, results=2, with_image=False):
+        payload = self.session_payload(results)
+        sync_sessions([payload], self.user)
+        session = ScannerSession.objects.get(pk=payload['session_id'])
+        if with_image:
+            image = ScannerImage.objects.create(session=session, image='scans/test/x.jpg')
+            session.scan_results.update(image=image)
+        return session
+
+    def test_shared_photo_counts_every_result(self):
+        from scanners.blobs import blob_sha
+        from scanners.models import PhotoBlob
+
+        data = jpeg_bytes()
+        results = list(self.synced_session(3).scan_results.all())
+        done = self.store(results, data)
+        blob = PhotoBlob.objects.get(sha256=blob_sha(done[0].photo_path))
+        self.assertEqual(blob.refcount, 3)
+
+    def test_image_delete_releases_its_results(self):
+        from scanners.models import PhotoBlob
+
+        session = self.synced_session(2, with_image=True)
+        self.store(list(session.scan_results.all()), jpeg_bytes())
+        session.images.get().delete()
+        self.assertEqual(PhotoBlob.objects.get().refcount, 0)
+
+    def test_session_delete_with_images_releases_once(self):
+        from scanners.models import PhotoBlob
+
+        data = jpeg_bytes()
+        kept = self.synced_session(1)
+        self.store(list(kept.scan_results.all()), data)
+        session = self.synced_session(2, with_image=True)
+        self.store(list(session.scan_results.all()), data)
+        session.delete()
+        self.assertEqual(PhotoBlob.objects.get().refcount, 1)
+
+    def test_upload_after_gc_recreates_blob(self):
+        from scanners.blobs import collect_garbage
+        from scanners.models import PhotoBlob
+
+        data = jpeg_bytes()
+        session = self.synced_session(1)
+        self.store(list(session.scan_results.all()), data)
+        session.delete()
+        self.assertEqual(collect_garbage(self.storage_client, grace_seconds=0), 1)
+
+        result = self.synced_session(1).scan_results.get()
+        done = self.store([result], data)
+        self.assertEqual(PhotoBlob.objects.get().refcount, 1)
+        body = self.storage_client.get_object(Bucket=self.bucket, Key=done[0].photo_path)['Body'].read()
+        self.assertEqual(body, data)
+
+
+class LocalMediaStorageTests(LocalStorageMixin, ScannerFixtureMixin, TestCase):
+    """Con OBJECT_STORAGE_BACKEND=local las ScannerImage quedan en el bucket local y se pueden leer."""
+
+    def test_scanner_image_reads_from_local_bucket(self):
+        from django.core.files.base import ContentFile
+        from scanners.inference import read_photo_source
+
+        payload = self.session_payload()
+        sync_sessions([payload], self.user)
+        data = jpeg_bytes()
+        image = ScannerImage(session_id=payload['session_id'])
+        image.image.save('x.jpg', ContentFile(data))
+
+        self.assertTrue(image.image.url.startswith(f'/objects/{self.bucket}/media/scans/'))
+        key = f'media/{image.image.name}'
+        self.assertEqual(self.storage_client.get_object(Bucket=self.bucket, Key=key)['Body'].read(), data)
+        self.assertEqual(read_photo_source('', image.image.name), data)
+
+
+class IdempotencyLedgerTests(ScannerFixtureMixin, TestCase):
+    """Reserva de Idempotency-Key en SyncLedger."""
+
+    def reserve(self, digest='a' * 64):
+        from scanners.idempotency import _reserve
+
+        return _reserve(self.user, 'sync_sessions', 'key-1', digest)
+
+    def test_expired_entry_is_reclaimed_once(self):
+        past = timezone.now() - timedelta(seconds=1)
+        SyncLedger.objects.create(
+            owner=self.user, endpoint='sync_sessions', key='key-1', payload_hash='b' * 64,
+            response={'ok': True}, status_code=200, expires_at=past,
+        )
+        # Dos peticiones leen la misma entrada vencida antes de que alguna la reclame
+        stale = SyncLedger.objects.get()
+        with mock.patch.object(SyncLedger.objects, 'get_or_create', side_effect=lambda **kw: (copy.copy(stale), False)):
+            first, early = self.reserve()
+            self.assertIsNone(early)
+            second, early = self.reserve()
+        self.assertIsNone(second)
+        self.assertEqual(early.status_code, 409)
+
+        entry = SyncLedger.objects.get()
+        self.assertEqual((entry.payload_hash, entry.response), ('a' * 64, None))
+        self.assertGreater(entry.expires_at, timezone.now())
+
+
+class SyncSessionsWriteTests(ScannerFixtureMixin, TestCase):
+    """Escritura del sync: savepoint por chunk y sessions_synced en lugar de post_save."""
+
+    def test_failing_session_does_not_discard_the_batch(self):
+        from scanners import sync
+
+        payloads = [self.session_payload(2) for _ in range(3)]
+        bad = payloads[1]['scan_results'][0]['result_id']
+        upsert = sync.bulk_upsert_results
+
+        def failing_upsert(built):
+            if any(result.result_id == bad for result, _ in built):
+                raise ValueError("fallo de escritura")
+            return upsert(built)
+
+        with mock.patch('scanners.sync.bulk_upsert_results', failing_upsert):
+            synced, errors = sync_sessions(payloads, self.user)
+
+        self.assertEqual([s['session_id'] for s in synced], [payloads[0]['session_id'], payloads[2]['session_id']])
+        self.assertEqual(errors, [{'session_id': payloads[1]['session_id'], 'error': "fallo de escritura"}])
+        self.assertEqual(
+            set(ScannerSession.objects.values_list('session_id', flat=True)),
+            {payloads[0]['session_id'], payloads[2]['session_id']},
+        )
+        self.assertEqual(ScannerResult.objects.count(), 4)
+
+    @override_settings(BACKGROUND_TASK_BACKEND='sync')
+    def test_completed_session_gets_its_report(self):
+        payload = self.session_payload(2)
+        payload.update(status='COMPLETED', finished_at=timezone.now().isoformat())
+        with self.captureOnCommitCallbacks(execute=True):
+            sync_sessions([payload], self.user)
+        report = SessionReport.objects.get(session_id=payload['session_id'])
+        self.assertIsNotNone(report.finalized_at)
+        self.assertEqual(report.detections_count, 2)
+
+
+@skipUnless(importlib.util.find_spec('bsdiff4'), "bsdiff4 no está instalado (parches opcionales)")
+class ModelPatchTests(LocalStorageMixin, TestCase):
+    """Los parches de una versión se regeneran si se vuelve a registrar con otro artefacto."""
+
+    def patched(self, from_version, to_version):
+        import bsdiff4
+        from scanners.artifacts import read_artifact
+        from scanners.models import ModelPatch
+
+        patch = ModelPatch.objects.get(from_version__version=from_version, to_version__version=to_version)
+        return bsdiff4.patch(read_artifact(patch.from_version.file_path), read_artifact(patch.file_path))
+
+    def test_reregistered_version_rebuilds_its_patches(self):
+        from scanners.artifacts import register_model
+        from scanners.models import ModelPatch
+
+        register_model('plant', '1.0', b'modelo uno' * 100, list(LABELS))
+        register_model('plant', '2.0', b'modelo dos' * 100, list(LABELS))
+        self.assertEqual(self.patched('1.0', '2.0'), b'modelo dos' * 100)
+
+        register_model('plant', '1.0', b'modelo uno corregido' * 100, list(LABELS))
+        self.assertEqual(self.patched('1.0', '2.0'), b'modelo dos' * 100)
+
+        register_model('plant', '2.0', b'modelo dos corregido' * 100, list(LABELS))
+        self.assertEqual(self.patched('1.0', '2.0'), b'modelo dos corregido' * 100)
+        self.assertEqual(ModelPatch.objects.count(), 1)
+
+
+class ApiTestMixin:
+    """Cliente de la API autenticado como el admin de la empresa."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def synced(self, results=2, **fields):
+        payload = {**self.session_payload(results), **fields}
+        synced, errors = sync_sessions([payload], self.user)
+        self.assertEqual(errors, [])
+        return payload
+
+
+class DirectUploadTests(ApiTestMixin, LocalStorageMixin, ScannerFixtureMixin, TestCase):
+    """upload-url/ + confirm-upload/: la foto va directo al bucket y se confirma con un HEAD."""
+
+    def upload_url(self, result_id, method='put'):
+        response = self.client.post(f'/api/scanners/results/{result_id}/upload-url/', {'method': method}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def confirm(self, result_id):
+        return self.client.post(f'/api/scanners/results/{result_id}/confirm-upload/')
+
+    def test_presign_and_confirm(self):
+        payload = self.synced(1)
+        result_id = payload['scan_results'][0]['result_id']
+        for method in ('post', 'put'):
+            upload = self.upload_url(result_id, method)
+            self.assertEqual(upload['method'], method.upper())
+            self.assertEqual(upload['key'], f"scanner_photos/{payload['session_id']}/{result_id}.jpg")
+
+        self.put_photo(upload['key'])
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.confirm(result_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ScannerResult.objects.get(pk=result_id).photo_path, upload['key'])
+        self.assertEqual(len(callbacks), 1)  # variantes en segundo plano
+
+    def test_confirm_without_object(self):
+        result_id = self.synced(1)['scan_results'][0]['result_id']
+        response = self.confirm(result_id)
+        self.assertEqual(response.status_code, 400)
+        self.assertNotEqual(ScannerResult.objects.get(pk=result_id).photo_path, self.upload_url(result_id)['key'])
+
+    def test_confirm_rejects_oversized_object(self):
+        result_id = self.synced(1)['scan_results'][0]['result_id']
+        key = self.put_photo(self.upload_url(result_id)['key'], b'x' * 101)
+        with mock.patch('scanners.uploads.MAX_UPLOAD_BYTES', 100):
+            response = self.confirm(result_id)
+        self.assertEqual(response.status_code, 400)
+        with self.assertRaises(Exception):
+            self.storage_client.head_object(Bucket=self.bucket, Key=key)
+
+
+@skipUnless(importlib.util.find_spec('moto'), "moto no está instalado")
+class S3DirectUploadTests(DirectUploadTests):
+    """Lo mismo contra boto3 real (moto): firma, HEAD y códigos de error de S3."""
+
+    def setUp(self):
+        from moto import mock_aws
+
+        mock = mock_aws()
+        mock.start()
+        self.addCleanup(mock.stop)
+        super().setUp()
+        storage = override_settings(
+            OBJECT_STORAGE_BACKEND='s3', AWS_STORAGE_BUCKET_NAME='cropcare-test',
+            AWS_S3_ENDPOINT_URL=None, AWS_S3_REGION_NAME='us-east-1',
+        )
+        storage.enable()
+        self.addCleanup(storage.disable)
+        reset_client()
+        self.bucket = 'cropcare-test'
+        self.storage_client = get_client()
+        self.storage_client.create_bucket(Bucket=self.bucket)
+
+    def test_presigned_put_is_signed_for_the_key(self):
+        result_id = self.synced(1)['scan_results'][0]['result_id']
+        upload = self.upload_url(result_id)
+        self.assertIn(upload['key'], upload['url'])
+        self.assertIn('X-Amz-Signature=', upload['url'])
+        self.assertEqual(upload['headers']['x-amz-acl'], 'public-read')
+
+
+class BatchUploadTests(ApiTestMixin, LocalStorageMixin, ScannerFixtureMixin, TestCase):
+    """upload-images/: muchas fotos por petición (partes o .zip), guardadas por contenido."""
+
+    def post(self, data):
+        with self.captureOnCommitCallbacks():
+            response = self.client.post('/api/scanners/results/upload-images/', data, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_images_parts(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from scanners.blobs import BLOB_DIR
+
+        result_ids = [r['result_id'] for r in self.synced(2)['scan_results']]
+        photos = [jpeg_bytes(), jpeg_bytes()]
+        files = [SimpleUploadedFile(f'{rid}.jpg', data, 'image/jpeg') for rid, data in zip(result_ids, photos)]
+        files.append(SimpleUploadedFile('desconocido.jpg', photos[0], 'image/jpeg'))
+        files.append(SimpleUploadedFile(f'{result_ids[0]}.txt', b'no es imagen', 'text/plain'))
+        data = self.post({'images': files})
+
+        self.assertEqual(data['total_uploaded'], 2)
+        self.assertEqual({e['result_id'] for e in data['errors']}, {'desconocido', result_ids[0]})
+        for uploaded, photo in zip(sorted(data['uploaded'], key=lambda u: result_ids.index(u['result_id'])), photos):
+            self.assertTrue(uploaded['photo_path'].startswith(BLOB_DIR))
+            self.assertEqual(ScannerResult.objects.get(pk=uploaded['result_id']).photo_path, uploaded['photo_path'])
+            body = self.storage_client.get_object(Bucket=self.bucket, Key=uploaded['photo_path'])['Body'].read()
+            self.assertEqual(body, photo)
+
+    def test_zip_archive_deduplicates_content(self):
+        import zipfile
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        result_ids = [r['result_id'] for r in self.synced(3)['scan_results']]
+        photo = jpeg_bytes()
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as bundle:
+            for result_id in result_ids:
+                bundle.writestr(f'fotos/{result_id}.jpg', photo)
+        data = self.post({'archive': SimpleUploadedFile('lote.zip', archive.getvalue(), 'application/zip')})
+
+        self.assertEqual((data['total_uploaded'], data['errors']), (3, []))
+        self.assertEqual(len({u['photo_path'] for u in data['uploaded']}), 1)
+
+
+class IngestTests(ApiTestMixin, ScannerFixtureMixin, TestCase):
+    """ingest/: NDJSON confirmado por chunks, con checkpoint para reanudar."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for label in LABELS:
+            LabelTaxonomy.objects.create(classification=label)
+
+    def ingest(self, body, upload_id='backlog-1', **params):
+        query = '&'.join(f'{k}={v}' for k, v in {'upload_id': upload_id, 'chunk_size': 1, **params}.items())
+        return self.client.post(f'/api/scanners/sessions/ingest/?{query}', data=body, content_type='application/x-ndjson')
+
+    def lines(self, payloads):
+        import json
+
+        return [json.dumps(p).encode() + b'\n' for p in payloads]
+
+    def test_ingest_and_resume_after_cut(self):
+        payloads = [self.session_payload(2) for _ in range(3)]
+        lines = self.lines(payloads)
+
+        # Conexión cortada a mitad de la tercera línea: se confirman las dos primeras
+        response = self.ingest(lines[0] + lines[1] + lines[2][:20])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['committed_offset'], 2)
+        self.assertEqual(len(response.data['chunks']), 2)
+        status = self.client.get('/api/scanners/sessions/ingest/?upload_id=backlog-1').data
+        self.assertEqual((status['committed_offset'], status['chunks_committed']), (2, 2))
+
+        # No se puede saltar líneas sin confirmar
+        self.assertEqual(self.ingest(lines[2], offset=3).status_code, 409)
+
+        # Reanudar reenviando desde el principio: lo confirmado se omite sin reescribir
+        response = self.ingest(b''.join(lines))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['committed_offset'], response.data['total_synced']), (3, 1))
+        self.assertEqual(ScannerSession.objects.count(), 3)
+        self.assertEqual(ScannerResult.objects.count(), 6)
+
+    def test_gzip_and_line_errors(self):
+        import gzip
+
+        payload = self.session_payload(1)
+        body = b''.join(self.lines([payload])) + b'{no es json}\n' + b'[1, 2]\n'
+        response = self.client.post(
+            '/api/scanners/sessions/ingest/', data=gzip.compress(body), content_type='application/gzip',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([e['line'] for e in response.data['errors']], [2, 3])
+        self.assertEqual(response.data['total_synced'], 1)
+        self.assertTrue(ScannerSession.objects.filter(pk=payload['session_id']).exists())
+
+
+class IdempotentSyncTests(ApiTestMixin, ScannerFixtureMixin, TestCase):
+    """sessions/sync/ con Idempotency-Key: el reintento devuelve la respuesta guardada."""
+
+    def sync(self, payloads, key='lote-1'):
+        return self.client.post(
+            '/api/scanners/sessions/sync/', {'sessions': payloads}, format='json', HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_replay_returns_stored_response(self):
+        payloads = [self.session_payload(2)]
+        first = self.sync(payloads)
+        self.assertEqual(first.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', first)
+
+        with CaptureQueriesContext(connection) as queries:
+            replay = self.sync(payloads)
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(replay.data, first.data)
+        self.assertFalse([q for q in queries.captured_queries if 'scanners_scannerresult' in q['sql']])
+
+    def test_same_key_with_other_payload(self):
+        self.sync([self.session_payload(1)])
+        self.assertEqual(self.sync([self.session_payload(1)]).status_code, 422)
+        self.assertEqual(self.sync([self.session_payload(1)], key='lote-2').status_code, 200)
+
+    def test_validation_errors_are_not_stored(self):
+        self.assertEqual(self.sync([]).status_code, 400)
+        self.assertFalse(SyncLedger.objects.exists())
+
+
+class DeltaSyncTests(ApiTestMixin, ScannerFixtureMixin, TestCase):
+    """delta/: con el cursor de la respuesta anterior solo vuelve lo nuevo."""
+
+    def delta(self, session_ids, cursor=None):
+        response = self.client.post(
+            '/api/scanners/sessions/delta/', {'session_ids': session_ids, 'cursor': cursor}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_cursor(self):
+        changed, unchanged = self.synced(2), self.synced(1)
+        ids = [changed['session_id'], unchanged['session_id'], 'no-existe']
+        # Lo sincronizado hasta ahora quedó antes del margen del cursor
+        past = timezone.now() - timedelta(hours=1)
+        ScannerSession.objects.update(updated_at=past)
+        ScannerResult.objects.update(created_at=past)
+
+        full = self.delta(ids)
+        self.assertEqual(full['missing_sessions'], ['no-existe'])
+        self.assertEqual(
+            {s['session_id']: len(s['result_ids']) for s in full['sessions']},
+            {changed['session_id']: 2, unchanged['session_id']: 1},
+        )
+
+        late = {**self.session_payload(1)['scan_results'][0], 'session': changed['session_id']}
+        sync_results([late], self.empresa)
+        delta = self.delta(ids, full['cursor'])
+        self.assertEqual([s['session_id'] for s in delta['sessions']], [changed['session_id']])
+        self.assertEqual(delta['sessions'][0]['result_ids'], [late['result_id']])
+        self.assertEqual(delta['sessions'][0]['total_scans'], 3)
+
+    def test_invalid_cursor(self):
+        response = self.client.post(
+            '/api/scanners/sessions/delta/', {'session_ids': ['x'], 'cursor': 'ayer'}, format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class LabelEncodingTests(ApiTestMixin, ScannerFixtureMixin, TestCase):
+    """classification se guarda como FK a LabelTaxonomy; la API sigue en texto."""
+
+    def test_sync_registers_new_labels(self):
+        payload = self.session_payload(2)
+        payload['scan_results'][0]['classification'] = 'Tomato___Early_blight'
+        payload['scan_results'][1]['classification'] = 'Tomato___healthy'
+        sync_sessions([payload], self.user)
+
+        blight = LabelTaxonomy.objects.get(classification='Tomato___Early_blight')
+        self.assertEqual((blight.crop, blight.disease, blight.is_healthy), ('Tomato', 'Early blight', False))
+        self.assertTrue(LabelTaxonomy.objects.get(classification='Tomato___healthy').is_healthy)
+        result = ScannerResult.objects.get(pk=payload['scan_results'][0]['result_id'])
+        self.assertEqual((result.label_id, result.classification), (blight.pk, 'Tomato___Early_blight'))
+
+    def test_api_reads_and_writes_text(self):
+        payload = self.synced(0)
+        now = timezone.now().isoformat()
+        response = self.client.post('/api/scanners/results/', {
+            'result_id': str(uuid.uuid4()), 'session': payload['session_id'], 'photo_path': 'x.jpg',
+            'classification': 'Corn___Common_rust', 'confidence': 0.7, 'has_plague': True, 'scanned_at': now,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+
+        result = ScannerResult.objects.get(pk=response.data['result_id'])
+        self.assertEqual(result.label.classification, 'Corn___Common_rust')
+        detail = self.client.get(f'/api/scanners/results/{result.pk}/').data
+        self.assertEqual(detail['classification'], 'Corn___Common_rust')
+
+    def test_setter_only_accepts_registered_labels(self):
+        result = ScannerResult()
+        with self.assertRaises(ValueError):
+            result.classification = 'Etiqueta___desconocida'
+        LabelTaxonomy.objects.create(classification=LABELS[0])
+        result.classification = LABELS[0]
+        self.assertEqual(result.label_id, LabelTaxonomy.objects.get(classification=LABELS[0]).pk)
+
+
+class ModelArtifactDownloadTests(ApiTestMixin, LocalStorageMixin, ScannerFixtureMixin, TestCase):
+    """models/{id}/download/: ETag = sha256 (304), Range (206) e If-Range."""
+
+    DATA = bytes(range(256)) * 40
+
+    def setUp(self):
+        from scanners.artifacts import register_model
+
+        super().setUp()
+        self.model_version, _, _ = register_model('plant', '1.0', self.DATA, list(LABELS))
+        self.url = f'/api/scanners/models/{self.model_version.pk}/download/'
+
+    def get(self, **headers):
+        response = self.client.get(self.url, **headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_full_download_and_304(self):
+        response, body = self.get()
+        self.assertEqual((response.status_code, body), (200, self.DATA))
+        self.assertEqual(response['ETag'], f'"{self.model_version.sha256}"')
+        self.assertEqual(response['Content-Length'], str(len(self.DATA)))
+
+        response, body = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual((response.status_code, body), (304, b''))
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"otro"')[0].status_code, 200)
+
+    def test_ranges(self):
+        response, body = self.get(HTTP_RANGE='bytes=100-199')
+        self.assertEqual((response.status_code, body), (206, self.DATA[100:200]))
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.DATA)}')
+
+        response, body = self.get(HTTP_RANGE='bytes=-10')
+        self.assertEqual((response.status_code, body), (206, self.DATA[-10:]))
+        response, body = self.get(HTTP_RANGE='bytes=10000-')
+        self.assertEqual((response.status_code, body), (206, self.DATA[10000:]))
+
+        response, _ = self.get(HTTP_RANGE=f'bytes={len(self.DATA)}-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, f'bytes */{len(self.DATA)}'))
+
+    def test_if_range_with_stale_etag_sends_everything(self):
+        response, body = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"version-anterior"')
+        self.assertEqual((response.status_code, body), (200, self.DATA))
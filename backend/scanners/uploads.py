@@ -0,0 +1,277 @@
+# scanners/uploads.py
+"""
+Subida directa de fotos de escaneo al bucket con URLs prefirmadas.
+
+  1) POST results/{id}/upload-url/    -> URL (+ campos) firmados, válidos
+     SCANNER_UPLOAD_URL_EXPIRES segundos y solo para la key
+     scanner_photos/{session_id}/{result_id}.jpg
+  2) el teléfono sube la imagen directo al bucket (POST multipart o PUT)
+  3) POST results/{id}/confirm-upload/ -> HEAD del objeto y se guarda photo_path
+
+Los bytes de la imagen no pasan por Django. Con AWS_S3_ENDPOINT_URL se puede
+apuntar a MinIO o a moto_server para probar en local.
+
+Para subidas que sí pasan por Django, upload_batch() sube muchas fotos en
+paralelo (pool acotado, un cliente compartido) y guarda todos los photo_path
+con un solo bulk_update. Esas fotos se guardan por contenido (scanners/blobs.py):
+una foto repetida no se vuelve a escribir.
+"""
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .blobs import adjust_refcounts, attach_photos, blob_key, blob_sha, claim_blobs, hash_stream
+from .imaging import schedule_photo_processing
+from .models import IMAGE_SIGNATURES, PhotoBlob, validate_image_format
+
+
+UPLOAD_URL_EXPIRES = getattr(settings, 'SCANNER_UPLOAD_URL_EXPIRES', 5 * 60)
+MAX_UPLOAD_BYTES = getattr(settings, 'SCANNER_UPLOAD_MAX_BYTES', 5 * 1024 * 1024)
+UPLOAD_CONTENT_TYPE = 'image/jpeg'
+# Igual que upload_image: las fotos se leen por URL pública
+UPLOAD_ACL = 'public-read'
+
+UPLOAD_WORKERS = getattr(settings, 'SCANNER_UPLOAD_WORKERS', 8)
+MAX_BATCH_FILES = getattr(settings, 'SCANNER_UPLOAD_MAX_FILES', 500)
+# Las fotos son chicas: un hilo por archivo (el paralelismo lo da el pool del lote)
+TRANSFER_CONFIG = TransferConfig(use_threads=False)
+
+
+class UploadError(Exception):
+    """La subida no se puede confirmar (objeto ausente o inválido)."""
+
+
+def photo_key(result):
+    photos_dir = getattr(settings, 'SCANNER_PHOTOS_DIR', 'scanner_photos/')
+    return f"{photos_dir}{result.session_id}/{result.result_id}.jpg"
+
+
+def presign_upload(client, result, method='post'):
+    """Datos para que el cliente suba la foto del resultado directo al bucket."""
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    key = photo_key(result)
+
+    if method == 'put':
+        url = client.generate_presigned_url(
+            'put_object',
+            Params={'Bucket': bucket, 'Key': key, 'ContentType': UPLOAD_CONTENT_TYPE, 'ACL': UPLOAD_ACL},
+            ExpiresIn=UPLOAD_URL_EXPIRES,
+        )
+        return {
+            'method': 'PUT',
+            'url': url,
+            # Deben enviarse tal cual: forman parte de la firma
+            'headers': {'Content-Type': UPLOAD_CONTENT_TYPE, 'x-amz-acl': UPLOAD_ACL},
+            'key': key,
+            'expires_in': UPLOAD_URL_EXPIRES,
+        }
+
+    post = client.generate_presigned_post(
+        bucket, key,
+        Fields={'Content-Type': UPLOAD_CONTENT_TYPE, 'acl': UPLOAD_ACL},
+        Conditions=[
+            {'Content-Type': UPLOAD_CONTENT_TYPE},
+            {'acl': UPLOAD_ACL},
+            ['content-length-range', 1, MAX_UPLOAD_BYTES],
+        ],
+        ExpiresIn=UPLOAD_URL_EXPIRES,
+    )
+    return {
+        'method': 'POST',
+        'url': post['url'],
+        'fields': post['fields'],
+        'key': key,
+        'expires_in': UPLOAD_URL_EXPIRES,
+    }
+
+
+def confirm_upload(client, result):
+    """Verifica que la foto exista en el bucket y la asocia al resultado."""
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    key = photo_key(result)
+    try:
+        head = client.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            raise UploadError("La imagen no se encontró en el almacenamiento.")
+        raise
+
+    # Un PUT prefirmado no puede limitar el tamaño: se controla al confirmar
+    if head['ContentLength'] > MAX_UPLOAD_BYTES:
+        client.delete_object(Bucket=bucket, Key=key)
+        raise UploadError(f"La imagen excede los {MAX_UPLOAD_BYTES // (1024 * 1024)}MB permitidos.")
+
+    previous = blob_sha(result.photo_path)
+    result.photo_path = key
+    result.photo_variants = []
+    with transaction.atomic():
+        result.save(update_fields=['photo_path', 'photo_variants'])
+        if previous:
+            adjust_refcounts({previous: -1})
+    schedule_photo_processing([key])
+    return result
+
+
+def batch_items(files):
+    """
+    [(result_id, fileobj, size)] a partir de request.FILES.
+
+    Acepta varias partes `images` cuyo nombre de archivo es {result_id}.jpg, o
+    una parte `archive` con un .zip de archivos {result_id}.jpg.
+    """
+    items = [
+        (os.path.splitext(os.path.basename(f.name))[0], f, f.size)
+        for f in files.getlist('images')
+    ]
+    for archive in files.getlist('archive'):
+        try:
+            bundle = zipfile.ZipFile(archive)
+        except zipfile.BadZipFile:
+            raise UploadError("archive debe ser un archivo .zip")
+        for info in bundle.infolist():
+            if info.is_dir():
+                continue
+            # ZipFile.open es seguro entre hilos: cada miembro se lee en su worker
+            items.append((os.path.splitext(os.path.basename(info.filename))[0],
+                          _ZipMember(bundle, info), info.file_size))
+    if not items:
+        raise UploadError("No se proporcionó ninguna imagen")
+    if len(items) > MAX_BATCH_FILES:
+        raise UploadError(f"Máximo {MAX_BATCH_FILES} imágenes por lote")
+    return items
+
+
+class _ZipMember:
+    """Miembro de un zip que se abre recién al subirlo."""
+
+    def __init__(self, bundle, info):
+        self.bundle = bundle
+        self.info = info
+
+    def open(self):
+        return self.bundle.open(self.info)
+
+
+def _upload_one(client, fileobj, key, content_type):
+    extra = {'ACL': UPLOAD_ACL, 'ContentType': content_type}
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    if isinstance(fileobj, _ZipMember):
+        with fileobj.open() as member:
+            client.upload_fileobj(member, bucket, key, ExtraArgs=extra, Config=TRANSFER_CONFIG)
+    else:
+        client.upload_fileobj(fileobj, bucket, key, ExtraArgs=extra, Config=TRANSFER_CONFIG)
+
+
+def _header_error(fileobj):
+    """Mensaje de validate_image_format (solo cabecera) o None si la imagen pasa."""
+    try:
+        if isinstance(fileobj, _ZipMember):
+            # Del zip solo la firma: las dimensiones las revisa el worker antes de decodificar
+            with fileobj.open() as member:
+                header = member.read(8)
+            if not any(header.startswith(signature) for signature in IMAGE_SIGNATURES):
+                raise ValidationError("Solo se permiten imágenes JPEG o PNG.")
+        else:
+            validate_image_format(fileobj)
+    except ValidationError as e:
+        return e.messages[0]
+    return None
+
+
+def _hash_one(fileobj):
+    if isinstance(fileobj, _ZipMember):
+        with fileobj.open() as member:
+            return hash_stream(member)
+    fileobj.seek(0)
+    sha = hash_stream(fileobj)
+    fileobj.seek(0)
+    return sha
+
+
+def store_photos(client, jobs):
+    """
+    Guarda las fotos por contenido: [(result, fileobj, size, content_type)].
+
+    Hashea en el pool, sube solo los blobs que aún no existen (una vez por
+    contenido, aunque se repita en el lote) y apunta los resultados a su blob.
+    Devuelve (resultados actualizados, errores).
+    """
+    errors, hashed = [], []
+    if not jobs:
+        return [], errors
+
+    with ThreadPoolExecutor(max_workers=min(UPLOAD_WORKERS, len(jobs)),
+                            thread_name_prefix='photo-upload') as pool:
+        futures = [(job, pool.submit(_hash_one, job[1])) for job in jobs]
+        for job, future in futures:
+            try:
+                hashed.append((job, future.result()))
+            except Exception as e:
+                errors.append({'result_id': job[0].result_id, 'error': f"Error leyendo la imagen: {str(e)}"})
+
+        existing = claim_blobs({sha for _, sha in hashed})
+        missing = {}
+        for (result, fileobj, size, content_type), sha in hashed:
+            if sha not in existing and sha not in missing:
+                missing[sha] = (fileobj, size, content_type)
+
+        uploads = {
+            sha: pool.submit(_upload_one, client, fileobj, blob_key(sha), content_type)
+            for sha, (fileobj, size, content_type) in missing.items()
+        }
+        failed = {}
+        for sha, future in uploads.items():
+            try:
+                future.result()
+            except Exception as e:
+                failed[sha] = f"Error subiendo a S3: {str(e)}"
+
+    PhotoBlob.objects.bulk_create(
+        [PhotoBlob(sha256=sha, size=size, content_type=content_type)
+         for sha, (_, size, content_type) in missing.items() if sha not in failed],
+        ignore_conflicts=True,
+    )
+    pairs = []
+    for (result, *_), sha in hashed:
+        if sha in failed:
+            errors.append({'result_id': result.result_id, 'error': failed[sha]})
+        else:
+            pairs.append((result, sha))
+    changed = attach_photos(pairs)
+    schedule_photo_processing({r.photo_path for r in changed})
+    return [result for result, _ in pairs], errors
+
+
+def upload_batch(client, results, items):
+    """
+    Sube un lote de fotos y actualiza sus photo_path.
+
+    results: queryset de ScannerResult visibles para el usuario
+    items:   [(result_id, fileobj, size)] (ver batch_items)
+    Devuelve (subidos, errores), cada uno una lista de dicts por resultado.
+    """
+    by_id = {r.result_id: r for r in results.filter(result_id__in={rid for rid, _, _ in items})}
+
+    errors, jobs = [], []
+    for result_id, fileobj, size in items:
+        result = by_id.get(result_id)
+        if result is None:
+            errors.append({'result_id': result_id, 'error': 'Resultado no encontrado'})
+        elif size > MAX_UPLOAD_BYTES:
+            errors.append({'result_id': result_id,
+                           'error': f"La imagen excede los {MAX_UPLOAD_BYTES // (1024 * 1024)}MB permitidos."})
+        elif (error := _header_error(fileobj)) is not None:
+            errors.append({'result_id': result_id, 'error': error})
+        else:
+            content_type = getattr(fileobj, 'content_type', None) or UPLOAD_CONTENT_TYPE
+            jobs.append((result, fileobj, size, content_type))
+
+    done, store_errors = store_photos(client, jobs)
+    uploaded = [{'result_id': r.result_id, 'photo_path': r.photo_path} for r in done]
+    return uploaded, errors + store_errors
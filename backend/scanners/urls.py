@@ -2,7 +2,7 @@ from rest_framework.routers import DefaultRouter
 from django.urls import path, include
 from .views import (
     ModelVersionViewSet, ScannerSessionViewSet,
-    ScannerImageViewSet, ScannerResultViewSet
+    ScannerImageViewSet, ScannerResultViewSet, RescoreJobViewSet
 )
 
 router = DefaultRouter()
@@ -10,6 +10,7 @@ router.register('models', ModelVersionViewSet, basename='modelversion')
 router.register('sessions', ScannerSessionViewSet, basename='scannersession')
 router.register('images', ScannerImageViewSet, basename='scannerimage')
 router.register('results', ScannerResultViewSet, basename='scannerresult')
+router.register('rescore-jobs', RescoreJobViewSet, basename='rescorejob')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -5,44 +5,98 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
 from rest_framework.parsers import MultiPartParser, FormParser
 
+from django.core.exceptions import ValidationError
 from django.http import Http404
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
-import boto3
+import os
 import uuid
 
-from django.conf import settings
 from django.db import transaction
 
-from .models import ModelVersion, ScannerSession, ScannerImage, ScannerResult
+from core.pagination import KeysetPagination
+from cropcareBackend.object_storage import get_client, public_url
+
+from .models import ModelPatch, ModelVersion, RescoreJob, ScannerSession, ScannerImage, ScannerResult, IngestCheckpoint, validate_image_format
 from .serializers import (
-    ModelVersionSerializer, ScannerSessionSerializer,
+    ModelVersionSerializer, RescoreJobSerializer, ScannerSessionSerializer,
     ScannerImageSerializer, ScannerResultSerializer,
     ScannerSessionWithReportSerializer,
     ScannerSessionCreateSerializer,
-    ScanResultCreateSerializer
+    ScanResultCreateSerializer,
+    session_summary, session_summary_values,
 )
+from .sync import sync_sessions, sync_results, delta_for_sessions
+from .idempotency import idempotent
+from .signals import results_changed, result_snapshot
+from .uploads import UploadError, presign_upload, confirm_upload, batch_items, upload_batch, store_photos
+from .imaging import SIZES as PHOTO_SIZES, schedule_image_verification, variant_key
+from .artifacts import artifact_filename, serve_artifact
+from .ingest import IngestError, open_stream, ingest_sessions, get_checkpoint, DEFAULT_CHUNK_ROWS, MAX_CHUNK_ROWS
+from .blobs import blob_sha, release_photo
 
 
 # -------------------------------------------------------------------
-#   AWS S3 CLIENT (usa credenciales desde settings / env)
+#   MODEL VERSION VIEWSET
 # -------------------------------------------------------------------
-s3_client = boto3.client(
-    's3',
-    region_name=getattr(settings, "AWS_S3_REGION_NAME", None),
-    aws_access_key_id=getattr(settings, "AWS_ACCESS_KEY_ID", None),
-    aws_secret_access_key=getattr(settings, "AWS_SECRET_ACCESS_KEY", None),
-)
+class ModelVersionViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = ModelVersion.objects.prefetch_related('patches_to').order_by('-created_at')
+    serializer_class = ModelVersionSerializer
+    permission_classes = [IsAuthenticated]
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """
+        Descarga el .tflite. ETag = sha256 (If-None-Match -> 304) y Range -> 206.
+        GET /api/scanners/models/{id}/download/
+        """
+        model_version = self.get_object()
+        if not model_version.sha256 or not model_version.file_path:
+            return Response({"error": "El modelo no tiene artefacto registrado"}, status=status.HTTP_404_NOT_FOUND)
+        return serve_artifact(
+            request, model_version.file_path, model_version.sha256, model_version.size,
+            artifact_filename(model_version),
+        )
+
+    @action(detail=True, methods=['get'])
+    def patch(self, request, pk=None):
+        """
+        Parche bsdiff desde la versión instalada en el teléfono.
+        GET /api/scanners/models/{id}/patch/?from=<id instalado>
+        El sha256 del modelo resultante viene en X-Target-Sha256.
+        """
+        model_version = self.get_object()
+        from_id = request.query_params.get('from')
+        if not from_id or not from_id.isdigit():
+            return Response({"error": "Se requiere from=<id del modelo instalado>"}, status=status.HTTP_400_BAD_REQUEST)
+        model_patch = ModelPatch.objects.filter(from_version_id=int(from_id), to_version=model_version).first()
+        if model_patch is None:
+            return Response({
+                "error": "No hay parche desde esa versión; descarga el modelo completo",
+                "download_url": request.build_absolute_uri(f"/api/scanners/models/{model_version.pk}/download/"),
+            }, status=status.HTTP_404_NOT_FOUND)
+        response = serve_artifact(
+            request, model_patch.file_path, model_patch.sha256, model_patch.size,
+            os.path.basename(model_patch.file_path),
+        )
+        response['X-Target-Sha256'] = model_version.sha256
+        return response
 
 
 # -------------------------------------------------------------------
-#   MODEL VERSION VIEWSET
+#   RESCORE JOBS (avance de rescore_results)
 # -------------------------------------------------------------------
-class ModelVersionViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = ModelVersion.objects.all().order_by('-created_at')
-    serializer_class = ModelVersionSerializer
+class RescoreJobViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = RescoreJobSerializer
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        user = self.request.user
+        if hasattr(user, 'empresa'):
+            return RescoreJob.objects.filter(empresa=user.empresa)
+        return RescoreJob.objects.none()
+
 
 # -------------------------------------------------------------------
 #   SCANNER SESSION VIEWSET
@@ -50,11 +104,23 @@ class ModelVersionViewSet(viewsets.ReadOnlyModelViewSet):
 class ScannerSessionViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     queryset = ScannerSession.objects.all()
+    pagination_class = KeysetPagination
+
+    @property
+    def keyset_ordering(self):
+        if self.action == 'with_reports':
+            return ('-finished_at', '-session_id')
+        if self.action == 'results':
+            return ('-scanned_at', '-result_id')
+        return ('-started_at', '-session_id')
 
     def get_queryset(self):
         user = self.request.user
         if hasattr(user, 'empresa'):
-            return ScannerSession.objects.filter(empresa=user.empresa).order_by('-started_at')
+            sessions = ScannerSession.objects.filter(empresa=user.empresa).order_by('-started_at')
+            if self.action == 'results':
+                return sessions
+            return ScannerSessionSerializer.setup_eager_loading(sessions, self.request.query_params)
         return ScannerSession.objects.none()
 
     def get_serializer_class(self):
@@ -90,9 +156,42 @@ class ScannerSessionViewSet(viewsets.ModelViewSet):
         if date_to:
             sessions = sessions.filter(finished_at__lte=date_to)
 
-        serializer = ScannerSessionWithReportSerializer(sessions, many=True)
+        if request.query_params.get('mode') == 'summary':
+            # Solo columnas escalares de sesión y titular del reporte; los resultados
+            # se piden por sesión en sessions/{id}/results/
+            rows = session_summary_values(sessions)
+            page = self.paginate_queryset(rows)
+            if page is not None:
+                return self.get_paginated_response([session_summary(row) for row in page])
+            return Response([session_summary(row) for row in rows])
+
+        # Proyección (?fields=/?expand=) sin pasar el request: image_url sigue como antes
+        context = {'query_params': request.query_params}
+        if ScannerSessionWithReportSerializer.wants(request.query_params, 'scan_results'):
+            sessions = sessions.prefetch_related('scan_results')
+
+        page = self.paginate_queryset(sessions)
+        if page is not None:
+            serializer = ScannerSessionWithReportSerializer(page, many=True, context=context)
+            return self.get_paginated_response(serializer.data)
+        serializer = ScannerSessionWithReportSerializer(sessions, many=True, context=context)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def results(self, request, pk=None):
+        """
+        Resultados de una sesión (carga diferida para with_reports?mode=summary).
+        GET /api/scanners/sessions/{session_id}/results/[?page_size=N]
+        """
+        session = self.get_object()
+        results = session.scan_results.order_by('-scanned_at', '-result_id')
+        page = self.paginate_queryset(results)
+        if page is not None:
+            return self.get_paginated_response(
+                ScannerResultSerializer(page, many=True, context=self.get_serializer_context()).data
+            )
+        return Response(ScannerResultSerializer(results, many=True, context=self.get_serializer_context()).data)
+
     @action(detail=True, methods=['post'])
     def finish(self, request, pk=None):
         session = self.get_object()
@@ -105,64 +204,94 @@ class ScannerSessionViewSet(viewsets.ModelViewSet):
         return Response(ScannerSessionSerializer(session).data)
 
     @action(detail=False, methods=['post'])
+    @idempotent('sessions.sync')
     def sync(self, request):
         sessions_data = request.data.get('sessions', [])
         if not sessions_data:
             return Response({"error": "Se requiere una lista de sesiones"}, status=status.HTTP_400_BAD_REQUEST)
 
-        synced = []
-        errors = []
-
-        for session_data in sessions_data:
-            try:
-                with transaction.atomic():
-                    session_id = session_data['session_id']
-                    scan_results_data = session_data.get('scan_results', [])
-
-                    total_scans = len(scan_results_data)
-                    healthy_count = sum(1 for r in scan_results_data if not r.get('has_plague'))
-                    plague_count = sum(1 for r in scan_results_data if r.get('has_plague'))
-
-                    session, created = ScannerSession.objects.update_or_create(
-                        session_id=session_id,
-                        defaults={
-                            'empresa_id': session_data['empresa_id'],
-                            'zona_id': session_data['zona_id'],
-                            'cultivo_id': session_data['cultivo_id'],
-                            'owner': request.user,
-                            'worker_name': session_data['worker_name'],
-                            'model_version_string': session_data['model_version_string'],
-                            'started_at': session_data['started_at'],
-                            'finished_at': session_data.get('finished_at'),
-                            'status': session_data['status'],
-                            'total_scans': total_scans,
-                            'healthy_count': healthy_count,
-                            'plague_count': plague_count,
-                            'notes': session_data.get('notes', ''),
-                        }
-                    )
-
-                    for result_data in scan_results_data:
-                        ScannerResult.objects.update_or_create(
-                            result_id=result_data['result_id'],
-                            defaults={
-                                'session': session,
-                                'photo_path': result_data['photo_path'],
-                                'classification': result_data['classification'],
-                                'confidence': result_data['confidence'],
-                                'has_plague': result_data['has_plague'],
-                                'report_id': result_data.get('report_id'),
-                                'scanned_at': result_data['scanned_at'],
-                            }
-                        )
-
-                    synced.append({'session_id': session_id, 'created': created, 'scan_results_count': len(scan_results_data)})
-
-            except Exception as e:
-                errors.append({'session_id': session_data.get('session_id', 'unknown'), 'error': str(e)})
-
+        synced, errors = sync_sessions(sessions_data, request.user)
         return Response({'synced': synced, 'errors': errors, 'total_synced': len(synced), 'total_errors': len(errors)})
 
+    @action(detail=False, methods=['post'])
+    def delta(self, request):
+        """
+        Delta sync: el cliente envía sus session_ids y el cursor de la última respuesta;
+        el servidor devuelve los result_id que ya tiene para que solo se suban los faltantes.
+        POST /api/scanners/sessions/delta/ {"session_ids": [...], "cursor": "..."}
+        """
+        user = request.user
+        if not hasattr(user, 'empresa'):
+            return Response({"error": "Usuario sin empresa"}, status=status.HTTP_400_BAD_REQUEST)
+
+        session_ids = request.data.get('session_ids', [])
+        if not isinstance(session_ids, list) or not session_ids:
+            return Response({"error": "Se requiere una lista de session_ids"}, status=status.HTTP_400_BAD_REQUEST)
+        session_ids = [str(sid) for sid in session_ids]
+
+        cursor = request.data.get('cursor')
+        if cursor:
+            cursor = parse_datetime(str(cursor))
+            if cursor is None:
+                return Response({"error": "Cursor inválido"}, status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_naive(cursor):
+                cursor = timezone.make_aware(cursor)
+
+        return Response(delta_for_sessions(session_ids, user.empresa, cursor or None))
+
+    @action(detail=False, methods=['get', 'post'])
+    def ingest(self, request):
+        """
+        Ingesta NDJSON (una sesión por línea, opcionalmente gzip) confirmada por chunks.
+        POST /api/scanners/sessions/ingest/?upload_id=<id>&offset=<línea inicial>&chunk_size=<filas>
+        GET  /api/scanners/sessions/ingest/?upload_id=<id>  -> último offset confirmado
+        """
+        upload_id = request.query_params.get('upload_id')
+        if upload_id and len(upload_id) > 64:
+            return Response({"error": "upload_id excede 64 caracteres"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if request.method == 'GET':
+            if not upload_id:
+                return Response({"error": "Se requiere upload_id"}, status=status.HTTP_400_BAD_REQUEST)
+            checkpoint = IngestCheckpoint.objects.filter(owner=request.user, upload_id=upload_id).first()
+            return Response({
+                'upload_id': upload_id,
+                'committed_offset': checkpoint.committed_offset if checkpoint else 0,
+                'chunks_committed': checkpoint.chunks_committed if checkpoint else 0,
+            })
+
+        checkpoint = get_checkpoint(request.user, upload_id) if upload_id else None
+
+        try:
+            offset = int(request.query_params.get('offset', 0))
+            chunk_rows = int(request.query_params.get('chunk_size', DEFAULT_CHUNK_ROWS))
+        except ValueError:
+            return Response({"error": "offset y chunk_size deben ser enteros"}, status=status.HTTP_400_BAD_REQUEST)
+        if offset < 0 or chunk_rows < 1:
+            return Response({"error": "offset y chunk_size deben ser positivos"}, status=status.HTTP_400_BAD_REQUEST)
+        chunk_rows = min(chunk_rows, MAX_CHUNK_ROWS)
+
+        if checkpoint and offset > checkpoint.committed_offset:
+            # Faltarían líneas entre lo confirmado y lo enviado
+            return Response(
+                {"error": "offset mayor al último confirmado", 'committed_offset': checkpoint.committed_offset},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        try:
+            summary = ingest_sessions(
+                open_stream(request), request.user,
+                checkpoint=checkpoint, offset=offset, chunk_rows=chunk_rows,
+            )
+        except IngestError as e:
+            body = {"error": str(e)}
+            if checkpoint:
+                checkpoint.refresh_from_db()
+                body['committed_offset'] = checkpoint.committed_offset
+            return Response(body, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'upload_id': upload_id, **summary})
+
 
     @action(detail=True, methods=['post'])
     def cancel(self, request, pk=None):
@@ -182,13 +311,25 @@ class ScannerImageViewSet(viewsets.ModelViewSet):
     serializer_class = ScannerImageSerializer
     permission_classes = [IsAuthenticated]
     queryset = ScannerImage.objects.all()
+    pagination_class = KeysetPagination
+    keyset_ordering = ('id',)
 
     def get_queryset(self):
         user = self.request.user
         if hasattr(user, 'empresa'):
-            return ScannerImage.objects.filter(session__empresa=user.empresa)
+            return ScannerImage.objects.filter(session__empresa=user.empresa).prefetch_related('results')
         return ScannerImage.objects.none()
 
+    # La petición solo valida la cabecera: la verificación completa corre en segundo plano
+    def perform_create(self, serializer):
+        image = serializer.save()
+        schedule_image_verification([image.pk])
+
+    def perform_update(self, serializer):
+        image = serializer.save()
+        if 'image' in serializer.validated_data:
+            schedule_image_verification([image.pk])
+
 
 # -------------------------------------------------------------------
 #   SCANNER RESULT VIEWSET (S3 - PUBLIC)
@@ -196,6 +337,8 @@ class ScannerImageViewSet(viewsets.ModelViewSet):
 class ScannerResultViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     queryset = ScannerResult.objects.all()
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-scanned_at', '-result_id')
 
     def get_queryset(self):
         user = self.request.user
@@ -208,27 +351,88 @@ class ScannerResultViewSet(viewsets.ModelViewSet):
             return ScanResultCreateSerializer
         return ScannerResultSerializer
 
+    # Cada escritura notifica results_changed para mantener el SessionReport al día
+    @transaction.atomic
+    def perform_create(self, serializer):
+        result = serializer.save()
+        results_changed.send(sender=ScannerResult, previous={}, current=[result])
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        previous = result_snapshot([serializer.instance])
+        # La foto asociada a un blob se conserva (su refcount cuenta este resultado)
+        keep = {'photo_path': serializer.instance.photo_path} if blob_sha(serializer.instance.photo_path) else {}
+        result = serializer.save(**keep)
+        results_changed.send(sender=ScannerResult, previous=previous, current=[result])
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        previous = result_snapshot([instance])
+        instance.delete()
+        release_photo(instance)
+        results_changed.send(sender=ScannerResult, previous=previous, current=[])
+
     @action(detail=True, methods=['get'])
     def image(self, request, pk=None):
         """
         Devuelve la URL pública directa a la imagen en S3 (public-read).
-        GET /api/scanners/results/{result_id}/image/
+        GET /api/scanners/results/{result_id}/image/[?size=full|thumb|model]
+        Sin size (o si la variante aún no se generó) se devuelve la foto original.
         """
         result = self.get_object()
         if not result.photo_path:
             raise Http404("No hay imagen disponible")
 
+        size = request.query_params.get('size')
+        if size and size not in PHOTO_SIZES:
+            return Response({"error": f"size debe ser uno de: {', '.join(PHOTO_SIZES)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        key = result.photo_path
+        if size in (result.photo_variants or []):
+            key = variant_key(result.photo_path, size)
+
         # URL pública construida (usando CUSTOM_DOMAIN o bucket.s3.amazonaws.com)
-        domain = getattr(settings, "AWS_S3_CUSTOM_DOMAIN", f"{settings.AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com")
-        public_url = f"https://{domain}/{result.photo_path}"
-        return Response({"image_url": public_url})
+        return Response({"image_url": public_url(key), "size": size if key != result.photo_path else "original"})
+
+    @action(detail=True, methods=['post'], url_path='upload-url')
+    def upload_url(self, request, pk=None):
+        """
+        URL prefirmada para subir la foto directo al bucket (sin pasar por Django).
+        POST /api/scanners/results/{result_id}/upload-url/ {"method": "post" | "put"}
+        Luego llamar a confirm-upload/.
+        """
+        result = self.get_object()
+        method = str(request.data.get('method', 'post')).lower()
+        if method not in ('post', 'put'):
+            return Response({"error": "method debe ser 'post' o 'put'"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            data = presign_upload(get_client(), result, method)
+        except Exception as e:
+            return Response({"error": f"Error generando URL de subida: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response(data)
+
+    @action(detail=True, methods=['post'], url_path='confirm-upload')
+    def confirm_upload(self, request, pk=None):
+        """
+        Confirma la subida directa: verifica el objeto en el bucket y guarda photo_path.
+        POST /api/scanners/results/{result_id}/confirm-upload/
+        """
+        result = self.get_object()
+        try:
+            confirm_upload(get_client(), result)
+        except UploadError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({"error": f"Error verificando la subida: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response(ScannerResultSerializer(result, context={'request': request}).data)
 
     @action(detail=True, methods=['post'], parser_classes=[MultiPartParser, FormParser], url_path='upload-image')
     def upload_image(self, request, pk=None):
         """
-        Sube la imagen recibida al bucket S3 en path:
-        scanner_photos/{session.session_id}/{result.result_id}.jpg
+        Sube la imagen recibida al bucket S3, guardada por contenido en:
+        scanner_photos/blobs/{sha[:2]}/{sha256}.jpg (ver scanners/blobs.py)
         - ACL: public-read (tal como pediste para pruebas)
+        - Si la misma foto ya existe no se vuelve a subir (reintentos, fotos repetidas)
         - Guarda el key en ScannerResult.photo_path (CharField)
         """
         result = self.get_object()
@@ -237,63 +441,48 @@ class ScannerResultViewSet(viewsets.ModelViewSet):
             return Response({"error": "No se proporcionó ninguna imagen"}, status=status.HTTP_400_BAD_REQUEST)
 
         image_file = request.FILES['image']
-
-        # Extensión y content type (intenta inferir)
-        content_type = getattr(image_file, "content_type", "image/jpeg")
-        ext = "jpg"
-        # genera nombre único (puedes mantener result.result_id como nombre)
-        key = f"scanner_photos/{result.session.session_id}/{result.result_id}.{ext}"
-
         try:
-            s3_client.upload_fileobj(
-                image_file,
-                settings.AWS_STORAGE_BUCKET_NAME,
-                key,
-                ExtraArgs={'ACL': 'public-read', 'ContentType': content_type}
-            )
-        except Exception as e:
-            return Response({"error": f"Error subiendo a S3: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            validate_image_format(image_file)
+        except ValidationError as e:
+            return Response({"error": e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Guardamos el key en el campo photo_path (CharField) — kotlin lo consumirá tal cual
-        result.photo_path = key
-        result.save()
+        # Content type (intenta inferir)
+        content_type = getattr(image_file, "content_type", "image/jpeg")
+        _, errors = store_photos(get_client(), [(result, image_file, image_file.size, content_type)])
+        if errors:
+            return Response({"error": errors[0]['error']}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        # photo_path queda apuntando al blob — kotlin lo consumirá tal cual
         return Response(ScannerResultSerializer(result, context={'request': request}).data)
 
+    @action(detail=False, methods=['post'], parser_classes=[MultiPartParser, FormParser], url_path='upload-images')
+    def upload_images(self, request):
+        """
+        Sube muchas fotos en una sola petición.
+        POST /api/scanners/results/upload-images/ (multipart)
+        - images: una parte por foto, con nombre de archivo {result_id}.jpg
+        - archive: alternativamente, un .zip con archivos {result_id}.jpg
+        Responde el estado de cada resultado.
+        """
+        try:
+            items = batch_items(request.FILES)
+        except UploadError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        uploaded, errors = upload_batch(get_client(), self.get_queryset(), items)
+        return Response({
+            'uploaded': uploaded,
+            'errors': errors,
+            'total_uploaded': len(uploaded),
+            'total_errors': len(errors),
+        })
+
     @action(detail=False, methods=['post'])
+    @idempotent('results.sync')
     def sync(self, request):
         results_data = request.data.get('results', [])
         if not results_data:
             return Response({"error": "Se requiere una lista de resultados"}, status=status.HTTP_400_BAD_REQUEST)
 
-        synced = []
-        errors = []
-
-        for result_data in results_data:
-            try:
-                session_id = result_data.get('session')
-                try:
-                    session = ScannerSession.objects.get(session_id=session_id)
-                except ScannerSession.DoesNotExist:
-                    errors.append({'result_id': result_data.get('result_id'), 'error': f"Sesión {session_id} no encontrada"})
-                    continue
-
-                result, created = ScannerResult.objects.update_or_create(
-                    result_id=result_data['result_id'],
-                    defaults={
-                        'session': session,
-                        'photo_path': result_data['photo_path'],
-                        'classification': result_data['classification'],
-                        'confidence': result_data['confidence'],
-                        'has_plague': result_data['has_plague'],
-                        'report_id': result_data.get('report_id'),
-                        'scanned_at': result_data['scanned_at'],
-                    }
-                )
-
-                synced.append({'result_id': result_data['result_id'], 'created': created})
-
-            except Exception as e:
-                errors.append({'result_id': result_data.get('result_id'), 'error': str(e)})
-
+        synced, errors = sync_results(results_data, getattr(request.user, 'empresa', None))
         return Response({'synced': synced, 'errors': errors, 'total_synced': len(synced), 'total_errors': len(errors)})